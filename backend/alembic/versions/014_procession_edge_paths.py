@@ -0,0 +1,39 @@
+"""Procession itineraries matched to street edge paths
+
+Revision ID: 014
+Revises: 013
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "014"
+down_revision = "013"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "procession_edge_paths",
+        sa.Column("id", sa.String(), nullable=False),
+        sa.Column("procession_id", sa.String(), nullable=False),
+        sa.Column("edge_ids", sa.Text(), nullable=False, server_default="[]"),
+        sa.Column("matched_streets", sa.Text(), nullable=False, server_default="[]"),
+        sa.Column("unmatched", sa.Text(), nullable=False, server_default="[]"),
+        sa.Column("text_hash", sa.String(), nullable=False),
+        sa.Column("graph_fingerprint", sa.String(), nullable=False),
+        sa.Column("matched_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["procession_id"], ["processions.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_procession_edge_paths_id", "procession_edge_paths", ["id"])
+    op.create_index("ix_procession_edge_paths_procession_id", "procession_edge_paths", ["procession_id"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_procession_edge_paths_procession_id", table_name="procession_edge_paths")
+    op.drop_index("ix_procession_edge_paths_id", table_name="procession_edge_paths")
+    op.drop_table("procession_edge_paths")
@@ -6,6 +6,10 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 
 from app.core.deps import get_db, require_roles
+from app.core.location_updates import ws_metrics
+from app.core.procession_blockages import invalidate_procession_blockages
+from app.core.route_cache import route_cache
+from app.core.routing_pool import get_routing_pool
 from app.crud import crud
 from app.models.models import AuditLog, Hermandad, MediaAsset, Procession, ProcessionItineraryText, ProcessionSchedulePoint, User
 from app.schemas.schemas import (
@@ -13,8 +17,10 @@ from app.schemas.schemas import (
     AdminProcessionUpdate,
     AuditLogResponse,
     BrotherhoodResponse,
+    ModeCalleWsStatsResponse,
     PaginatedResponse,
     ProcessionResponse,
+    RouteCacheStatsResponse,
 )
 
 router = APIRouter(prefix="/admin", tags=["admin"])
@@ -172,6 +178,8 @@ def patch_procession(
     )
 
     db.commit()
+    # this worker rebuilds now; the others notice the new updated_at on their next probe
+    invalidate_procession_blockages()
     db.refresh(procession)
     return procession
 
@@ -187,3 +195,20 @@ def list_audit_logs(
     total = query.count()
     items = query.offset((page - 1) * page_size).limit(page_size).all()
     return PaginatedResponse(items=items, page=page, page_size=page_size, total=total)
+
+
+@router.get("/routing/cache", response_model=RouteCacheStatsResponse)
+def get_route_cache_stats(user: User = Depends(require_roles("admin"))):
+    return RouteCacheStatsResponse(**route_cache.stats())
+
+
+@router.get("/routing/ws", response_model=ModeCalleWsStatsResponse)
+def get_mode_calle_ws_stats(user: User = Depends(require_roles("admin"))):
+    pool = get_routing_pool()
+    pool_stats = pool.stats()
+    return ModeCalleWsStatsResponse(
+        **ws_metrics.stats(),
+        pool_in_flight=pool_stats["in_flight"],
+        pool_capacity=pool.capacity,
+        pool_rejected=pool_stats["rejected"],
+    )
@@ -6,6 +6,7 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 
 from app.core.deps import get_current_active_user, get_db
+from app.core.routing import calculate_eta_matrix
 from app.crud import crud
 from app.models.models import PlanItem, User
 from app.schemas.schemas import (
@@ -44,19 +45,6 @@ def _conflict_warnings(items: List[PlanItem]) -> List[PlanConflictWarning]:
     return warnings
 
 
-def _haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    r = 6371.0
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    a = (
-        math.sin(dlat / 2) ** 2
-        + math.cos(math.radians(lat1))
-        * math.cos(math.radians(lat2))
-        * math.sin(dlon / 2) ** 2
-    )
-    return 2 * r * math.asin(math.sqrt(a))
-
-
 @router.get("/me/plans", response_model=List[UserPlanResponse])
 def list_my_plans(
     from_date: Optional[datetime] = Query(None, alias="from"),
@@ -196,25 +184,37 @@ def optimize_plan(
     if not items:
         return OptimizePlanResponse(items=[], warnings=[])
 
+    # walking times over the street graph between every located item, in one matrix call
+    located = [item for item in items if item.lat is not None and item.lng is not None]
+    position = {item.id: index for index, item in enumerate(located)}
+    etas = (
+        calculate_eta_matrix(
+            db,
+            origins=[[item.lat, item.lng] for item in located],
+            destinations=None,
+            route_datetime=items[0].desired_time_start,
+        ).eta_seconds
+        if len(located) > 1
+        else []
+    )
+
+    def _eta(current: PlanItem, candidate: PlanItem) -> float:
+        if candidate.id not in position:
+            return 0.0
+        eta = etas[position[current.id]][position[candidate.id]]
+        return eta if eta is not None else math.inf
+
     ordered = [items[0]]
     remaining = items[1:]
 
     while remaining:
         current = ordered[-1]
-        if current.lat is None or current.lng is None:
+        if current.id not in position:
             next_item = remaining.pop(0)
             ordered.append(next_item)
             continue
 
-        next_item = min(
-            remaining,
-            key=lambda candidate: _haversine(
-                current.lat,
-                current.lng,
-                candidate.lat if candidate.lat is not None else current.lat,
-                candidate.lng if candidate.lng is not None else current.lng,
-            ),
-        )
+        next_item = min(remaining, key=lambda candidate: _eta(current, candidate))
         remaining.remove(next_item)
         ordered.append(next_item)
 
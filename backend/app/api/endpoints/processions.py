@@ -6,6 +6,7 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session, joinedload
 
 from app.core.deps import get_db, require_roles
+from app.core.procession_blockages import invalidate_procession_blockages
 from app.crud import crud
 from app.models.models import Procession as ProcessionModel, User
 from app.schemas.schemas import (
@@ -190,7 +191,9 @@ def put_procession_schedule(
 ):
     if not crud.get_procession(db, procession_id):
         raise HTTPException(status_code=404, detail="Procession not found")
-    return crud.replace_procession_schedule_points(db, procession_id=procession_id, points=payload)
+    points = crud.replace_procession_schedule_points(db, procession_id=procession_id, points=payload)
+    invalidate_procession_blockages()
+    return points
 
 
 @router.get("/processions/{procession_id}/itinerary", response_model=ProcessionItineraryTextResponse | None)
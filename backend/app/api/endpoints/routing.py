@@ -1,16 +1,29 @@
+import asyncio
 import json
+import time
 import uuid
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 from datetime import datetime
-from typing import Dict, Tuple
+from typing import Any, Callable, Optional, TypeVar
 
 from fastapi import APIRouter, Depends, HTTPException, Request, WebSocket, WebSocketDisconnect
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
 from app.core.deps import get_db
-from app.core.routing import as_route_response, calculate_optimal_route
+from app.core.isochrone import calculate_isochrone
+from app.core.location_updates import LatestLocation, ws_metrics
+from app.core.route_session import RouteSession, update_route_session
+from app.core.routing import RoutingResult, as_route_response, calculate_eta_matrix, calculate_optimal_route
+from app.core.routing_pool import RoutingPoolSaturated, get_routing_pool
+from app.core.shared_cache import get_shared_cache
 from app.models.models import AnalyticsEvent, NotificationEvent
 from app.schemas.schemas import (
+    EtaMatrixRequest,
+    EtaMatrixResponse,
+    IsochroneEdge,
+    IsochroneRequest,
+    IsochroneResponse,
     ModeCalleWsHeartbeat,
     ModeCalleWsHello,
     ModeCalleWsLocationUpdate,
@@ -23,17 +36,28 @@ from app.schemas.schemas import (
 
 router = APIRouter()
 
+T = TypeVar("T")
+
 
 @dataclass
 class WsPlanState:
     last_eta_seconds: int
 
 
-_ws_state: Dict[Tuple[str, str], WsPlanState] = {}
+def _ws_state_key(plan_id: str, client_host: str) -> str:
+    return f"ws:plan:{plan_id}:{client_host}"
 
 
-@router.post("/optimal", response_model=RouteResponse)
-async def get_optimal_route(request: RouteRequest, http_request: Request, db: Session = Depends(get_db)):
+def _load_ws_state(key: str) -> Optional[WsPlanState]:
+    raw = get_shared_cache().get(key)
+    return WsPlanState(**json.loads(raw)) if raw else None
+
+
+def _save_ws_state(key: str, state: WsPlanState) -> None:
+    get_shared_cache().set(key, json.dumps(asdict(state)), settings.WS_STATE_TTL_SECONDS)
+
+
+def _optimal_route(db: Session, request: RouteRequest, trace_id: Optional[str]) -> RoutingResult:
     result = calculate_optimal_route(
         db,
         origin=request.origin,
@@ -48,12 +72,68 @@ async def get_optimal_route(request: RouteRequest, http_request: Request, db: Se
         AnalyticsEvent(
             id=str(uuid.uuid4()),
             event_type="route_requested",
-            trace_id=http_request.headers.get("x-trace-id"),
+            trace_id=trace_id,
             payload=json.dumps({"has_destination": request.destination is not None, "has_target": request.target is not None}),
         )
     )
     db.commit()
-    return as_route_response(result)
+    return result
+
+
+async def _in_routing_pool(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a search in the bounded routing pool; 503 with Retry-After when it is saturated."""
+    try:
+        return await get_routing_pool().run_to_completion(func, *args, **kwargs)
+    except RoutingPoolSaturated:
+        raise HTTPException(status_code=503, detail="Routing is saturated, retry shortly", headers={"Retry-After": "1"})
+
+
+@router.post("/optimal", response_model=RouteResponse)
+async def get_optimal_route(request: RouteRequest, http_request: Request, db: Session = Depends(get_db)):
+    # the analytics commit is blocking too: it runs in the pool with the route
+    result = await _in_routing_pool(_optimal_route, db, request, http_request.headers.get("x-trace-id"))
+    return as_route_response(result, request.polyline_format)
+
+
+@router.post("/matrix", response_model=EtaMatrixResponse)
+async def get_eta_matrix(request: EtaMatrixRequest, db: Session = Depends(get_db)):
+    destinations = request.destinations or request.origins
+    if len(request.origins) * len(destinations) > settings.ROUTING_MATRIX_MAX_CELLS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Matrix too large: at most {settings.ROUTING_MATRIX_MAX_CELLS} origin/destination pairs",
+        )
+    result = await _in_routing_pool(
+        calculate_eta_matrix,
+        db,
+        origins=request.origins,
+        destinations=request.destinations,
+        route_datetime=request.datetime,
+    )
+    return EtaMatrixResponse(eta_seconds=result.eta_seconds, warnings=result.warnings)
+
+
+@router.post("/isochrone", response_model=IsochroneResponse)
+async def get_isochrone(request: IsochroneRequest, db: Session = Depends(get_db)):
+    if request.minutes > settings.ROUTING_ISOCHRONE_MAX_MINUTES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"minutes must be at most {settings.ROUTING_ISOCHRONE_MAX_MINUTES}",
+        )
+    result = await _in_routing_pool(
+        calculate_isochrone,
+        db,
+        origin=request.origin,
+        route_datetime=request.datetime,
+        minutes=request.minutes,
+        avoid_bulla=request.avoid_bulla,
+    )
+    return IsochroneResponse(
+        minutes=result.minutes,
+        polygon=result.polygon,
+        edges=[IsochroneEdge(**asdict(edge)) for edge in result.edges],
+        warnings=result.warnings,
+    )
 
 
 @router.get("/last", response_model=RoutingLastResponse)
@@ -75,6 +155,142 @@ def get_last_route(plan_id: str, db: Session = Depends(get_db)):
     )
 
 
+def _route_update_job(
+    db: Session, session: RouteSession, plan_id: str, state_key: str, request: ModeCalleWsLocationUpdate
+) -> list[dict]:
+    """Route one location update and persist what will be sent; returns the messages to send (maybe none).
+
+    Runs in the routing pool: the search, the shared plan state (Redis) and the commit all block.
+    """
+    result = update_route_session(
+        db,
+        session,
+        origin=[request.location.lat, request.location.lng],
+        route_datetime=request.datetime,
+        target_type=request.target.type,
+        target_id=request.target.id,
+        avoid_bulla=request.constraints.avoid_bulla,
+        max_walk_km=request.constraints.max_walk_km,
+    )
+    current = _load_ws_state(state_key)
+    eta_changed = current is None or abs(current.last_eta_seconds - result.eta_seconds) >= 60
+    has_warning = len(result.warnings) > 0
+    if not (eta_changed or has_warning):
+        return []
+
+    _save_ws_state(state_key, WsPlanState(last_eta_seconds=result.eta_seconds))
+    route_payload = ModeCalleWsRouteUpdate(route=as_route_response(result, request.polyline_format)).model_dump(mode="json")
+    messages = [route_payload]
+    db.add(
+        NotificationEvent(
+            id=str(uuid.uuid4()),
+            plan_id=plan_id,
+            kind="route_update",
+            payload=json.dumps(route_payload),
+        )
+    )
+    db.add(
+        AnalyticsEvent(
+            id=str(uuid.uuid4()),
+            event_type="reroute",
+            trace_id=None,
+            payload=json.dumps({"plan_id": plan_id, "eta_seconds": result.eta_seconds}),
+        )
+    )
+
+    # Fase 13 warning rules
+    warning_codes: list[tuple[str, str]] = []
+    if result.eta_seconds > 20 * 60:
+        warning_codes.append(("ETA_MISS", "No llegas a la ventana prevista"))
+    if result.bulla_score > 0.75:
+        warning_codes.append(("HIGH_BULLA", "Bulla alta en la ruta actual"))
+    if any("restricciones" in e.lower() for e in result.explanation):
+        warning_codes.append(("ROUTE_CUT", "Corte detectado en ruta, se aplicó desvío"))
+
+    for code, detail in warning_codes:
+        warning_payload = ModeCalleWsWarning(
+            code=code,
+            detail=detail,
+            created_at=datetime.utcnow(),
+        ).model_dump(mode="json")
+        messages.append(warning_payload)
+        db.add(
+            NotificationEvent(
+                id=str(uuid.uuid4()),
+                plan_id=plan_id,
+                kind="warning",
+                payload=json.dumps(warning_payload),
+            )
+        )
+        db.add(
+            AnalyticsEvent(
+                id=str(uuid.uuid4()),
+                event_type="warning_shown",
+                trace_id=None,
+                payload=json.dumps({"plan_id": plan_id, "code": code}),
+            )
+        )
+    db.commit()
+    return messages
+
+
+async def _send_route_update(
+    websocket: WebSocket,
+    db: Session,
+    session: RouteSession,
+    plan_id: str,
+    request: ModeCalleWsLocationUpdate,
+    send_lock: asyncio.Lock,
+) -> None:
+    state_key = _ws_state_key(plan_id, websocket.client.host if websocket.client else "anon")
+    try:
+        # the job uses the connection's Session: on disconnect, wait for it before get_db closes the Session
+        messages = await get_routing_pool().run_to_completion(
+            _route_update_job, db, session, plan_id, state_key, request
+        )
+    except RoutingPoolSaturated:
+        busy = ModeCalleWsWarning(
+            code="ROUTING_BUSY",
+            detail="Servidor de rutas saturado, reintentamos con tu próxima posición",
+            created_at=datetime.utcnow(),
+        )
+        messages = [busy.model_dump(mode="json")]
+    for message in messages:
+        async with send_lock:
+            await websocket.send_json(message)
+
+
+async def _process_location_updates(
+    websocket: WebSocket,
+    db: Session,
+    plan_id: str,
+    latest: LatestLocation[ModeCalleWsLocationUpdate],
+    send_lock: asyncio.Lock,
+) -> None:
+    """Route the latest pending update of one connection, one at a time and at most once per interval."""
+    # updates along the current route or off it are answered from the session without a new search
+    session = RouteSession()
+    last_started: Optional[float] = None
+    try:
+        while True:
+            await latest.wait()
+            if last_started is not None:
+                delay = settings.WS_MIN_RECOMPUTE_SECONDS - (time.monotonic() - last_started)
+                if delay > 0:
+                    ws_metrics.add(throttled=1)
+                    # updates arriving meanwhile replace the pending one
+                    await asyncio.sleep(delay)
+            request = latest.take()
+            last_started = time.monotonic()
+            with ws_metrics.computation():
+                await _send_route_update(websocket, db, session, plan_id, request, send_lock)
+    except WebSocketDisconnect:
+        pass
+    except Exception:
+        await websocket.close(code=1011)
+        raise
+
+
 @router.websocket("/ws/mode-calle")
 async def mode_calle_ws(websocket: WebSocket, db: Session = Depends(get_db)):
     plan_id = websocket.query_params.get("plan_id", "unknown")
@@ -88,6 +304,11 @@ async def mode_calle_ws(websocket: WebSocket, db: Session = Depends(get_db)):
         }
     )
 
+    # the receiver only stores location updates; one processor task per connection routes the latest
+    latest: LatestLocation[ModeCalleWsLocationUpdate] = LatestLocation()
+    send_lock = asyncio.Lock()
+    processor = asyncio.create_task(_process_location_updates(websocket, db, plan_id, latest, send_lock))
+    ws_metrics.add(connections=1)
     try:
         while True:
             payload = await websocket.receive_json()
@@ -99,83 +320,20 @@ async def mode_calle_ws(websocket: WebSocket, db: Session = Depends(get_db)):
 
             if msg_type == "heartbeat":
                 hb = ModeCalleWsHeartbeat.model_validate(payload)
-                await websocket.send_json({"type": "heartbeat", "sent_at": hb.sent_at.isoformat()})
+                async with send_lock:
+                    await websocket.send_json({"type": "heartbeat", "sent_at": hb.sent_at.isoformat()})
                 continue
 
             if msg_type != "location_update":
                 continue
 
-            request = ModeCalleWsLocationUpdate.model_validate(payload)
-            result = calculate_optimal_route(
-                db,
-                origin=[request.location.lat, request.location.lng],
-                destination=None,
-                route_datetime=request.datetime,
-                target_type=request.target.type,
-                target_id=request.target.id,
-                avoid_bulla=request.constraints.avoid_bulla,
-                max_walk_km=request.constraints.max_walk_km,
-            )
-
-            key = (plan_id, websocket.client.host if websocket.client else "anon")
-            current = _ws_state.get(key)
-            eta_changed = current is None or abs(current.last_eta_seconds - result.eta_seconds) >= 60
-            has_warning = len(result.warnings) > 0
-
-            if eta_changed or has_warning:
-                _ws_state[key] = WsPlanState(last_eta_seconds=result.eta_seconds)
-                route_payload = ModeCalleWsRouteUpdate(route=as_route_response(result)).model_dump(mode="json")
-                await websocket.send_json(route_payload)
-
-                db.add(
-                    NotificationEvent(
-                        id=str(uuid.uuid4()),
-                        plan_id=plan_id,
-                        kind="route_update",
-                        payload=json.dumps(route_payload),
-                    )
-                )
-                db.add(
-                    AnalyticsEvent(
-                        id=str(uuid.uuid4()),
-                        event_type="reroute",
-                        trace_id=None,
-                        payload=json.dumps({"plan_id": plan_id, "eta_seconds": result.eta_seconds}),
-                    )
-                )
-
-                # Fase 13 warning rules
-                warning_codes: list[tuple[str, str]] = []
-                if result.eta_seconds > 20 * 60:
-                    warning_codes.append(("ETA_MISS", "No llegas a la ventana prevista"))
-                if result.bulla_score > 0.75:
-                    warning_codes.append(("HIGH_BULLA", "Bulla alta en la ruta actual"))
-                if any("restricciones" in e.lower() for e in result.explanation):
-                    warning_codes.append(("ROUTE_CUT", "Corte detectado en ruta, se aplicó desvío"))
-
-                for code, detail in warning_codes:
-                    warning_payload = ModeCalleWsWarning(
-                        code=code,
-                        detail=detail,
-                        created_at=datetime.utcnow(),
-                    ).model_dump(mode="json")
-                    await websocket.send_json(warning_payload)
-                    db.add(
-                        NotificationEvent(
-                            id=str(uuid.uuid4()),
-                            plan_id=plan_id,
-                            kind="warning",
-                            payload=json.dumps(warning_payload),
-                        )
-                    )
-                    db.add(
-                        AnalyticsEvent(
-                            id=str(uuid.uuid4()),
-                            event_type="warning_shown",
-                            trace_id=None,
-                            payload=json.dumps({"plan_id": plan_id, "code": code}),
-                        )
-                    )
-                db.commit()
+            latest.put(ModeCalleWsLocationUpdate.model_validate(payload))
     except WebSocketDisconnect:
         pass
+    finally:
+        processor.cancel()
+        (outcome,) = await asyncio.gather(processor, return_exceptions=True)
+        latest.close()
+        ws_metrics.add(connections=-1)
+        if isinstance(outcome, Exception):
+            raise outcome
@@ -13,6 +13,11 @@ class Settings(BaseSettings):
     # Redis
     REDIS_HOST: str = "redis"
     REDIS_PORT: int = 6379
+    REDIS_DB: int = 0
+    REDIS_SOCKET_TIMEOUT_SECONDS: float = 0.2
+    # after a failed call Redis is skipped (in-process fallback) for this long before it is tried again
+    REDIS_RETRY_SECONDS: float = 5.0
+    CACHE_BACKEND: str = "memory"  # memory | redis
     
     # MinIO
     MINIO_ENDPOINT: str = "minio:9000"
@@ -23,6 +28,47 @@ class Settings(BaseSettings):
     MINIO_SECURE: bool = False
     MINIO_PRESIGNED_EXPIRE_SECONDS: int = 3600
     
+    # Routing
+    ROUTING_ENGINE: str = "astar"  # astar | bidirectional | alt | ch
+    ROUTING_ALT_LANDMARKS: int = 8
+    ROUTING_CH_PATH: str = "data/street_graph.cch"
+    # binary graph written by import_street_graph and mmap'ed at startup; "" = always compile from SQL
+    ROUTING_GRAPH_PATH: str = "data/street_graph.bin"
+    ROUTING_ALTERNATIVES: int = 2
+    ROUTING_ALTERNATIVE_MAX_STRETCH: float = 1.4
+    ROUTING_ALTERNATIVE_MAX_SHARE: float = 0.7
+    ROUTING_MATRIX_MAX_CELLS: int = 2500
+    ROUTING_ISOCHRONE_MAX_MINUTES: int = 60
+    ROUTING_POLYLINE_TOLERANCE_M: float = 3.0
+    ROUTING_POOL_WORKERS: int = 4
+    ROUTING_POOL_QUEUE_DEPTH: int = 32
+    # worker processes sharing the graph via shared memory; 0 = search in the API process
+    ROUTING_PROCESSES: int = 0
+    ROUTING_RESTRICTIONS_REFRESH_SECONDS: int = 30
+    # how often a worker re-probes the street tables for a re-import it has not loaded yet
+    ROUTING_GRAPH_REFRESH_SECONDS: int = 30
+    # evaluate restrictions and crowd at the estimated arrival at each edge instead of at departure
+    ROUTING_TIME_DEPENDENT: bool = False
+    ROUTING_TIME_DEPENDENT_HORIZON_MINUTES: int = 120
+    # time for a whole cortejo to pass a point, and how procession blockages are bucketed and penalised
+    PROCESSION_CORTEJO_MINUTES: int = 40
+    PROCESSION_BLOCKAGE_BUCKET_MINUTES: int = 5
+    PROCESSION_BLOCKAGE_SEVERITY: float = 1800.0
+    ROUTE_CACHE_MAX_ENTRIES: int = 5000
+    ROUTE_CACHE_TTL_SECONDS: int = 600
+    CROWD_CACHE_TTL_SECONDS: int = 60
+    # crowd penalties scale with CROWD_REFERENCE_WIDTH_M / street width, clamped to [MIN, MAX]
+    CROWD_REFERENCE_WIDTH_M: float = 6.0
+    CROWD_CAPACITY_MIN: float = 0.5
+    CROWD_CAPACITY_MAX: float = 3.0
+    WS_STATE_TTL_SECONDS: int = 6 * 3600
+    # Modo Calle sessions: distance to the route that still counts as following it, and how far
+    # (x the route's ETA) the backward tree kept for re-routing after a deviation reaches
+    WS_ON_ROUTE_METERS: float = 25.0
+    WS_REROUTE_TREE_SLACK: float = 1.5
+    # per connection, location updates arriving faster than this are coalesced into the latest one
+    WS_MIN_RECOMPUTE_SECONDS: float = 1.0
+
     # Security
     SECRET_KEY: str = "your-secret-key-change-in-production-min-32-chars"
     ALGORITHM: str = "HS256"
@@ -0,0 +1,592 @@
+"""Customizable contraction hierarchy (CCH) over the compiled street graph.
+
+Preprocessing is split in two phases:
+
+- *Contraction* (metric independent, offline): nodes are ordered by minimum
+  degree and eliminated one by one; the neighbours of every eliminated node
+  are connected pairwise. Shortcuts are added without witness searches, so the
+  resulting upward arcs only depend on the topology and stay valid for any
+  edge costs.
+- *Customization* (cheap, online): arc costs are derived from the street
+  graph weights through lower triangles ``(v, x, y)`` with ``v`` below ``x``
+  and ``y``. Restriction or crowd penalties only re-customize the arcs whose
+  cost actually changes, starting from the base metric. The base metric is
+  additionally pruned to shortest-path arcs (perfect customization) when the
+  hierarchy is built.
+
+A stored hierarchy is keyed on the graph topology (CSR offsets and targets),
+not on its fingerprint: after an import that only changed lengths or widths the
+contraction is reused and just the base metric is customized again.
+
+Queries run a bidirectional Dijkstra with stall-on-demand over upward arcs and
+unpack shortcuts back into CSR slots of :class:`CompiledStreetGraph`.
+Everything is serialized by ``python -m app.db.build_contraction_hierarchy``
+so API workers only read it at startup.
+"""
+from __future__ import annotations
+
+import hashlib
+import heapq
+import json
+import logging
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Mapping, Optional, Union
+
+from app.core.street_graph import CompiledStreetGraph
+
+logger = logging.getLogger(__name__)
+
+INF = float("inf")
+_MAGIC = b"CCH1"
+_NO_PENALTIES: Mapping[int, float] = {}
+
+# topology arrays, in the order they are written to disk
+_TOPOLOGY_ARRAYS = ("rank", "up_offsets", "arc_heads", "arc_tails", "down_offsets", "down_arcs")
+_METRIC_ARRAYS = ("cost_up", "cost_down", "mid_up", "mid_down", "slot_up", "slot_down")
+# pruned base search graph: (field, direction) pairs
+_SEARCH_ARRAYS = tuple((part, side) for part in ("offsets", "heads", "costs", "arcs") for side in (0, 1))
+
+
+@dataclass
+class CCHMetric:
+    """Arc costs for one set of edge weights.
+
+    ``*_up`` is the cost from the arc tail (lower rank) to its head, ``*_down``
+    the opposite direction. ``mid_*`` is the middle node of a shortcut (-1 for
+    arcs that map to a street edge, whose slot is then ``slot_*``).
+    """
+
+    cost_up: array
+    cost_down: array
+    mid_up: array
+    mid_down: array
+    slot_up: array
+    slot_down: array
+    # pruned upward graphs for queries, built on first use (see ContractionHierarchy.search_graph)
+    search: Optional["SearchGraph"] = field(default=None, repr=False, compare=False)
+
+    def copy(self) -> "CCHMetric":
+        return CCHMetric(*(array(a.typecode, a) for a in (getattr(self, name) for name in _METRIC_ARRAYS)))
+
+
+@dataclass
+class SearchGraph:
+    """Upward arcs that are shortest paths under one metric, per search direction.
+
+    Index 0 is the forward search (tail -> head costs), index 1 the backward
+    one (head -> tail costs). Arcs of node ``u`` are ``offsets[d][u]:offsets[d][u + 1]``.
+    """
+
+    offsets: tuple[array, array]
+    heads: tuple[array, array]
+    costs: tuple[array, array]
+    arcs: tuple[array, array]
+
+
+def topology_fingerprint(graph: CompiledStreetGraph) -> str:
+    """Hash of what the contraction depends on: nodes, CSR offsets and edge targets (not weights)."""
+    digest = hashlib.sha1(f"{graph.node_count}:{graph.edge_count}:{sys.byteorder};".encode())
+    digest.update(memoryview(graph.offsets).cast("B"))
+    digest.update(memoryview(graph.targets).cast("B"))
+    return digest.hexdigest()
+
+
+@dataclass
+class ContractionHierarchy:
+    # graph fingerprint the base metric was customized for
+    fingerprint: str
+    # topology_fingerprint of the graph the contraction was built from
+    topology: str
+    node_count: int
+    # rank[v]: contraction position of node v
+    rank: array
+    # upward arcs of v are up_offsets[v]:up_offsets[v + 1], sorted by head node
+    up_offsets: array
+    arc_heads: array
+    arc_tails: array
+    # arcs whose head is v: down_arcs[down_offsets[v]:down_offsets[v + 1]]
+    down_offsets: array
+    down_arcs: array
+    base: CCHMetric
+
+    @property
+    def arc_count(self) -> int:
+        return len(self.arc_heads)
+
+    def arc(self, a: int, b: int) -> int:
+        """Arc id joining nodes ``a`` and ``b`` (-1 if they are not adjacent in the hierarchy)."""
+        low, high = (a, b) if self.rank[a] < self.rank[b] else (b, a)
+        lo, hi = self.up_offsets[low], self.up_offsets[low + 1]
+        i = bisect_left(self.arc_heads, high, lo, hi)
+        return i if i < hi and self.arc_heads[i] == high else -1
+
+    # --- customization -----------------------------------------------------
+
+    def _initial_costs(self, graph: CompiledStreetGraph, metric: CCHMetric, arc: int, penalties: Mapping[int, float]) -> None:
+        """Costs of ``arc`` from the street edges it stands for (INF for pure shortcuts)."""
+        tail, head = self.arc_tails[arc], self.arc_heads[arc]
+        metric.cost_up[arc] = metric.cost_down[arc] = INF
+        metric.mid_up[arc] = metric.mid_down[arc] = -1
+        metric.slot_up[arc] = metric.slot_down[arc] = -1
+        for u, v, up in ((tail, head, True), (head, tail, False)):
+            for slot in range(graph.offsets[u], graph.offsets[u + 1]):
+                if graph.targets[slot] != v:
+                    continue
+                cost = graph.weights[slot] + penalties.get(slot, 0.0)
+                if up and cost < metric.cost_up[arc]:
+                    metric.cost_up[arc] = cost
+                    metric.slot_up[arc] = slot
+                elif not up and cost < metric.cost_down[arc]:
+                    metric.cost_down[arc] = cost
+                    metric.slot_down[arc] = slot
+
+    def _relax_triangles(self, metric: CCHMetric, arc: int) -> None:
+        """Lower the costs of ``arc`` (x -> y) through every lower triangle x <- v -> y."""
+        x, y = self.arc_tails[arc], self.arc_heads[arc]
+        cost_up, cost_down = metric.cost_up, metric.cost_down
+        for i in range(self.down_offsets[x], self.down_offsets[x + 1]):
+            vx = self.down_arcs[i]
+            v = self.arc_tails[vx]
+            vy = self.arc(v, y)
+            if vy < 0:
+                continue
+            # x -> v is the downward direction of (v, x); v -> y the upward direction of (v, y)
+            through = cost_down[vx] + cost_up[vy]
+            if through < cost_up[arc]:
+                cost_up[arc] = through
+                metric.mid_up[arc] = v
+                metric.slot_up[arc] = -1
+            through = cost_down[vy] + cost_up[vx]
+            if through < cost_down[arc]:
+                cost_down[arc] = through
+                metric.mid_down[arc] = v
+                metric.slot_down[arc] = -1
+
+    def customize(self, graph: CompiledStreetGraph, penalties: Mapping[int, float] = _NO_PENALTIES) -> CCHMetric:
+        """Full customization: O(triangles), used for the base metric."""
+        n = self.arc_count
+        metric = CCHMetric(
+            cost_up=array("d", [INF]) * n,
+            cost_down=array("d", [INF]) * n,
+            mid_up=array("l", [-1]) * n,
+            mid_down=array("l", [-1]) * n,
+            slot_up=array("l", [-1]) * n,
+            slot_down=array("l", [-1]) * n,
+        )
+        for arc in range(n):
+            self._initial_costs(graph, metric, arc, penalties)
+        # arcs grouped by tail in rank order: every lower triangle is final before it is used
+        for x in sorted(range(self.node_count), key=self.rank.__getitem__):
+            for arc in range(self.up_offsets[x], self.up_offsets[x + 1]):
+                self._relax_triangles(metric, arc)
+        return metric
+
+    def customized_for(self, graph: CompiledStreetGraph) -> "ContractionHierarchy":
+        """This contraction with a base metric for the weights of ``graph`` (same topology)."""
+        hierarchy = replace(self, fingerprint=graph.fingerprint)
+        hierarchy.base = hierarchy.customize(graph)
+        hierarchy.search_graph(hierarchy.base, perfect=True)
+        return hierarchy
+
+    def recustomize(self, graph: CompiledStreetGraph, penalties: Mapping[int, float]) -> CCHMetric:
+        """Base metric plus ``penalties``, only re-evaluating the arcs they can affect."""
+        if not penalties:
+            return self.base
+        metric = self.base.copy()
+        queue: list[tuple[int, int]] = []
+        queued: set[int] = set()
+
+        def push(arc: int) -> None:
+            if arc >= 0 and arc not in queued:
+                queued.add(arc)
+                heapq.heappush(queue, (self.rank[self.arc_tails[arc]], arc))
+
+        for slot in penalties:
+            if slot < graph.edge_count and graph.sources[slot] != graph.targets[slot]:
+                push(self.arc(graph.sources[slot], graph.targets[slot]))
+
+        while queue:
+            _, arc = heapq.heappop(queue)
+            queued.discard(arc)
+            before = (metric.cost_up[arc], metric.cost_down[arc])
+            self._initial_costs(graph, metric, arc, penalties)
+            self._relax_triangles(metric, arc)
+            if (metric.cost_up[arc], metric.cost_down[arc]) == before:
+                continue
+            # arc (v, u) is a side of the triangles v -> {u, w} for every other upper neighbour w of v
+            v, u = self.arc_tails[arc], self.arc_heads[arc]
+            for other in range(self.up_offsets[v], self.up_offsets[v + 1]):
+                w = self.arc_heads[other]
+                if w != u:
+                    push(self.arc(u, w))
+        return metric
+
+    # --- queries -----------------------------------------------------------
+
+    def _perfect_costs(self, metric: CCHMetric) -> tuple[array, array]:
+        """Exact shortest-path costs for every arc, via intermediate and upper triangles (top-down)."""
+        up = array("d", metric.cost_up)
+        down = array("d", metric.cost_down)
+        heads, tails = self.arc_heads, self.arc_tails
+        for x in sorted(range(self.node_count), key=self.rank.__getitem__, reverse=True):
+            arcs = range(self.up_offsets[x], self.up_offsets[x + 1])
+            for xy in arcs:
+                y = heads[xy]
+                for xz in arcs:
+                    if xz == xy:
+                        continue
+                    yz = self.arc(y, heads[xz])
+                    if tails[yz] == y:
+                        y_to_z, z_to_y = up[yz], down[yz]
+                    else:
+                        y_to_z, z_to_y = down[yz], up[yz]
+                    if up[xz] + z_to_y < up[xy]:
+                        up[xy] = up[xz] + z_to_y
+                    if y_to_z + down[xz] < down[xy]:
+                        down[xy] = y_to_z + down[xz]
+        return up, down
+
+    def search_graph(self, metric: CCHMetric, *, perfect: bool = False) -> SearchGraph:
+        """Query arcs for ``metric``: finite ones, and only shortest-path ones when ``perfect``.
+
+        Perfect customization roughly halves the arcs scanned per query but costs
+        O(triangles) again, so it is only worth it for the long-lived base metric.
+        """
+        if metric.search is not None:
+            return metric.search
+        exact = self._perfect_costs(metric) if perfect else (metric.cost_up, metric.cost_down)
+        built = []
+        for basic, bound in zip((metric.cost_up, metric.cost_down), exact):
+            offsets = array("l", [0]) * (self.node_count + 1)
+            heads, costs, arcs = array("l"), array("d"), array("l")
+            for u in range(self.node_count):
+                for arc in range(self.up_offsets[u], self.up_offsets[u + 1]):
+                    if basic[arc] != INF and basic[arc] <= bound[arc]:
+                        heads.append(self.arc_heads[arc])
+                        costs.append(basic[arc])
+                        arcs.append(arc)
+                offsets[u + 1] = len(heads)
+            built.append((offsets, heads, costs, arcs))
+        metric.search = SearchGraph(*(tuple(part) for part in zip(*built)))
+        return metric.search
+
+    def query(self, metric: CCHMetric, start: int, goal: int) -> tuple[float, list[int], int]:
+        """(cost, CSR slots, settled nodes) of the shortest ``start`` -> ``goal`` path."""
+        if start == goal:
+            return 0.0, [], 1
+        graph = self.search_graph(metric)
+        dist = ({start: 0.0}, {goal: 0.0})
+        parent: tuple[dict[int, int], dict[int, int]] = ({}, {})
+        queues = ([(0.0, start)], [(0.0, goal)])
+        best = INF
+        meeting = -1
+        settled = 0
+        side = 0
+        while queues[0] or queues[1]:
+            if not queues[side] or (queues[1 - side] and queues[1 - side][0][0] < queues[side][0][0]):
+                side = 1 - side
+            queue = queues[side]
+            if queue[0][0] >= best:
+                queue.clear()
+                continue
+            d, u = heapq.heappop(queue)
+            seen = dist[side]
+            if d > seen[u]:
+                continue
+            settled += 1
+            other = dist[1 - side].get(u)
+            if other is not None and d + other < best:
+                best = d + other
+                meeting = u
+            # stall-on-demand: a higher neighbour already reaches u more cheaply, so u is not on a shortest up-path
+            offsets, heads, costs = graph.offsets[1 - side], graph.heads[1 - side], graph.costs[1 - side]
+            if any(seen.get(heads[i], INF) + costs[i] < d for i in range(offsets[u], offsets[u + 1])):
+                continue
+            offsets, heads, costs, arcs = graph.offsets[side], graph.heads[side], graph.costs[side], graph.arcs[side]
+            for i in range(offsets[u], offsets[u + 1]):
+                nd = d + costs[i]
+                v = heads[i]
+                if nd < seen.get(v, INF):
+                    seen[v] = nd
+                    parent[side][v] = arcs[i]
+                    heapq.heappush(queue, (nd, v))
+
+        if meeting < 0:
+            return INF, [], settled
+        slots: list[int] = []
+        forward_arcs = []
+        node = meeting
+        while node in parent[0]:
+            arc = parent[0][node]
+            forward_arcs.append(arc)
+            node = self.arc_tails[arc]
+        for arc in reversed(forward_arcs):
+            self._unpack(metric, arc, True, slots)
+        node = meeting
+        while node in parent[1]:
+            arc = parent[1][node]
+            self._unpack(metric, arc, False, slots)
+            node = self.arc_tails[arc]
+        return best, slots, settled
+
+    def upward_search(self, metric: CCHMetric, source: int, *, backward: bool = False) -> dict[int, float]:
+        """Complete upward search space of ``source`` with tentative distances (stall-on-demand applies)."""
+        graph = self.search_graph(metric)
+        side = 1 if backward else 0
+        offsets, heads, costs = graph.offsets[side], graph.heads[side], graph.costs[side]
+        stall_offsets, stall_heads, stall_costs = graph.offsets[1 - side], graph.heads[1 - side], graph.costs[1 - side]
+        dist = {source: 0.0}
+        queue = [(0.0, source)]
+        space: dict[int, float] = {}
+        while queue:
+            d, u = heapq.heappop(queue)
+            if d > dist[u]:
+                continue
+            space[u] = d
+            if any(dist.get(stall_heads[i], INF) + stall_costs[i] < d for i in range(stall_offsets[u], stall_offsets[u + 1])):
+                continue
+            for i in range(offsets[u], offsets[u + 1]):
+                nd = d + costs[i]
+                v = heads[i]
+                if nd < dist.get(v, INF):
+                    dist[v] = nd
+                    heapq.heappush(queue, (nd, v))
+        return space
+
+    def many_to_many(self, metric: CCHMetric, sources: list[int], targets: list[int]) -> list[array]:
+        """Bucket many-to-many: one backward upward search per target, one forward per source."""
+        buckets: dict[int, list[tuple[int, float]]] = {}
+        for j, target in enumerate(targets):
+            for node, d in self.upward_search(metric, target, backward=True).items():
+                buckets.setdefault(node, []).append((j, d))
+        rows = []
+        for source in sources:
+            row = array("d", [INF]) * len(targets)
+            for node, d in self.upward_search(metric, source).items():
+                for j, d_back in buckets.get(node, ()):
+                    if d + d_back < row[j]:
+                        row[j] = d + d_back
+            rows.append(row)
+        return rows
+
+    def _unpack(self, metric: CCHMetric, arc: int, up: bool, out: list[int]) -> None:
+        stack = [(arc, up)]
+        while stack:
+            arc, up = stack.pop()
+            tail, head = self.arc_tails[arc], self.arc_heads[arc]
+            x, y = (tail, head) if up else (head, tail)
+            mid = metric.mid_up[arc] if up else metric.mid_down[arc]
+            if mid < 0:
+                out.append(metric.slot_up[arc] if up else metric.slot_down[arc])
+                continue
+            # x -> mid descends arc (mid, x); mid -> y ascends arc (mid, y). Stack is LIFO.
+            stack.append((self.arc(mid, y), True))
+            stack.append((self.arc(mid, x), False))
+
+    # --- serialization -----------------------------------------------------
+
+    def save(self, path: Union[str, Path]) -> None:
+        arrays = [(name, getattr(self, name)) for name in _TOPOLOGY_ARRAYS]
+        arrays += [(name, getattr(self.base, name)) for name in _METRIC_ARRAYS]
+        search = self.search_graph(self.base, perfect=True)
+        arrays += [(f"search_{part}_{side}", getattr(search, part)[side]) for part, side in _SEARCH_ARRAYS]
+        header = {
+            "fingerprint": self.fingerprint,
+            "topology": self.topology,
+            "node_count": self.node_count,
+            "byteorder": sys.byteorder,
+            "arrays": [[name, values.typecode, values.itemsize, len(values)] for name, values in arrays],
+        }
+        raw_header = json.dumps(header).encode("utf-8")
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with tmp.open("wb") as fh:
+            fh.write(_MAGIC)
+            fh.write(len(raw_header).to_bytes(4, "little"))
+            fh.write(raw_header)
+            for _, values in arrays:
+                fh.write(values.tobytes())
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "ContractionHierarchy":
+        with Path(path).open("rb") as fh:
+            if fh.read(4) != _MAGIC:
+                raise ValueError(f"{path} is not a contraction hierarchy file")
+            header = json.loads(fh.read(int.from_bytes(fh.read(4), "little")))
+            loaded: dict[str, array] = {}
+            for name, typecode, itemsize, length in header["arrays"]:
+                values = array(typecode)
+                if values.itemsize != itemsize:
+                    raise ValueError(f"{path} was written on an incompatible platform")
+                values.frombytes(fh.read(itemsize * length))
+                if header["byteorder"] != sys.byteorder:
+                    values.byteswap()
+                loaded[name] = values
+        base = CCHMetric(**{name: loaded[name] for name in _METRIC_ARRAYS})
+        base.search = SearchGraph(
+            **{
+                part: (loaded[f"search_{part}_0"], loaded[f"search_{part}_1"])
+                for part in ("offsets", "heads", "costs", "arcs")
+            }
+        )
+        return cls(
+            fingerprint=header["fingerprint"],
+            topology=header["topology"],
+            node_count=header["node_count"],
+            base=base,
+            **{name: loaded[name] for name in _TOPOLOGY_ARRAYS},
+        )
+
+
+def _undirected_adjacency(graph: CompiledStreetGraph) -> list[set[int]]:
+    neighbours: list[set[int]] = [set() for _ in range(graph.node_count)]
+    for slot in range(graph.edge_count):
+        u, v = graph.sources[slot], graph.targets[slot]
+        if u != v:
+            neighbours[u].add(v)
+            neighbours[v].add(u)
+    return neighbours
+
+
+def min_degree_order(graph: CompiledStreetGraph) -> list[int]:
+    """Elimination order that always contracts a node of minimum current degree."""
+    neighbours = _undirected_adjacency(graph)
+    queue = [(len(nbrs), v) for v, nbrs in enumerate(neighbours)]
+    heapq.heapify(queue)
+    contracted = [False] * graph.node_count
+    order: list[int] = []
+    while queue:
+        degree, v = heapq.heappop(queue)
+        if contracted[v] or degree != len(neighbours[v]):
+            continue
+        contracted[v] = True
+        order.append(v)
+        nbrs = neighbours[v]
+        for u in nbrs:
+            neighbours[u].discard(v)
+            neighbours[u].update(w for w in nbrs if w != u)
+            heapq.heappush(queue, (len(neighbours[u]), u))
+        neighbours[v] = set()
+    return order
+
+
+def _eliminate(graph: CompiledStreetGraph, order: list[int]) -> list[set[int]]:
+    """Upper neighbours of every node once the graph is made chordal along ``order``."""
+    rank = [0] * graph.node_count
+    for position, v in enumerate(order):
+        rank[v] = position
+    neighbours = _undirected_adjacency(graph)
+    upper: list[set[int]] = [set() for _ in range(graph.node_count)]
+    for v in order:
+        up = {u for u in neighbours[v] if rank[u] > rank[v]}
+        upper[v] = up
+        for u in up:
+            neighbours[u].update(w for w in up if w != u)
+    return upper
+
+
+def build_contraction_hierarchy(graph: CompiledStreetGraph) -> ContractionHierarchy:
+    order = min_degree_order(graph)
+    upper = _eliminate(graph, order)
+    n = graph.node_count
+    rank = array("l", [0]) * n
+    for position, v in enumerate(order):
+        rank[v] = position
+
+    up_offsets = array("l", [0]) * (n + 1)
+    arc_heads = array("l")
+    arc_tails = array("l")
+    for v in range(n):
+        heads = sorted(upper[v])
+        arc_heads.extend(heads)
+        arc_tails.extend([v] * len(heads))
+        up_offsets[v + 1] = len(arc_heads)
+
+    down_offsets = array("l", [0]) * (n + 1)
+    for head in arc_heads:
+        down_offsets[head + 1] += 1
+    for v in range(n):
+        down_offsets[v + 1] += down_offsets[v]
+    cursor = array("l", down_offsets[:-1])
+    down_arcs = array("l", [0]) * len(arc_heads)
+    for arc, head in enumerate(arc_heads):
+        down_arcs[cursor[head]] = arc
+        cursor[head] += 1
+
+    empty = CCHMetric(*(array(code) for code in "ddllll"))
+    contraction = ContractionHierarchy(
+        fingerprint="",
+        topology=topology_fingerprint(graph),
+        node_count=n,
+        rank=rank,
+        up_offsets=up_offsets,
+        arc_heads=arc_heads,
+        arc_tails=arc_tails,
+        down_offsets=down_offsets,
+        down_arcs=down_arcs,
+        base=empty,
+    )
+    return contraction.customized_for(graph)
+
+
+def load_or_build_hierarchy(
+    graph: CompiledStreetGraph,
+    path: Optional[Union[str, Path]],
+    current: Optional[ContractionHierarchy] = None,
+) -> ContractionHierarchy:
+    """Hierarchy for ``graph``: ``current`` or the one serialized at ``path`` when the topology
+    matches (re-customized if only the weights changed), otherwise one contracted in-process."""
+    topology = topology_fingerprint(graph)
+    candidates = [current] if current is not None else []
+    if path and Path(path).exists():
+        try:
+            candidates.append(ContractionHierarchy.load(path))
+        except (OSError, ValueError, KeyError):
+            logger.warning("Contraction hierarchy at %s could not be read", path, exc_info=True)
+    for hierarchy in candidates:
+        if hierarchy.fingerprint == graph.fingerprint and hierarchy.topology == topology:
+            return hierarchy
+    for hierarchy in candidates:
+        if hierarchy.topology == topology:
+            logger.info("Street graph weights changed; re-customizing the contraction hierarchy")
+            return hierarchy.customized_for(graph)
+    if path:
+        logger.warning("Contraction hierarchy at %s is stale for the loaded graph; rebuilding in memory", path)
+    return build_contraction_hierarchy(graph)
+
+
+class MetricCache:
+    """Small LRU of customized metrics keyed by the exact penalty set."""
+
+    def __init__(self, max_entries: int = 8):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[frozenset, CCHMetric] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, hierarchy: ContractionHierarchy, graph: CompiledStreetGraph, penalties: Mapping[int, float]) -> CCHMetric:
+        if not penalties:
+            return hierarchy.base
+        key = frozenset(penalties.items())
+        with self._lock:
+            metric = self._entries.get(key)
+            if metric is not None:
+                self._entries.move_to_end(key)
+                return metric
+        metric = hierarchy.recustomize(graph, penalties)
+        with self._lock:
+            self._entries[key] = metric
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return metric
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,143 @@
+"""Per-edge crowd penalties derived from ``crowd_signals``.
+
+Crowd reports are aggregated per ``lat:lng`` cell rounded to 3 decimals
+(~100 m). Every street edge is split along its geometry at the cell
+boundaries it crosses, so it knows which share of its length lies in each
+cell (computed once per graph, see :func:`edge_cells`). Inside cells with
+score ``s`` and confidence ``c`` walking the edge costs
+``weight * capacity * sum(share * s * c)`` extra seconds. ``capacity`` is the
+edge's precomputed width coefficient (``CompiledStreetGraph.crowd_capacity``):
+a packed 6 m street takes up to twice as long, a 2 m callejón up to four times.
+
+Signals are fetched in bulk once per routing time bucket and shared across
+workers, and the resulting slot -> seconds overlay is cached per graph and
+bucket, so the router adds it to the restriction penalties at no per-request
+query cost.
+"""
+from __future__ import annotations
+
+import json
+import math
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.route_cache import TIME_BUCKET_MINUTES, RouteCache, time_bucket
+from app.core.shared_cache import get_shared_cache
+from app.core.street_graph import CompiledStreetGraph
+from app.models.models import CrowdSignal
+
+# crowd_cell rounds to 3 decimals: boundaries sit at odd multiples of half a cell
+_CELL_DEGREES = 1e-3
+
+# cell -> [(slot, share of the edge length inside the cell), ...]
+EdgeCells = dict[str, list[tuple[int, float]]]
+
+_edge_cells: dict[str, EdgeCells] = {}
+_edge_cells_lock = threading.Lock()
+_penalty_cache = RouteCache(max_entries=256, ttl_seconds=settings.CROWD_CACHE_TTL_SECONDS)
+
+
+def crowd_cell(lat: float, lng: float) -> str:
+    return f"{round(lat, 3)}:{round(lng, 3)}"
+
+
+def _boundary_crossings(a: float, b: float) -> list[float]:
+    """Fractions of the way from ``a`` to ``b`` at which a cell boundary is crossed."""
+    if a == b:
+        return []
+    lo, hi = min(a, b), max(a, b)
+    k = math.floor(lo / _CELL_DEGREES - 0.5) + 1
+    crossings = []
+    while (k + 0.5) * _CELL_DEGREES < hi:
+        crossings.append(((k + 0.5) * _CELL_DEGREES - a) / (b - a))
+        k += 1
+    return crossings
+
+
+def polyline_cell_shares(points: list[list[float]]) -> dict[str, float]:
+    """Cell -> share of the polyline length inside it (shares add up to 1)."""
+    pieces: dict[str, float] = {}
+    total = 0.0
+    for (lat0, lng0), (lat1, lng1) in zip(points, points[1:]):
+        # equirectangular metres are enough for shares within one edge
+        dy, dx = lat1 - lat0, (lng1 - lng0) * math.cos(math.radians(lat0))
+        length = math.hypot(dx, dy)
+        if length == 0:
+            continue
+        cuts = sorted({0.0, 1.0, *_boundary_crossings(lat0, lat1), *_boundary_crossings(lng0, lng1)})
+        for t0, t1 in zip(cuts, cuts[1:]):
+            mid = (t0 + t1) / 2
+            cell = crowd_cell(lat0 + (lat1 - lat0) * mid, lng0 + (lng1 - lng0) * mid)
+            pieces[cell] = pieces.get(cell, 0.0) + length * (t1 - t0)
+        total += length
+    if total == 0:
+        return {crowd_cell(points[0][0], points[0][1]): 1.0} if points else {}
+    return {cell: piece / total for cell, piece in pieces.items()}
+
+
+def edge_cells(graph: CompiledStreetGraph) -> EdgeCells:
+    """Cell -> CSR slots of the edges crossing it and their share inside it (computed once per graph)."""
+    cells = _edge_cells.get(graph.fingerprint)
+    if cells is not None:
+        return cells
+    with _edge_cells_lock:
+        cells = _edge_cells.get(graph.fingerprint)
+        if cells is not None:
+            return cells
+        cells = {}
+        for slot in range(graph.edge_count):
+            for cell, share in polyline_cell_shares(graph.edge_polyline(slot)).items():
+                cells.setdefault(cell, []).append((slot, share))
+        _edge_cells.clear()
+        _edge_cells[graph.fingerprint] = cells
+        return cells
+
+
+def bucket_crowd_signals(db: Session, bucket: datetime) -> dict[str, tuple[float, float]]:
+    """Cell -> (score, confidence) of the latest signal overlapping the time bucket, one query per bucket."""
+    shared = get_shared_cache()
+    key = f"crowd:{bucket.isoformat()}"
+    cached = shared.get(key)
+    if cached is not None:
+        return {cell: (score, confidence) for cell, (score, confidence) in json.loads(cached).items()}
+    rows = (
+        db.query(CrowdSignal.geohash, CrowdSignal.score, CrowdSignal.confidence)
+        .filter(
+            CrowdSignal.bucket_start < bucket + timedelta(minutes=TIME_BUCKET_MINUTES),
+            CrowdSignal.bucket_end >= bucket,
+        )
+        .order_by(CrowdSignal.bucket_start.asc())
+        .all()
+    )
+    signals = {geohash: (score, confidence) for geohash, score, confidence in rows}
+    shared.set(key, json.dumps(signals), settings.CROWD_CACHE_TTL_SECONDS)
+    return signals
+
+
+def edge_crowd_penalties(db: Session, graph: CompiledStreetGraph, at: datetime) -> dict[int, float]:
+    """Slot -> extra seconds for every edge under an active crowd signal (cached per time bucket)."""
+    bucket = time_bucket(at)
+    key = (graph.fingerprint, bucket)
+    penalties = _penalty_cache.get(key)
+    if penalties is not None:
+        return penalties
+    cells = edge_cells(graph)
+    factors: dict[int, float] = {}
+    for cell, (score, confidence) in bucket_crowd_signals(db, bucket).items():
+        factor = score * confidence
+        if factor <= 0:
+            continue
+        for slot, share in cells.get(cell, ()):
+            factors[slot] = factors.get(slot, 0.0) + share * factor
+    penalties = {
+        slot: graph.weights[slot] * graph.crowd_capacity[slot] * factor for slot, factor in factors.items()
+    }
+    _penalty_cache.set(key, penalties)
+    return penalties
+
+
+def clear_crowd_overlay() -> None:
+    _penalty_cache.clear()
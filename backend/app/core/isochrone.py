@@ -0,0 +1,143 @@
+"""Walking isochrones: streets reachable from a point within a time budget.
+
+A single Dijkstra bounded by the budget runs over the compiled street graph
+with the restriction overlay, the procession blockages and, when ``avoid_bulla`` is set, per-edge crowd
+penalties. Edges whose start is reached but whose end is not are returned
+with the reachable fraction. The polygon is the convex hull of everything
+reached, partial edges included.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import List
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.crowd_overlay import edge_crowd_penalties
+from app.core.procession_blockages import get_procession_blockages
+from app.core.restrictions import get_restriction_timeline
+from app.core.route_cache import time_bucket
+from app.core.routing_engines import labelled_tree
+from app.core.shared_cache import get_shared_cache
+from app.core.street_graph import get_street_graph
+
+
+@dataclass
+class ReachableEdge:
+    edge_id: str
+    # seconds to reach the start of the edge
+    seconds: int
+    # share of the edge walkable within the budget (1.0 = whole edge)
+    reachable_fraction: float
+
+
+@dataclass
+class IsochroneResult:
+    minutes: int
+    polygon: List[List[float]]
+    edges: List[ReachableEdge]
+    warnings: List[str]
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_json(cls, raw: str) -> "IsochroneResult":
+        payload = json.loads(raw)
+        payload["edges"] = [ReachableEdge(**edge) for edge in payload["edges"]]
+        return cls(**payload)
+
+
+def convex_hull(points: List[List[float]]) -> List[List[float]]:
+    """Closed convex hull ring of ``[lat, lng]`` points (Andrew's monotone chain)."""
+    unique = sorted({(p[0], p[1]) for p in points})
+    if len(unique) < 3:
+        return [list(p) for p in unique]
+
+    def cross(o, a, b) -> float:
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    lower: list[tuple[float, float]] = []
+    for p in unique:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], p) <= 0:
+            lower.pop()
+        lower.append(p)
+    upper: list[tuple[float, float]] = []
+    for p in reversed(unique):
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], p) <= 0:
+            upper.pop()
+        upper.append(p)
+    ring = lower[:-1] + upper[:-1]
+    return [list(p) for p in ring + ring[:1]]
+
+
+def calculate_isochrone(
+    db: Session,
+    *,
+    origin: List[float],
+    route_datetime: datetime,
+    minutes: int,
+    avoid_bulla: bool = True,
+) -> IsochroneResult:
+    graph = get_street_graph(db)
+    if not graph.node_count:
+        return IsochroneResult(
+            minutes=minutes,
+            polygon=[],
+            edges=[],
+            warnings=["No street graph loaded. Isochrone unavailable."],
+        )
+
+    start = graph.snap(origin[0], origin[1])
+    timeline = get_restriction_timeline(db, graph)
+    blockages = get_procession_blockages(db, graph, route_datetime)
+    raw_key = (
+        f"{graph.fingerprint}|{graph.node_ids[start]}|{time_bucket(route_datetime).isoformat()}"
+        f"|{timeline.shared_epoch_key(route_datetime)}|{blockages.shared_epoch_key(route_datetime)}"
+        f"|{minutes}|{avoid_bulla}"
+    )
+    key = "isochrone:" + hashlib.sha1(raw_key.encode()).hexdigest()
+    shared = get_shared_cache()
+    cached = shared.get(key)
+    if cached is not None:
+        return IsochroneResult.from_json(cached)
+
+    penalties = dict(timeline.active_at(route_datetime))
+    for slot, seconds in blockages.active_at(route_datetime).items():
+        penalties[slot] = penalties.get(slot, 0.0) + seconds
+    if avoid_bulla:
+        for slot, seconds in edge_crowd_penalties(db, graph, route_datetime).items():
+            penalties[slot] = penalties.get(slot, 0.0) + seconds
+
+    budget = minutes * 60.0
+    # only the nodes within the budget are labelled: the work does not grow with the whole graph
+    dist, _ = labelled_tree(graph, start, penalties=penalties, limit=budget)
+    edges: List[ReachableEdge] = []
+    points: List[List[float]] = [graph.coords(start)]
+    for u in sorted(dist):
+        points.append(graph.coords(u))
+        for slot in graph.out_slots(u):
+            cost = graph.weights[slot] + penalties.get(slot, 0.0)
+            fraction = 1.0 if dist[u] + cost <= budget else (budget - dist[u]) / cost
+            if fraction <= 0:
+                continue
+            edges.append(
+                ReachableEdge(edge_id=graph.edge_ids[slot], seconds=int(dist[u]), reachable_fraction=round(fraction, 3))
+            )
+            if fraction < 1.0:
+                v = graph.targets[slot]
+                points.append(
+                    [
+                        graph.lats[u] + (graph.lats[v] - graph.lats[u]) * fraction,
+                        graph.lngs[u] + (graph.lngs[v] - graph.lngs[u]) * fraction,
+                    ]
+                )
+
+    warnings = [] if edges else ["Ninguna calle alcanzable en el tiempo indicado."]
+    result = IsochroneResult(minutes=minutes, polygon=convex_hull(points), edges=edges, warnings=warnings)
+    shared.set(key, result.to_json(), settings.ROUTE_CACHE_TTL_SECONDS)
+    return result
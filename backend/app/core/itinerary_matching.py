@@ -0,0 +1,226 @@
+"""Procession itineraries read as ordered street edge paths.
+
+``ProcessionItineraryText.raw_text`` lists the streets a procession walks, in
+order ("Plaza del Duque, Campana, Sierpes, ..."). :func:`match_itinerary`
+splits it into entries, resolves every entry against a
+:class:`StreetNameIndex` built from the ``name`` tag of the street edges, and
+joins the resolved streets into one edge path: each street is entered at its
+node nearest to where the path stands and left at its node nearest to the
+next street, and consecutive waypoints are connected along the graph. A
+procession starting at its church goes from the church through the streets
+and back.
+
+:func:`match_procession_itineraries` is the batch step: it stores one
+``ProcessionEdgePath`` per procession and skips those whose text and graph did
+not change. The procession blockages walk the stored paths instead of
+routing between schedule points.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import unicodedata
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Iterable, Optional
+
+from sqlalchemy.orm import Session, joinedload
+
+from app.core.routing_engines import astar_search, euclidean_heuristic
+from app.core.street_graph import CompiledStreetGraph
+from app.models.models import Hermandad, Procession, ProcessionEdgePath, StreetEdge
+
+# words that tell what kind of street it is, not which one: "Plaza del Duque" and "Duque" are the same entry
+_STREET_TYPES = frozenset(
+    {"calle", "c", "cl", "avenida", "avda", "av", "plaza", "pza", "pl", "plazuela", "paseo", "ronda", "callejon", "cuesta"}
+)
+_STOPWORDS = frozenset({"de", "del", "la", "las", "el", "los", "y"})
+_ENTRY_SEPARATORS = re.compile(r"[,;\n]|\s+y\s+|\s+[-–—]\s+")
+
+
+def normalize_street_name(name: str) -> str:
+    """Lowercase, accent-free name without street types and stopwords ("" if nothing is left)."""
+    text = unicodedata.normalize("NFKD", name.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    words = re.findall(r"[a-z0-9]+", text)
+    return " ".join(word for word in words if word not in _STREET_TYPES and word not in _STOPWORDS)
+
+
+def split_itinerary(raw_text: str) -> list[str]:
+    """Itinerary entries in walking order."""
+    return [entry.strip(" .") for entry in _ENTRY_SEPARATORS.split(raw_text) if entry.strip(" .")]
+
+
+@dataclass
+class StreetNameIndex:
+    """Normalized street name -> CSR slots of the edges carrying it, plus a token index for partial names."""
+
+    slots: dict[str, list[int]]
+    tokens: dict[str, set[str]] = field(default_factory=dict)
+
+    @classmethod
+    def from_edges(cls, graph: CompiledStreetGraph, rows: Iterable[tuple[str, Optional[str]]]) -> "StreetNameIndex":
+        """Index from ``(edge_id, tags JSON)`` rows; edges missing from ``graph`` are left out."""
+        slots: dict[str, list[int]] = {}
+        for edge_id, raw_tags in rows:
+            slot = graph.edge_index.get(edge_id)
+            name = json.loads(raw_tags or "{}").get("name") if slot is not None else None
+            key = normalize_street_name(name) if name else ""
+            if key:
+                slots.setdefault(key, []).append(slot)
+        tokens: dict[str, set[str]] = {}
+        for key in slots:
+            for token in key.split():
+                tokens.setdefault(token, set()).add(key)
+        return cls(slots=slots, tokens=tokens)
+
+    def candidates(self, entry: str) -> list[str]:
+        """Names an itinerary entry may refer to: the exact name, else those containing all its words with fewest extra."""
+        key = normalize_street_name(entry)
+        if not key:
+            return []
+        if key in self.slots:
+            return [key]
+        words = key.split()
+        names = set(self.tokens.get(words[0], ()))
+        for word in words[1:]:
+            names &= self.tokens.get(word, set())
+        if not names:
+            return []
+        fewest = min(len(name.split()) for name in names)
+        return sorted(name for name in names if len(name.split()) == fewest)
+
+    def nodes(self, graph: CompiledStreetGraph, name: str) -> list[int]:
+        return sorted({end for slot in self.slots[name] for end in (graph.sources[slot], graph.targets[slot])})
+
+
+def build_street_name_index(db: Session, graph: CompiledStreetGraph) -> StreetNameIndex:
+    rows = db.query(StreetEdge.id, StreetEdge.tags).filter(StreetEdge.tags.like('%"name"%'))
+    return StreetNameIndex.from_edges(graph, rows)
+
+
+def _distance2(graph: CompiledStreetGraph, a: int, b: int) -> float:
+    return (graph.xs[a] - graph.xs[b]) ** 2 + (graph.ys[a] - graph.ys[b]) ** 2
+
+
+def _gap2(graph: CompiledStreetGraph, node: int, to: list[int]) -> float:
+    return min(_distance2(graph, node, other) for other in to)
+
+
+def _closest(graph: CompiledStreetGraph, nodes: list[int], to: list[int]) -> int:
+    """Node of ``nodes`` nearest to any of ``to``."""
+    return min(nodes, key=lambda node: _gap2(graph, node, to))
+
+
+def _farthest(graph: CompiledStreetGraph, nodes: list[int], to: list[int]) -> int:
+    return max(nodes, key=lambda node: _gap2(graph, node, to))
+
+
+@dataclass
+class ItineraryMatch:
+    slots: list[int]
+    # (itinerary entry, normalized street name) of every resolved entry, in order
+    matched: list[tuple[str, str]]
+    unmatched: list[str]
+    # consecutive waypoints the graph does not connect
+    gaps: int = 0
+
+
+def match_itinerary(
+    graph: CompiledStreetGraph, index: StreetNameIndex, raw_text: str, *, start: Optional[int] = None
+) -> ItineraryMatch:
+    """Edge path through the streets of ``raw_text``, from and back to ``start`` (the church) when given."""
+    matched: list[tuple[str, str]] = []
+    unmatched: list[str] = []
+    streets: list[list[int]] = []
+    for entry in split_itinerary(raw_text):
+        names = index.candidates(entry)
+        if not names:
+            unmatched.append(entry)
+            continue
+        if len(names) > 1:
+            # same-named streets in several barrios: take the one next to where the path stands
+            here = streets[-1] if streets else ([start] if start is not None else None)
+            if here is not None:
+                names = [min(names, key=lambda name: min(_gap2(graph, node, here) for node in index.nodes(graph, name)))]
+        if matched and matched[-1][1] == names[0]:
+            continue
+        matched.append((entry, names[0]))
+        streets.append(index.nodes(graph, names[0]))
+
+    waypoints: list[int] = [start] if start is not None else []
+    for i, nodes in enumerate(streets):
+        following = streets[i + 1] if i + 1 < len(streets) else ([start] if start is not None else None)
+        if waypoints:
+            entry = _closest(graph, nodes, [waypoints[-1]])
+        else:
+            entry = _farthest(graph, nodes, following) if following else nodes[0]
+        leave = _closest(graph, nodes, following) if following else _farthest(graph, nodes, [entry])
+        waypoints.extend((entry, leave))
+    if start is not None and streets:
+        waypoints.append(start)
+
+    slots: list[int] = []
+    gaps = 0
+    for a, b in zip(waypoints, waypoints[1:]):
+        if a == b:
+            continue
+        path = astar_search(graph, a, b, {}, euclidean_heuristic(graph, b))
+        if path.found:
+            slots.extend(path.slots)
+        else:
+            gaps += 1
+    return ItineraryMatch(slots=slots, matched=matched, unmatched=unmatched, gaps=gaps)
+
+
+def _text_hash(raw_text: str) -> str:
+    return hashlib.sha1(raw_text.encode()).hexdigest()
+
+
+def match_procession_itineraries(db: Session, graph: CompiledStreetGraph, *, force: bool = False) -> dict[str, int]:
+    """Match and store the edge path of every procession with an itinerary text.
+
+    Processions whose text and graph are unchanged since their last match are
+    skipped unless ``force``.
+    """
+    index = build_street_name_index(db, graph)
+    stored = {path.procession_id: path for path in db.query(ProcessionEdgePath)}
+    processions = (
+        db.query(Procession)
+        .options(
+            joinedload(Procession.itinerary),
+            joinedload(Procession.brotherhood).joinedload(Hermandad.church),
+        )
+        .filter(Procession.itinerary.has())
+        .order_by(Procession.id)
+        .all()
+    )
+    summary = {"matched": 0, "skipped": 0, "without_streets": 0, "unmatched_entries": 0, "gaps": 0}
+    for procession in processions:
+        raw_text = procession.itinerary.raw_text
+        text_hash = _text_hash(raw_text)
+        path = stored.get(procession.id)
+        if not force and path is not None and path.text_hash == text_hash and path.graph_fingerprint == graph.fingerprint:
+            summary["skipped"] += 1
+            continue
+        church = procession.brotherhood.church if procession.brotherhood is not None else None
+        start = graph.snap(church.lat, church.lng) if church is not None and church.lat and church.lng else None
+        match = match_itinerary(graph, index, raw_text, start=start)
+        if path is None:
+            path = ProcessionEdgePath(id=str(uuid.uuid4()), procession_id=procession.id)
+            db.add(path)
+        path.edge_ids = json.dumps([graph.edge_ids[slot] for slot in match.slots])
+        path.matched_streets = json.dumps(match.matched, ensure_ascii=False)
+        path.unmatched = json.dumps(match.unmatched, ensure_ascii=False)
+        path.text_hash = text_hash
+        path.graph_fingerprint = graph.fingerprint
+        path.matched_at = datetime.utcnow()
+        summary["matched"] += 1
+        summary["unmatched_entries"] += len(match.unmatched)
+        summary["gaps"] += match.gaps
+        if not match.matched:
+            summary["without_streets"] += 1
+    db.commit()
+    return summary
@@ -0,0 +1,97 @@
+"""Coalescing of Modo Calle location updates, one slot per WebSocket connection.
+
+GPS clients may send ``location_update`` faster than routes can be computed.
+The WebSocket receiver only drops every update into the connection's
+:class:`LatestLocation` slot, replacing one that was not picked up yet, and a
+single processor task per connection routes the latest one, at most once per
+``WS_MIN_RECOMPUTE_SECONDS``. A connection therefore never has more than one
+computation in flight and one update pending, however fast it sends, and its
+routes are always for its freshest position. :data:`ws_metrics` counts both
+for the admin API.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+from contextlib import contextmanager
+from typing import Generic, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class WsMetrics:
+    """Process-wide counters of the Modo Calle connections."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.connections = 0
+        # updates waiting in a slot (at most one per connection) and computations running
+        self.pending = 0
+        self.computing = 0
+        self.received = 0
+        self.computed = 0
+        # updates replaced by a newer one before being routed, and computations delayed by the minimum interval
+        self.coalesced = 0
+        self.throttled = 0
+
+    def add(self, **deltas: int) -> None:
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    @contextmanager
+    def computation(self) -> Iterator[None]:
+        self.add(computing=1)
+        try:
+            yield
+        finally:
+            self.add(computing=-1, computed=1)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "connections": self.connections,
+                "pending": self.pending,
+                "computing": self.computing,
+                "received": self.received,
+                "computed": self.computed,
+                "coalesced": self.coalesced,
+                "throttled": self.throttled,
+            }
+
+
+ws_metrics = WsMetrics()
+
+
+class LatestLocation(Generic[T]):
+    """Single-item slot: :meth:`put` replaces whatever the processor has not taken yet."""
+
+    def __init__(self, metrics: WsMetrics = ws_metrics) -> None:
+        self._metrics = metrics
+        self._item: Optional[T] = None
+        self._ready = asyncio.Event()
+
+    def put(self, item: T) -> None:
+        if self._item is None:
+            self._metrics.add(received=1, pending=1)
+        else:
+            self._metrics.add(received=1, coalesced=1)
+        self._item = item
+        self._ready.set()
+
+    async def wait(self) -> None:
+        """Until an update is pending (it stays in the slot, so newer ones keep replacing it)."""
+        await self._ready.wait()
+
+    def take(self) -> T:
+        item, self._item = self._item, None
+        self._ready.clear()
+        self._metrics.add(pending=-1)
+        return item
+
+    def close(self) -> None:
+        """Drop a pending update of a closed connection."""
+        if self._item is not None:
+            self._item = None
+            self._ready.clear()
+            self._metrics.add(pending=-1)
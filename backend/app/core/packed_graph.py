@@ -0,0 +1,242 @@
+"""Flat binary layout of the compiled street graph.
+
+:func:`pack_graph` writes every array of a
+:class:`~app.core.street_graph.CompiledStreetGraph` (coordinates, CSR
+adjacency, weights and lengths, packed geometry), the node and edge id
+tables and the snapping grid into one contiguous buffer: a magic, a JSON
+header describing every array and then the raw arrays, each 8-byte aligned.
+Ids are read one at a time through :class:`PackedIds` and the grid is used in
+place, so a mapped graph builds no per-node Python objects.
+:meth:`PackedStreetGraph.from_buffer` maps them back as typed ``memoryview``
+objects without copying, so the same bytes can back any number of processes,
+either as a ``SharedMemory`` block (routing workers) or as a read-only mmap of
+the graph file written by the importer (see :func:`write_graph_file`).
+"""
+from __future__ import annotations
+
+import json
+import mmap
+import sys
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Iterable, Optional, Sequence, Union, overload
+
+if TYPE_CHECKING:
+    from app.core.street_graph import CompiledStreetGraph
+
+_MAGIC = b"SGR1"
+FORMAT_VERSION = 4
+_ALIGN = 8
+
+# arrays used by routing_engines / contraction
+SEARCH_ARRAYS = ("xs", "ys", "offsets", "sources", "targets", "in_offsets", "in_slots", "weights")
+# everything else needed to rebuild the full graph, in the order it is packed after the search arrays
+GRAPH_ARRAYS = SEARCH_ARRAYS + (
+    "lats", "lngs", "lengths", "geom_offsets", "geom_dlats", "geom_dlngs", "snap_lats", "snap_lngs", "snap_nodes",
+    "crowd_capacity",
+)
+
+# node_grid (spatial_index.PointIndex.packed) arrays, stored as grid_<name>
+GRID_ARRAYS = ("xs", "ys", "cells", "offsets", "items")
+
+Buffer = Union[bytearray, memoryview, mmap.mmap]
+
+
+def _aligned(size: int) -> int:
+    return (size + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _id_table(ids: Iterable[str]) -> tuple[bytes, array]:
+    """UTF-8 ids back to back, and the offset of each one (plus the end)."""
+    encoded = [node_id.encode("utf-8") for node_id in ids]
+    offsets = array("l", [0])
+    for raw in encoded:
+        offsets.append(offsets[-1] + len(raw))
+    return b"".join(encoded), offsets
+
+
+def _section(name: str, values) -> tuple[str, str, int, int, bytes]:
+    # arrays, or memoryviews when the graph itself was mapped from a file
+    typecode = getattr(values, "typecode", None) or values.format
+    return name, typecode, values.itemsize, len(values), values.tobytes()
+
+
+def _sections(graph: "CompiledStreetGraph") -> list[tuple[str, str, int, int, bytes]]:
+    """``(name, typecode, itemsize, length, raw bytes)`` in packing order."""
+    sections = [_section(name, getattr(graph, name)) for name in GRAPH_ARRAYS]
+    for name in ("node_ids", "edge_ids"):
+        blob, offsets = _id_table(getattr(graph, name))
+        sections.append((name, "B", 1, len(blob), blob))
+        sections.append(_section(f"{name}_offsets", offsets))
+    grid = graph.node_grid.packed()
+    sections.extend(_section(f"grid_{name}", grid[name]) for name in GRID_ARRAYS)
+    return sections
+
+
+def _header(graph: "CompiledStreetGraph", sections, meta: Optional[dict[str, Any]]) -> bytes:
+    arrays = []
+    offset = 0
+    for name, typecode, itemsize, length, raw in sections:
+        arrays.append([name, typecode, itemsize, length, offset])
+        offset += _aligned(len(raw))
+    header = {
+        "format": FORMAT_VERSION,
+        "fingerprint": graph.fingerprint,
+        "node_count": graph.node_count,
+        "edge_count": graph.edge_count,
+        "byteorder": sys.byteorder,
+        "grid": {
+            "cell_size_m": graph.node_grid.cell_size,
+            "origin": [graph.node_grid.projection.lat0, graph.node_grid.projection.lng0],
+        },
+        "meta": meta or {},
+        "arrays": arrays,
+    }
+    return json.dumps(header).encode("utf-8")
+
+
+def _layout(graph: "CompiledStreetGraph", meta: Optional[dict[str, Any]]) -> tuple[bytes, list, int]:
+    sections = _sections(graph)
+    raw_header = _header(graph, sections, meta)
+    size = _aligned(len(_MAGIC) + 4 + len(raw_header)) + sum(_aligned(len(raw)) for *_, raw in sections)
+    return raw_header, sections, size
+
+
+def packed_size(graph: "CompiledStreetGraph", meta: Optional[dict[str, Any]] = None) -> int:
+    return _layout(graph, meta)[2]
+
+
+def pack_graph(graph: "CompiledStreetGraph", buffer: Buffer, meta: Optional[dict[str, Any]] = None) -> int:
+    """Write ``graph`` into ``buffer`` (at least :func:`packed_size` bytes); returns the bytes used."""
+    raw_header, sections, size = _layout(graph, meta)
+    view = memoryview(buffer)
+    try:
+        view[: len(_MAGIC)] = _MAGIC
+        view[len(_MAGIC) : len(_MAGIC) + 4] = len(raw_header).to_bytes(4, "little")
+        cursor = len(_MAGIC) + 4
+        view[cursor : cursor + len(raw_header)] = raw_header
+        cursor = _aligned(cursor + len(raw_header))
+        for *_, raw in sections:
+            view[cursor : cursor + len(raw)] = raw
+            cursor += _aligned(len(raw))
+        return size
+    finally:
+        view.release()
+
+
+def write_graph_file(graph: "CompiledStreetGraph", path: Union[str, Path], meta: Optional[dict[str, Any]] = None) -> int:
+    """Write ``graph`` to ``path`` atomically; returns the file size."""
+    buffer = bytearray(packed_size(graph, meta))
+    pack_graph(graph, buffer, meta)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(buffer)
+    tmp.replace(path)
+    return len(buffer)
+
+
+def map_graph_file(path: Union[str, Path]) -> "PackedStreetGraph":
+    """Read-only mmap of a graph file; the mapping lives as long as the returned views."""
+    with Path(path).open("rb") as fh:
+        mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    return PackedStreetGraph.from_buffer(mapped)
+
+
+@dataclass
+class PackedStreetGraph:
+    """Read-only view of a packed graph.
+
+    Exposes the interface the engines search on; the arrays are ``memoryview``
+    slices of the underlying buffer, so call :meth:`release` before closing it.
+    """
+
+    fingerprint: str
+    node_count: int
+    edge_count: int
+    meta: dict[str, Any]
+    # snapping grid parameters: cell size and projection origin
+    grid: dict[str, Any]
+    arrays: dict[str, memoryview]
+    version: int = 0
+
+    @classmethod
+    def from_buffer(cls, buffer: Buffer) -> "PackedStreetGraph":
+        view = memoryview(buffer)
+        try:
+            if bytes(view[: len(_MAGIC)]) != _MAGIC:
+                raise ValueError("buffer does not hold a packed street graph")
+            header_len = int.from_bytes(view[len(_MAGIC) : len(_MAGIC) + 4], "little")
+            start = len(_MAGIC) + 4
+            header = json.loads(bytes(view[start : start + header_len]))
+            if header["format"] != FORMAT_VERSION:
+                raise ValueError(f"packed street graph format {header['format']} is not supported")
+            if header["byteorder"] != sys.byteorder:
+                raise ValueError("packed street graph was written with a different byte order")
+            base = _aligned(start + header_len)
+            arrays: dict[str, memoryview] = {}
+            for name, typecode, itemsize, length, offset in header["arrays"]:
+                lo = base + offset
+                arrays[name] = view[lo : lo + itemsize * length].cast(typecode)
+                if arrays[name].itemsize != itemsize:
+                    raise ValueError("packed street graph was written on an incompatible platform")
+        finally:
+            view.release()
+        return cls(
+            fingerprint=header["fingerprint"],
+            node_count=header["node_count"],
+            edge_count=header["edge_count"],
+            meta=header["meta"],
+            grid=header["grid"],
+            arrays=arrays,
+        )
+
+    def __post_init__(self) -> None:
+        # plain attributes (graph.offsets, graph.weights...) for the engines' hot loops
+        self.__dict__.update(self.arrays)
+
+    def out_slots(self, node: int) -> range:
+        return range(self.offsets[node], self.offsets[node + 1])
+
+    def in_edge_slots(self, node: int) -> memoryview:
+        return self.in_slots[self.in_offsets[node] : self.in_offsets[node + 1]]
+
+    def ids(self, name: str) -> "PackedIds":
+        """``node_ids`` / ``edge_ids`` table, decoded on access."""
+        return PackedIds(self.arrays[name], self.arrays[f"{name}_offsets"])
+
+    def release(self) -> None:
+        for values in self.arrays.values():
+            values.release()
+
+
+class PackedIds(Sequence[str]):
+    """Read-only id table over a packed blob: each id is decoded when it is read."""
+
+    def __init__(self, blob: memoryview, offsets: Sequence[int]):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    @overload
+    def __getitem__(self, index: int) -> str: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[str]: ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("id index out of range")
+        return str(self._blob[self._offsets[index]:self._offsets[index + 1]], "utf-8")
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
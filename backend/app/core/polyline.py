@@ -0,0 +1,91 @@
+"""Route polyline simplification and compact encoding.
+
+``simplify`` is Douglas-Peucker with a tolerance in metres (points are projected
+to a local equirectangular plane first), so street corners survive while
+collinear points along a street are dropped. ``encode``/``decode`` implement
+Google's encoded polyline format: zig-zag deltas at 1e-5 degrees packed in
+5-bit base64-ish chunks, typically 4-6 bytes per point instead of ~40 in JSON.
+"""
+from __future__ import annotations
+
+import math
+from typing import List
+
+_M_PER_DEG_LAT = 110_540.0
+_M_PER_DEG_LNG_EQUATOR = 111_320.0
+
+
+def _segment_distance(px: float, py: float, ax: float, ay: float, bx: float, by: float) -> float:
+    dx, dy = bx - ax, by - ay
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0.0:
+        return math.hypot(px - ax, py - ay)
+    t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / length_sq))
+    return math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def simplify(points: List[List[float]], tolerance_m: float) -> List[List[float]]:
+    """Douglas-Peucker over ``[lat, lng]`` points; endpoints are always kept."""
+    if len(points) <= 2 or tolerance_m <= 0:
+        return list(points)
+    m_per_deg_lng = _M_PER_DEG_LNG_EQUATOR * math.cos(math.radians(points[0][0]))
+    xs = [p[1] * m_per_deg_lng for p in points]
+    ys = [p[0] * _M_PER_DEG_LAT for p in points]
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        worst, worst_distance = -1, tolerance_m
+        ax, ay, bx, by = xs[first], ys[first], xs[last], ys[last]
+        for i in range(first + 1, last):
+            distance = _segment_distance(xs[i], ys[i], ax, ay, bx, by)
+            if distance > worst_distance:
+                worst, worst_distance = i, distance
+        if worst >= 0:
+            keep[worst] = True
+            stack.append((first, worst))
+            stack.append((worst, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def _encode_value(value: int, out: list[str]) -> None:
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        out.append(chr((0x20 | (value & 0x1F)) + 63))
+        value >>= 5
+    out.append(chr(value + 63))
+
+
+def encode(points: List[List[float]], precision: int = 5) -> str:
+    factor = 10 ** precision
+    out: list[str] = []
+    prev_lat = prev_lng = 0
+    for lat, lng in points:
+        ilat, ilng = round(lat * factor), round(lng * factor)
+        _encode_value(ilat - prev_lat, out)
+        _encode_value(ilng - prev_lng, out)
+        prev_lat, prev_lng = ilat, ilng
+    return "".join(out)
+
+
+def decode(encoded: str, precision: int = 5) -> List[List[float]]:
+    factor = 10 ** precision
+    points: List[List[float]] = []
+    index = lat = lng = 0
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                chunk = ord(encoded[index]) - 63
+                index += 1
+                result |= (chunk & 0x1F) << shift
+                shift += 5
+                if chunk < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        points.append([lat / factor, lng / factor])
+    return points
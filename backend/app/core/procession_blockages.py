@@ -0,0 +1,341 @@
+"""Where every procession is during the night, as time-windowed edge blockages.
+
+Each procession's schedule points are anchored on the map (``salida`` and
+``recogida`` at the brotherhood's church, ``carrera_oficial_start``/``_end`` at
+La Campana and the Cathedral). When its itinerary has been matched to an edge
+path (see :mod:`app.core.itinerary_matching`) the anchors are located along
+that path in order and each leg is the stretch of path between two of them;
+otherwise consecutive anchors are joined by the shortest walk along the
+street graph. The cruz de guía walks every leg at constant speed
+between the two scheduled times; the cortejo behind it takes
+``PROCESSION_CORTEJO_MINUTES`` to pass, so a node on the route is occupied from
+the moment the head reaches it until the tail has gone by. Every edge entering
+an occupied node is blocked for that window: walking along the cortejo and
+crossing it are penalised alike.
+
+All processions of a night (06:00 to 06:00, the Madrugá falls in the night it
+starts) are precomputed into one :class:`ProcessionBlockages` table: one
+bitmask of ``PROCESSION_BLOCKAGE_BUCKET_MINUTES`` buckets per blocked slot, so
+"is this edge blocked at ``t``" is a dict lookup and a shift. Tables are cached
+per graph and night and rebuilt when the schedule tables change (probed like
+the restriction timeline, and dropped at once by the admin procession patch).
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from datetime import time as clock
+from typing import Iterable, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session, joinedload
+
+from app.core.config import settings
+from app.core.restrictions import to_timestamp
+from app.core.routing_engines import astar_search, euclidean_heuristic
+from app.core.street_graph import CompiledStreetGraph
+from app.models.models import Hermandad, Procession, ProcessionEdgePath, ProcessionSchedulePoint
+
+logger = logging.getLogger(__name__)
+
+CARRERA_OFICIAL_START = (37.3937, -5.9947)  # La Campana
+CARRERA_OFICIAL_END = (37.3856, -5.9927)  # Catedral, Puerta de Palos
+_NIGHT_STARTS = clock(6)
+_NIGHT = timedelta(days=1)
+
+# (slots of the leg in walking order, node the leg starts at, head leaves, head arrives)
+Leg = tuple[list[int], int, datetime, datetime]
+
+
+def _naive(at: datetime) -> datetime:
+    # schedule points are stored naive: read an offset-aware time as wall time, like restrictions.to_timestamp
+    return at.replace(tzinfo=None)
+
+
+def night_start(at: datetime) -> datetime:
+    """Start of the procession night ``at`` belongs to."""
+    at = _naive(at)
+    day = at.date() if at.time() >= _NIGHT_STARTS else at.date() - timedelta(days=1)
+    return datetime.combine(day, _NIGHT_STARTS)
+
+
+@dataclass
+class ProcessionBlockages:
+    """Edge x time-bucket blockage table of one night."""
+
+    night_start: datetime
+    bucket_minutes: int
+    severity: float
+    # slot -> bitmask, bit ``i`` = blocked during bucket ``i`` of the night
+    masks: dict[int, int]
+    fingerprint: str
+    _snapshots: dict[int, dict[int, float]] = field(default_factory=dict, repr=False, compare=False)
+    # bit ``i`` = some slot gets blocked or cleared at the start of bucket ``i``
+    _changes: int = field(default=0, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        changes = 0
+        for mask in self.masks.values():
+            changes |= mask ^ (mask << 1)
+        self._changes = changes
+
+    def __len__(self) -> int:
+        return len(self.masks)
+
+    @property
+    def bucket_count(self) -> int:
+        return int(_NIGHT / timedelta(minutes=self.bucket_minutes))
+
+    def bucket(self, at: datetime) -> int:
+        """Bucket index of ``at`` (-1 outside the night)."""
+        index = int((_naive(at) - self.night_start) // timedelta(minutes=self.bucket_minutes))
+        return index if 0 <= index < self.bucket_count else -1
+
+    def blocked(self, slot: int, at: datetime) -> bool:
+        index = self.bucket(at)
+        return index >= 0 and bool((self.masks.get(slot, 0) >> index) & 1)
+
+    def epoch(self, at: datetime) -> int:
+        """Last bucket at or before ``at`` where the blocked set changed (-1 if none, or outside the night)."""
+        index = self.bucket(at)
+        if index < 0:
+            return -1
+        return (self._changes & ((2 << index) - 1)).bit_length() - 1
+
+    def shared_epoch_key(self, at: datetime) -> str:
+        # the same for every instant with the same blocked edges, so requests keep sharing cache entries
+        return f"{self.fingerprint}:{self.epoch(at)}"
+
+    def active_at(self, at: datetime) -> dict[int, float]:
+        """Slot -> penalty for every edge blocked at ``at`` (memoised per epoch)."""
+        index = self.epoch(at)
+        snapshot = self._snapshots.get(index)
+        if snapshot is None:
+            bit = 1 << index if index >= 0 else 0
+            snapshot = {slot: self.severity for slot, mask in self.masks.items() if mask & bit}
+            self._snapshots[index] = snapshot
+        return snapshot
+
+    # same piecewise interface as restrictions.RestrictionTimeline, for the time-dependent router
+
+    def slots(self) -> Iterable[int]:
+        return self.masks.keys()
+
+    def pieces(self, slot: int, start_ts: int, end_ts: int) -> list[tuple[int, float]]:
+        """``(timestamp, penalty)`` pieces of ``slot`` over ``[start_ts, end_ts)``; the first starts at ``start_ts``."""
+        mask = self.masks.get(slot, 0)
+        step = self.bucket_minutes * 60 * 1_000_000
+        origin = to_timestamp(self.night_start)
+
+        def value(ts: int) -> float:
+            index = (ts - origin) // step
+            return self.severity if 0 <= index < self.bucket_count and (mask >> index) & 1 else 0.0
+
+        pieces = [(start_ts, value(start_ts))]
+        ts = origin + ((start_ts - origin) // step + 1) * step
+        while ts < end_ts:
+            current = value(ts)
+            if current != pieces[-1][1]:
+                pieces.append((ts, current))
+            ts += step
+        return pieces
+
+
+def _anchor(point_type: str, church: Optional[tuple[float, float]]) -> Optional[tuple[float, float]]:
+    if point_type in ("salida", "recogida"):
+        return church
+    if point_type == "carrera_oficial_start":
+        return CARRERA_OFICIAL_START
+    if point_type == "carrera_oficial_end":
+        return CARRERA_OFICIAL_END
+    return None
+
+
+def _path_legs(graph: CompiledStreetGraph, path: list[int], anchors: list[tuple[datetime, int]]) -> list[Leg]:
+    """Stretches of a matched edge path between the anchors, located along it in order."""
+    nodes = [graph.sources[path[0]], *(graph.targets[slot] for slot in path)]
+    legs: list[Leg] = []
+    previous: Optional[tuple[datetime, int]] = None
+    for scheduled, anchor in anchors:
+        # strictly after the previous anchor: the recogida is back at the church the path starts from
+        start = min(previous[1] + 1, len(nodes) - 1) if previous is not None else 0
+        position = min(
+            range(start, len(nodes)),
+            key=lambda i: (graph.xs[nodes[i]] - graph.xs[anchor]) ** 2 + (graph.ys[nodes[i]] - graph.ys[anchor]) ** 2,
+        )
+        if previous is not None and scheduled > previous[0]:
+            legs.append((path[previous[1]:position], nodes[previous[1]], previous[0], scheduled))
+        previous = (scheduled, position)
+    return legs
+
+
+def procession_legs(graph: CompiledStreetGraph, procession: Procession, path: Optional[list[int]] = None) -> list[Leg]:
+    """Legs between consecutive anchored schedule points, along ``path`` (matched itinerary slots) when given."""
+    brotherhood: Optional[Hermandad] = procession.brotherhood
+    church = None
+    if brotherhood is not None and brotherhood.church is not None and brotherhood.church.lat and brotherhood.church.lng:
+        church = (brotherhood.church.lat, brotherhood.church.lng)
+    anchors = []
+    for point in sorted(procession.schedule_points, key=lambda p: p.scheduled_datetime):
+        location = _anchor(point.point_type, church)
+        if location is not None:
+            anchors.append((point.scheduled_datetime, graph.snap(location[0], location[1])))
+    if path:
+        return _path_legs(graph, path, anchors)
+
+    legs: list[Leg] = []
+    for (leaves, start), (arrives, goal) in zip(anchors, anchors[1:]):
+        if arrives <= leaves:
+            continue
+        path = astar_search(graph, start, goal, {}, euclidean_heuristic(graph, goal))
+        legs.append((path.slots if path.found else [], start, leaves, arrives))
+    return legs
+
+
+def _occupied_nodes(graph: CompiledStreetGraph, legs: list[Leg]) -> Iterable[tuple[int, datetime, datetime]]:
+    """``(node, head arrives, tail leaves)`` for every node the cortejo passes."""
+    cortejo = timedelta(minutes=settings.PROCESSION_CORTEJO_MINUTES)
+    for slots, start, leaves, arrives in legs:
+        total = sum(graph.lengths[slot] for slot in slots)
+        yield start, leaves, leaves + cortejo
+        walked = 0.0
+        for slot in slots:
+            walked += graph.lengths[slot]
+            reached = leaves + (arrives - leaves) * (walked / total if total else 1.0)
+            yield graph.targets[slot], reached, reached + cortejo
+        if not slots:
+            # the paso stays around the same node until the next point
+            yield start, leaves, arrives + cortejo
+
+
+def build_procession_blockages(db: Session, graph: CompiledStreetGraph, at: datetime) -> ProcessionBlockages:
+    start = night_start(at)
+    end = start + _NIGHT
+    bucket = timedelta(minutes=settings.PROCESSION_BLOCKAGE_BUCKET_MINUTES)
+    buckets = int(_NIGHT / bucket)
+    # processions run for hours: take any with a point within half a day of the night
+    margin = timedelta(hours=12)
+    ids = [
+        row[0]
+        for row in db.query(ProcessionSchedulePoint.procession_id)
+        .filter(
+            ProcessionSchedulePoint.scheduled_datetime >= start - margin,
+            ProcessionSchedulePoint.scheduled_datetime < end + margin,
+        )
+        .distinct()
+    ]
+    processions = (
+        db.query(Procession)
+        .options(
+            joinedload(Procession.schedule_points),
+            joinedload(Procession.brotherhood).joinedload(Hermandad.church),
+        )
+        .filter(Procession.id.in_(ids))
+        .order_by(Procession.id)
+        .all()
+        if ids
+        else []
+    )
+
+    paths: dict[str, list[int]] = {}
+    if ids:
+        for procession_id, edge_ids in db.query(ProcessionEdgePath.procession_id, ProcessionEdgePath.edge_ids).filter(
+            ProcessionEdgePath.procession_id.in_(ids)
+        ):
+            slots = [graph.edge_index.get(edge_id) for edge_id in json.loads(edge_ids)]
+            # matched on another graph: route between the schedule points until it is matched again
+            if slots and None not in slots:
+                paths[procession_id] = slots
+
+    masks: dict[int, int] = {}
+    digest = hashlib.sha1(f"{graph.fingerprint}|{start.isoformat()}|{settings.PROCESSION_CORTEJO_MINUTES}".encode())
+    for procession in processions:
+        digest.update(procession.id.encode())
+        for point in sorted(procession.schedule_points, key=lambda p: p.scheduled_datetime):
+            digest.update(f"{point.point_type}:{point.scheduled_datetime.isoformat()};".encode())
+        path = paths.get(procession.id)
+        if path:
+            digest.update(",".join(map(str, path)).encode())
+        for node, head, tail in _occupied_nodes(graph, procession_legs(graph, procession, path)):
+            first = max(0, int((head - start) // bucket))
+            last = min(buckets - 1, int((tail - start) // bucket))
+            if first > last:
+                continue
+            bits = ((1 << (last - first + 1)) - 1) << first
+            for slot in graph.in_edge_slots(node):
+                masks[slot] = masks.get(slot, 0) | bits
+    return ProcessionBlockages(
+        night_start=start,
+        bucket_minutes=settings.PROCESSION_BLOCKAGE_BUCKET_MINUTES,
+        severity=settings.PROCESSION_BLOCKAGE_SEVERITY,
+        masks=masks,
+        fingerprint=digest.hexdigest(),
+    )
+
+
+def _table_probe(db: Session) -> tuple:
+    # schedules are replaced by delete and re-insert: the newest updated_at moves even when the count does not
+    points = db.query(func.count(ProcessionSchedulePoint.id), func.max(ProcessionSchedulePoint.updated_at)).one()
+    paths = db.query(func.count(ProcessionEdgePath.id), func.max(ProcessionEdgePath.matched_at)).one()
+    return (*points, *paths)
+
+
+_tables: dict[tuple[str, datetime], ProcessionBlockages] = {}
+_tables_probe: Optional[tuple] = None
+_tables_checked_at = 0.0
+_tables_lock = threading.Lock()
+
+
+def get_procession_blockages(db: Session, graph: CompiledStreetGraph, at: datetime) -> ProcessionBlockages:
+    """Shared blockage table of the night of ``at``, built on first use.
+
+    Like the restriction timeline, the schedule and matched path tables are re-probed at
+    most every ``ROUTING_RESTRICTIONS_REFRESH_SECONDS`` and every table dropped when they changed.
+    """
+    global _tables_probe, _tables_checked_at
+    key = (graph.fingerprint, night_start(at))
+    table = _tables.get(key)
+    now = time.monotonic()
+    if table is not None and now - _tables_checked_at < settings.ROUTING_RESTRICTIONS_REFRESH_SECONDS:
+        return table
+    with _tables_lock:
+        probe = _table_probe(db)
+        if probe != _tables_probe:
+            _tables.clear()
+            _tables_probe = probe
+        _tables_checked_at = now
+        table = _tables.get(key)
+        if table is None:
+            started = time.perf_counter()
+            table = _tables[key] = build_procession_blockages(db, graph, at)
+            logger.info(
+                "Procession blockages for the night of %s: %s edges (%.0f ms)",
+                key[1].date(),
+                len(table),
+                (time.perf_counter() - started) * 1000,
+            )
+        return table
+
+
+def procession_blockages_between(
+    db: Session, graph: CompiledStreetGraph, start: datetime, end: datetime
+) -> list[ProcessionBlockages]:
+    """Tables of every night overlapping ``[start, end]``."""
+    tables = []
+    night = night_start(start)
+    while night <= _naive(end):
+        tables.append(get_procession_blockages(db, graph, night))
+        night += _NIGHT
+    return tables
+
+
+def invalidate_procession_blockages() -> None:
+    global _tables_probe
+    with _tables_lock:
+        _tables.clear()
+        _tables_probe = None
@@ -0,0 +1,166 @@
+"""Time-indexed overlay of ``route_restrictions`` over the compiled street graph.
+
+Every restricted edge gets a piecewise-constant penalty timeline (sorted
+breakpoints + value per piece), so ``penalty(slot, t)`` is a single bisect.
+All breakpoints together split time into *epochs*: the active restriction set
+is identical for any two instants of the same epoch, which makes
+``(timeline version, epoch)`` a compact cache key for "the restrictions that
+apply right now".
+"""
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.street_graph import CompiledStreetGraph
+from app.models.models import RouteRestriction
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+# (edge_id, starts_at, ends_at, severity)
+RestrictionRow = tuple[str, datetime, datetime, float]
+
+
+def to_timestamp(dt: datetime) -> int:
+    """Naive UTC datetime -> integer microseconds (exact, no float rounding)."""
+    return (dt.replace(tzinfo=None) - _EPOCH) // _MICROSECOND
+
+
+class RestrictionTimeline:
+    def __init__(self, graph: CompiledStreetGraph, rows: Iterable[RestrictionRow], *, version: int = 0):
+        self.version = version
+        self.graph_version = graph.version
+        rows = sorted(tuple(row) for row in rows)
+        self.fingerprint = hashlib.sha1(repr(rows).encode()).hexdigest()
+        intervals: dict[int, list[tuple[int, int, float]]] = {}
+        for edge_id, starts_at, ends_at, severity in rows:
+            slot = graph.edge_index.get(edge_id)
+            if slot is None or ends_at < starts_at:
+                continue
+            # SQL semantics were starts_at <= t <= ends_at: store as [start, end + 1µs)
+            intervals.setdefault(slot, []).append((to_timestamp(starts_at), to_timestamp(ends_at) + 1, severity))
+
+        self._breakpoints: dict[int, list[int]] = {}
+        self._values: dict[int, list[float]] = {}
+        all_breakpoints: set[int] = set()
+        for slot, spans in intervals.items():
+            bps = sorted({t for start, end, _ in spans for t in (start, end)})
+            values = [max((sev for start, end, sev in spans if start <= bp < end), default=0.0) for bp in bps]
+            self._breakpoints[slot] = bps
+            self._values[slot] = values
+            all_breakpoints.update(bps)
+        self._epochs = sorted(all_breakpoints)
+        self._snapshots: dict[int, dict[int, float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._breakpoints)
+
+    def penalty(self, slot: int, ts: int) -> float:
+        """Penalty in seconds for CSR slot ``slot`` at timestamp ``ts`` (see :func:`to_timestamp`)."""
+        bps = self._breakpoints.get(slot)
+        if bps is None:
+            return 0.0
+        i = bisect_right(bps, ts) - 1
+        return self._values[slot][i] if i >= 0 else 0.0
+
+    def slots(self) -> Iterable[int]:
+        """CSR slots with at least one restriction."""
+        return self._breakpoints.keys()
+
+    def pieces(self, slot: int, start_ts: int, end_ts: int) -> list[tuple[int, float]]:
+        """``(timestamp, penalty)`` pieces of ``slot`` over ``[start_ts, end_ts)``; the first starts at ``start_ts``."""
+        pieces = [(start_ts, self.penalty(slot, start_ts))]
+        bps = self._breakpoints.get(slot)
+        if bps is not None:
+            values = self._values[slot]
+            for i in range(bisect_right(bps, start_ts), bisect_left(bps, end_ts)):
+                pieces.append((bps[i], values[i]))
+        return pieces
+
+    def penalty_at(self, slot: int, dt: datetime) -> float:
+        return self.penalty(slot, to_timestamp(dt))
+
+    def epoch(self, dt: datetime) -> int:
+        return bisect_right(self._epochs, to_timestamp(dt))
+
+    def epoch_key(self, dt: datetime) -> int:
+        """Single integer identifying the restriction set active at ``dt``."""
+        return (self.version << 32) | self.epoch(dt)
+
+    def shared_epoch_key(self, dt: datetime) -> str:
+        """Like :meth:`epoch_key` but stable across workers (content hash + epoch)."""
+        return f"{self.fingerprint}:{self.epoch(dt)}"
+
+    def active_at(self, dt: datetime) -> dict[int, float]:
+        """Slot -> penalty for every restriction active at ``dt`` (memoised per epoch)."""
+        epoch = self.epoch(dt)
+        snapshot = self._snapshots.get(epoch)
+        if snapshot is None:
+            ts = to_timestamp(dt)
+            snapshot = {}
+            for slot in self._breakpoints:
+                value = self.penalty(slot, ts)
+                if value:
+                    snapshot[slot] = value
+            self._snapshots[epoch] = snapshot
+        return snapshot
+
+
+def load_restriction_timeline(db: Session, graph: CompiledStreetGraph, *, version: int = 0) -> RestrictionTimeline:
+    rows = db.query(
+        RouteRestriction.edge_id, RouteRestriction.starts_at, RouteRestriction.ends_at, RouteRestriction.severity
+    ).all()
+    return RestrictionTimeline(graph, rows, version=version)
+
+
+def _table_probe(db: Session) -> tuple:
+    # new rows and edits both move max(updated_at); deletions move the count
+    return tuple(db.query(func.count(RouteRestriction.id), func.max(RouteRestriction.updated_at)).one())
+
+
+_timeline: Optional[RestrictionTimeline] = None
+_timeline_probe: Optional[tuple] = None
+_timeline_checked_at = 0.0
+_timeline_version = 0
+_timeline_lock = threading.Lock()
+
+
+def get_restriction_timeline(db: Session, graph: CompiledStreetGraph) -> RestrictionTimeline:
+    """Shared timeline for ``graph``.
+
+    The restrictions table is re-checked at most every
+    ``ROUTING_RESTRICTIONS_REFRESH_SECONDS`` with a count/max(updated_at)
+    probe; the timeline is only rebuilt when that probe changes.
+    """
+    global _timeline, _timeline_probe, _timeline_checked_at, _timeline_version
+    timeline = _timeline
+    now = time.monotonic()
+    if (
+        timeline is not None
+        and timeline.graph_version == graph.version
+        and now - _timeline_checked_at < settings.ROUTING_RESTRICTIONS_REFRESH_SECONDS
+    ):
+        return timeline
+    with _timeline_lock:
+        probe = _table_probe(db)
+        if _timeline is None or _timeline.graph_version != graph.version or probe != _timeline_probe:
+            _timeline_version += 1
+            _timeline = load_restriction_timeline(db, graph, version=_timeline_version)
+            _timeline_probe = probe
+        _timeline_checked_at = now
+        return _timeline
+
+
+def invalidate_restriction_timeline() -> None:
+    global _timeline
+    with _timeline_lock:
+        _timeline = None
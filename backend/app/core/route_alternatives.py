@@ -0,0 +1,172 @@
+"""Alternative routes via the via-node / plateau method.
+
+One forward tree from the start and one backward tree from the goal, both
+bounded by ``max_stretch`` times the optimal cost, yield a candidate path
+``start -> v -> goal`` for every node ``v`` reached by both. The trees keep only the nodes they labelled, so the work
+grows with the search space and not with the size of the graph. Nodes of the same
+plateau (segments shared by both trees) produce the same path, so each plateau
+is evaluated once. Candidates are accepted in cost order while they share at
+most ``max_share`` of their cost with the main route and with every accepted
+alternative.
+
+Only when no via candidate qualifies, a single penalty-method search (main
+route edges made expensive) looks for a longer detour so that the user still
+gets an option whenever the graph has one.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Mapping, Optional
+
+from app.core.routing_engines import INF, PathResult, RoutingEngine, euclidean_heuristic, labelled_tree
+from app.core.street_graph import CompiledStreetGraph
+
+# relative tolerance when comparing path costs (float sums along different orders)
+_EPS = 1e-9
+
+
+@dataclass
+class AlternativePath:
+    nodes: list[int]
+    slots: list[int]
+    cost: float
+    # cost / main route cost
+    stretch: float
+    # fraction of the main route cost also travelled by this path
+    shared: float
+
+
+def _edge_cost(graph: CompiledStreetGraph, slot: int, penalties: Mapping[int, float]) -> float:
+    return graph.weights[slot] + penalties.get(slot, 0.0)
+
+
+def _shared_cost(graph: CompiledStreetGraph, slots: list[int], other: set[int], penalties: Mapping[int, float]) -> float:
+    return sum(_edge_cost(graph, slot, penalties) for slot in slots if slot in other)
+
+
+def _via_path(
+    graph: CompiledStreetGraph, via: int, fwd_parents: dict[int, int], bwd_parents: dict[int, int]
+) -> Optional[tuple[list[int], list[int]]]:
+    """``start -> via -> goal`` from both trees, or None if it revisits a node."""
+    head_slots: list[int] = []
+    node = via
+    while node in fwd_parents:
+        slot = fwd_parents[node]
+        head_slots.append(slot)
+        node = graph.sources[slot]
+    head_slots.reverse()
+    slots = head_slots
+    node = via
+    while node in bwd_parents:
+        slot = bwd_parents[node]
+        slots.append(slot)
+        node = graph.targets[slot]
+    nodes = [graph.sources[slots[0]]] + [graph.targets[slot] for slot in slots] if slots else [via]
+    if len(set(nodes)) != len(nodes):
+        return None
+    return nodes, slots
+
+
+def _admissible(
+    graph: CompiledStreetGraph,
+    slots: list[int],
+    cost: float,
+    accepted: list[tuple[set[int], float]],
+    penalties: Mapping[int, float],
+    max_share: float,
+) -> bool:
+    for other_slots, other_cost in accepted:
+        if _shared_cost(graph, slots, other_slots, penalties) > max_share * min(cost, other_cost) * (1 + _EPS):
+            return False
+    return True
+
+
+def find_alternatives(
+    graph: CompiledStreetGraph,
+    main: PathResult,
+    penalties: Mapping[int, float],
+    *,
+    max_count: int,
+    max_stretch: float,
+    max_share: float,
+    engine: Optional[RoutingEngine] = None,
+) -> list[AlternativePath]:
+    if max_count <= 0 or not main.found or not main.slots:
+        return []
+    start, goal, best = main.nodes[0], main.nodes[-1], main.cost
+    main_slots = set(main.slots)
+    limit = best * max_stretch * (1 + _EPS)
+    # euclidean bounds keep both trees inside the ellipse of admissible via nodes
+    fwd_dist, fwd_parents = labelled_tree(
+        graph, start, penalties=penalties, limit=limit, bound=euclidean_heuristic(graph, goal)
+    )
+    bwd_dist, bwd_parents = labelled_tree(
+        graph, goal, reverse=True, penalties=penalties, limit=limit, bound=euclidean_heuristic(graph, start)
+    )
+
+    main_nodes = set(main.nodes)
+    # via nodes are labelled by both trees: walk the smaller one
+    smaller, larger = sorted((fwd_dist, bwd_dist), key=len)
+    candidates = sorted(
+        (seconds + larger[v], v)
+        for v, seconds in smaller.items()
+        if v in larger and v not in main_nodes and seconds + larger[v] <= limit
+    )
+    accepted: list[tuple[set[int], float]] = [(main_slots, best)]
+    alternatives: list[AlternativePath] = []
+    evaluated: set[int] = set()
+    for cost, via in candidates:
+        if via in evaluated:
+            continue
+        path = _via_path(graph, via, fwd_parents, bwd_parents)
+        if path is None:
+            evaluated.add(via)
+            continue
+        nodes, slots = path
+        # every node of the same plateau yields this very path
+        evaluated.update(
+            v for v in nodes if abs(fwd_dist.get(v, INF) + bwd_dist.get(v, INF) - cost) <= _EPS * cost
+        )
+        if not _admissible(graph, slots, cost, accepted, penalties, max_share):
+            continue
+        accepted.append((set(slots), cost))
+        alternatives.append(
+            AlternativePath(
+                nodes=nodes,
+                slots=slots,
+                cost=cost,
+                stretch=cost / best,
+                shared=_shared_cost(graph, slots, main_slots, penalties) / best,
+            )
+        )
+        if len(alternatives) >= max_count:
+            break
+
+    if not alternatives and engine is not None:
+        detour = _penalty_detour(graph, main, penalties, engine, max_share)
+        if detour is not None:
+            alternatives.append(detour)
+    return alternatives
+
+
+def _penalty_detour(
+    graph: CompiledStreetGraph, main: PathResult, penalties: Mapping[int, float], engine: RoutingEngine, max_share: float
+) -> Optional[AlternativePath]:
+    """Cheapest path that avoids the main route where it can (no stretch bound)."""
+    avoid = dict(penalties)
+    for slot in main.slots:
+        avoid[slot] = avoid.get(slot, 0.0) + main.cost * 10
+    path = engine.find_path(graph, main.nodes[0], main.nodes[-1], avoid)
+    if not path.found or path.slots == main.slots:
+        return None
+    cost = sum(_edge_cost(graph, slot, penalties) for slot in path.slots)
+    shared = _shared_cost(graph, path.slots, set(main.slots), penalties)
+    if shared > max_share * min(cost, main.cost) * (1 + _EPS):
+        return None
+    return AlternativePath(
+        nodes=path.nodes,
+        slots=path.slots,
+        cost=cost,
+        stretch=cost / main.cost if main.cost else INF,
+        shared=shared / main.cost if main.cost else 1.0,
+    )
@@ -0,0 +1,216 @@
+"""Per-connection route state for the Modo Calle WebSocket.
+
+Most ``location_update`` messages come from a walker a few metres further
+along the route they were just given. A :class:`RouteSession` keeps that
+route and sorts every update into one of three cases:
+
+- *progress*: the location is within ``WS_ON_ROUTE_METERS`` of the route
+  polyline. The route is trimmed at the projected point and the ETA scaled
+  to the remaining share of its length. No search runs.
+- *deviation*: the walker left the route. With the route the session built a
+  backward shortest-path tree towards the destination, bounded to the
+  ellipse of ``WS_REROUTE_TREE_SLACK`` times the route's ETA. From the snapped
+  location the new route is read off its parent pointers. A full search runs
+  only from outside the tree or in time-dependent mode, where a static tree
+  does not hold.
+- *replan*: first update, another target or constraints, or a change in
+  anything the penalties depend on (graph, restriction epoch, procession
+  blockages, crowd bucket). ``calculate_optimal_route`` runs (through the
+  route cache) and the tree is rebuilt.
+"""
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.crowd_overlay import edge_crowd_penalties
+from app.core.procession_blockages import get_procession_blockages
+from app.core.restrictions import get_restriction_timeline
+from app.core.route_cache import time_bucket
+from app.core.routing import (
+    RoutingResult,
+    calculate_optimal_route,
+    merge_penalties,
+    route_from_slots,
+    static_explanation,
+)
+from app.core.routing_engines import INF, euclidean_heuristic, labelled_tree
+from app.core.street_graph import CompiledStreetGraph, get_street_graph
+
+_TREE_LABEL = "el árbol de búsqueda de la sesión (desvío sobre la ruta anterior)"
+
+
+@dataclass
+class RouteSession:
+    """Last route of one connection and what is needed to follow or repair it."""
+
+    request: Optional[tuple] = None
+    version: Optional[tuple] = None
+    result: Optional[RoutingResult] = None
+    # route polyline in local metres and the distance along it at each point
+    xy: List[tuple[float, float]] = field(default_factory=list)
+    along: List[float] = field(default_factory=list)
+    # backward tree, labelled nodes only: node -> (seconds to the goal, slot leaving it); None in time-dependent mode
+    goal: int = -1
+    tree: Optional[dict[int, tuple[float, int]]] = None
+    crowd: dict = field(default_factory=dict)
+    blocked: dict = field(default_factory=dict)
+    counts: dict[str, int] = field(default_factory=lambda: {"progress": 0, "deviation": 0, "replan": 0})
+
+    def progress(self, graph: CompiledStreetGraph, origin: List[float]) -> Optional[RoutingResult]:
+        """The current route trimmed at ``origin``, or None if ``origin`` is off the route."""
+        px, py = graph.node_grid.projection.project(origin[0], origin[1])
+        best, best_index, best_t = INF, 0, 0.0
+        for i in range(len(self.xy) - 1):
+            (ax, ay), (bx, by) = self.xy[i], self.xy[i + 1]
+            dx, dy = bx - ax, by - ay
+            span = dx * dx + dy * dy
+            t = 0.0 if span == 0 else max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / span))
+            distance = math.hypot(ax + t * dx - px, ay + t * dy - py)
+            if distance < best:
+                best, best_index, best_t = distance, i, t
+        if best > settings.WS_ON_ROUTE_METERS:
+            return None
+        polyline = self.result.polyline
+        a, b = polyline[best_index], polyline[best_index + 1]
+        here = [round(a[0] + (b[0] - a[0]) * best_t, 7), round(a[1] + (b[1] - a[1]) * best_t, 7)]
+        total = self.along[-1]
+        walked = self.along[best_index] + (self.along[best_index + 1] - self.along[best_index]) * best_t
+        share = (total - walked) / total if total else 0.0
+        return RoutingResult(
+            polyline=[here, *polyline[best_index + 1:]],
+            eta_seconds=int(max(60, self.result.eta_seconds * share)),
+            bulla_score=self.result.bulla_score,
+            warnings=self.result.warnings,
+            explanation=[*self.result.explanation, "Sigues la ruta: tiempo restante actualizado sin recalcular."],
+            alternatives=[],
+        )
+
+    def reroute(
+        self, graph: CompiledStreetGraph, origin: List[float], route_datetime: datetime, *, avoid_bulla: bool, max_walk_km: float
+    ) -> Optional[RoutingResult]:
+        """Route from ``origin`` read off the backward tree, or None if it does not reach there."""
+        if self.tree is None:
+            return None
+        start = graph.snap(origin[0], origin[1])
+        if start not in self.tree:
+            return None
+        slots: List[int] = []
+        node = start
+        while node != self.goal:
+            slot = self.tree[node][1]
+            slots.append(slot)
+            node = graph.targets[slot]
+        return route_from_slots(
+            graph,
+            slots,
+            self.tree[start][0],
+            route_datetime,
+            start=start,
+            goal=self.goal,
+            avoid_bulla=avoid_bulla,
+            max_walk_km=max_walk_km,
+            explanation=static_explanation(_TREE_LABEL, graph, self.crowd, self.blocked, slots),
+        )
+
+    def follow(self, graph: CompiledStreetGraph, result: RoutingResult) -> None:
+        """Track ``result`` as the route being followed."""
+        self.result = result
+        project = graph.node_grid.projection.project
+        self.xy = [project(lat, lng) for lat, lng in result.polyline]
+        self.along = [0.0]
+        for (ax, ay), (bx, by) in zip(self.xy, self.xy[1:]):
+            self.along.append(self.along[-1] + math.hypot(bx - ax, by - ay))
+
+
+def _version(db: Session, graph: CompiledStreetGraph, route_datetime: datetime, avoid_bulla: bool) -> tuple:
+    """Everything the penalties at ``route_datetime`` depend on."""
+    timeline = get_restriction_timeline(db, graph)
+    blockages = get_procession_blockages(db, graph, route_datetime)
+    # crowd overlays change per bucket; time-dependent costs are built per departure bucket
+    bucket = time_bucket(route_datetime) if avoid_bulla or settings.ROUTING_TIME_DEPENDENT else None
+    return (
+        graph.fingerprint,
+        timeline.shared_epoch_key(route_datetime),
+        blockages.shared_epoch_key(route_datetime),
+        bucket,
+        settings.ROUTING_TIME_DEPENDENT,
+    )
+
+
+def update_route_session(
+    db: Session,
+    session: RouteSession,
+    *,
+    origin: List[float],
+    route_datetime: datetime,
+    target_type: str,
+    target_id: str,
+    avoid_bulla: bool,
+    max_walk_km: float,
+) -> RoutingResult:
+    """Route for a new location of the walker of ``session``, searching only when the session cannot answer."""
+    graph = get_street_graph(db)
+    request = (target_type, target_id, avoid_bulla, max_walk_km)
+    if graph.node_count:
+        version = _version(db, graph, route_datetime, avoid_bulla)
+        if session.result is not None and session.request == request and session.version == version:
+            result = session.progress(graph, origin)
+            if result is not None:
+                session.counts["progress"] += 1
+                return result
+            result = session.reroute(graph, origin, route_datetime, avoid_bulla=avoid_bulla, max_walk_km=max_walk_km)
+            if result is not None:
+                session.counts["deviation"] += 1
+                session.follow(graph, result)
+                return result
+
+    result = calculate_optimal_route(
+        db,
+        origin=origin,
+        destination=None,
+        route_datetime=route_datetime,
+        target_type=target_type,
+        target_id=target_id,
+        avoid_bulla=avoid_bulla,
+        max_walk_km=max_walk_km,
+    )
+    session.counts["replan"] += 1
+    session.request = request
+    if not graph.node_count:
+        # straight-line fallback: nothing to follow
+        session.result = None
+        return result
+    session.version = version
+    session.follow(graph, result)
+    session.tree = None
+    if not settings.ROUTING_TIME_DEPENDENT:
+        _build_tree(db, graph, session, origin, route_datetime, avoid_bulla)
+    return result
+
+
+def _build_tree(
+    db: Session, graph: CompiledStreetGraph, session: RouteSession, origin: List[float], route_datetime: datetime, avoid_bulla: bool
+) -> None:
+    """Backward tree to the route's goal, with the penalties ``calculate_optimal_route`` searched with."""
+    goal = graph.snap(*session.result.polyline[-1])
+    start = graph.snap(origin[0], origin[1])
+    crowd = edge_crowd_penalties(db, graph, route_datetime) if avoid_bulla else {}
+    blocked = get_procession_blockages(db, graph, route_datetime).active_at(route_datetime)
+    penalties = merge_penalties(get_restriction_timeline(db, graph).active_at(route_datetime), crowd, blocked)
+    session.goal, session.crowd, session.blocked = goal, crowd, blocked
+    dist, parents = labelled_tree(
+        graph,
+        goal,
+        reverse=True,
+        penalties=penalties,
+        limit=session.result.eta_seconds * settings.WS_REROUTE_TREE_SLACK,
+        bound=euclidean_heuristic(graph, start),
+    )
+    # a full-size tree per connection would cost megabytes on the metro graph: keep the labelled nodes
+    session.tree = {node: (seconds, parents.get(node, -1)) for node, seconds in dist.items()}
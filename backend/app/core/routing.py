@@ -1,17 +1,30 @@
 import hashlib
+import json
 import math
-from dataclasses import dataclass
-from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import List, Mapping, Optional
 
 from sqlalchemy.orm import Session
 
-from app.models.models import CrowdSignal, Hermandad, RouteRestriction, StreetEdge, StreetNode
+from app.core.restrictions import get_restriction_timeline
+from app.core.config import settings
+from app.core import polyline as polyline_codec
+from app.core.crowd_overlay import edge_crowd_penalties
+from app.core.procession_blockages import get_procession_blockages, procession_blockages_between
+from app.core.route_cache import route_cache, time_bucket
+from app.core.routing_engines import get_routing_engine
+from app.core.routing_workers import distance_table, search_routes, search_routes_timed
+from app.core.shared_cache import get_shared_cache
+from app.core.street_graph import (
+    WALKING_SPEED_MPS,
+    CompiledStreetGraph,
+    get_street_graph,
+)
+from app.core.time_dependent import TimeDependentCosts, get_time_dependent_costs, path_edge_costs
+from app.models.models import Hermandad
 from app.schemas.schemas import RouteAlternative, RouteResponse
 
-WALKING_SPEED_MPS = 1.28
-_CACHE: Dict[str, dict] = {}
-
 
 @dataclass
 class RoutingResult:
@@ -22,20 +35,16 @@ class RoutingResult:
     explanation: List[str]
     alternatives: List[RouteAlternative]
 
+    def to_json(self) -> str:
+        payload = asdict(self)
+        payload["alternatives"] = [alt.model_dump() for alt in self.alternatives]
+        return json.dumps(payload)
 
-def _parse_point_wkt(wkt: str) -> Tuple[float, float]:
-    raw = wkt.strip().replace("POINT(", "").replace(")", "")
-    lng, lat = raw.split()
-    return float(lat), float(lng)
-
-
-def _parse_line_wkt(wkt: str) -> List[List[float]]:
-    inner = wkt.strip().replace("LINESTRING(", "").replace(")", "")
-    coords = []
-    for pair in inner.split(","):
-        lng, lat = pair.strip().split()
-        coords.append([float(lat), float(lng)])
-    return coords
+    @classmethod
+    def from_json(cls, raw: str) -> "RoutingResult":
+        payload = json.loads(raw)
+        payload["alternatives"] = [RouteAlternative(**alt) for alt in payload["alternatives"]]
+        return cls(**payload)
 
 
 def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
@@ -59,93 +68,18 @@ def _target_coords(db: Session, target_type: str, target_id: str) -> Optional[Li
     return [37.389 + jitter * 0.02, -5.995 + jitter * 0.02]
 
 
-def _find_nearest_node(nodes: dict[str, tuple[float, float]], point: List[float]) -> str:
-    return min(nodes, key=lambda nid: haversine_distance(point[0], point[1], nodes[nid][0], nodes[nid][1]))
+def _find_nearest_node(graph: CompiledStreetGraph, point: List[float]) -> int:
+    return graph.snap(point[0], point[1])
 
 
-def _build_graph(db: Session, route_datetime: datetime) -> tuple[dict[str, tuple[float, float]], dict[str, list[tuple[str, float, str]]], str]:
-    nodes_rows = db.query(StreetNode).all()
-    edge_rows = db.query(StreetEdge).filter(StreetEdge.is_walkable.is_(True)).all()
-    restrictions = (
-        db.query(RouteRestriction)
-        .filter(RouteRestriction.starts_at <= route_datetime, RouteRestriction.ends_at >= route_datetime)
-        .all()
-    )
-    penalties = {r.edge_id: r.severity for r in restrictions}
-    restriction_signature = "|".join(sorted(f"{r.edge_id}:{r.severity}" for r in restrictions))
-
-    nodes = {row.id: _parse_point_wkt(str(row.geom)) for row in nodes_rows}
-    graph: dict[str, list[tuple[str, float, str]]] = {nid: [] for nid in nodes}
-    for edge in edge_rows:
-        cost = edge.length_m / WALKING_SPEED_MPS
-        if edge.id in penalties:
-            cost += penalties[edge.id]
-        graph[edge.source_node].append((edge.target_node, cost, edge.id))
-    return nodes, graph, restriction_signature
-
-
-def _reconstruct_path(came_from: dict[str, tuple[str, str]], current: str) -> tuple[list[str], list[str]]:
-    nodes = [current]
-    edges: list[str] = []
-    while current in came_from:
-        prev, edge_id = came_from[current]
-        edges.append(edge_id)
-        current = prev
-        nodes.append(current)
-    nodes.reverse()
-    edges.reverse()
-    return nodes, edges
-
-
-def _astar(
-    nodes: dict[str, tuple[float, float]],
-    graph: dict[str, list[tuple[str, float, str]]],
-    start: str,
-    goal: str,
-) -> tuple[list[str], list[str], float]:
-    import heapq
-
-    queue = [(0.0, start)]
-    g_score = {start: 0.0}
-    came_from: dict[str, tuple[str, str]] = {}
-
-    while queue:
-        _, current = heapq.heappop(queue)
-        if current == goal:
-            node_path, edge_path = _reconstruct_path(came_from, current)
-            return node_path, edge_path, g_score[current]
-
-        for neighbor, cost, edge_id in graph.get(current, []):
-            tentative = g_score[current] + cost
-            if tentative < g_score.get(neighbor, float("inf")):
-                came_from[neighbor] = (current, edge_id)
-                g_score[neighbor] = tentative
-                h = haversine_distance(nodes[neighbor][0], nodes[neighbor][1], nodes[goal][0], nodes[goal][1]) / WALKING_SPEED_MPS
-                heapq.heappush(queue, (tentative + h, neighbor))
-
-    return [start, goal], [], float("inf")
-
-
-def _polyline_from_edges(db: Session, edge_ids: list[str], start: List[float], goal: List[float]) -> List[List[float]]:
-    if not edge_ids:
+def _polyline_from_slots(graph: CompiledStreetGraph, slots: list[int], start: List[float], goal: List[float]) -> List[List[float]]:
+    if not slots:
         return [start, goal]
-    rows = db.query(StreetEdge).filter(StreetEdge.id.in_(edge_ids)).all()
-    by_id = {r.id: r for r in rows}
-    poly: List[List[float]] = []
-    for edge_id in edge_ids:
-        coords = _parse_line_wkt(str(by_id[edge_id].geom))
-        if poly and coords:
-            coords = coords[1:]
-        poly.extend(coords)
-    return _simplify_polyline(poly)
+    return _simplify_polyline(graph.path_polyline(slots))
 
 
 def _simplify_polyline(poly: List[List[float]]) -> List[List[float]]:
-    if len(poly) <= 8:
-        return poly
-    step = max(1, len(poly) // 8)
-    simplified = [poly[0]] + [poly[i] for i in range(step, len(poly) - 1, step)] + [poly[-1]]
-    return simplified
+    return polyline_codec.simplify(poly, settings.ROUTING_POLYLINE_TOLERANCE_M)
 
 
 def _bulla_score(dt: datetime, polyline: List[List[float]]) -> float:
@@ -160,32 +94,71 @@ def _bulla_score(dt: datetime, polyline: List[List[float]]) -> float:
 
 
 
-def _crowd_penalty(db: Session, route_datetime: datetime, polyline: List[List[float]], avoid_bulla: bool) -> tuple[float, list[str]]:
-    if not polyline:
-        return 0.0, []
-    mid = polyline[len(polyline) // 2]
-    geohash = f"{round(mid[0], 3)}:{round(mid[1], 3)}"
-    signal = (
-        db.query(CrowdSignal)
-        .filter(
-            CrowdSignal.geohash == geohash,
-            CrowdSignal.bucket_start <= route_datetime,
-            CrowdSignal.bucket_end >= route_datetime,
-        )
-        .order_by(CrowdSignal.bucket_start.desc())
-        .first()
+def merge_penalties(*overlays: Mapping[int, float]) -> Mapping[int, float]:
+    """Slot -> seconds sum of ``overlays`` (shared, not copied, when only one is non-empty)."""
+    present = [overlay for overlay in overlays if overlay]
+    if len(present) <= 1:
+        return present[0] if present else {}
+    merged = dict(present[0])
+    for overlay in present[1:]:
+        for slot, seconds in overlay.items():
+            merged[slot] = merged.get(slot, 0.0) + seconds
+    return merged
+
+
+def _crowd_explanation(crowd: Mapping[int, float], slots: List[int]) -> list[str]:
+    crowded = [slot for slot in slots if slot in crowd]
+    seconds = sum(crowd[slot] for slot in crowded)
+    if seconds <= 0:
+        return []
+    return [f"Penalty bulla aplicado: +{int(seconds)} s en {len(crowded)} tramos con bulla (incluido al elegir la ruta)."]
+
+
+def _procession_explanation(blocked: Mapping[int, float], slots: List[int]) -> list[str]:
+    if not blocked:
+        return []
+    crossed = sum(1 for slot in slots if slot in blocked)
+    if crossed:
+        return [f"La ruta atraviesa {crossed} tramos ocupados por el paso de una cofradía: no hay alternativa libre."]
+    return [f"Se tuvieron en cuenta {len(blocked)} tramos ocupados por cofradías a esta hora (posición estimada según horarios)."]
+
+
+def _time_dependent_explanation(graph: CompiledStreetGraph, costs: TimeDependentCosts, slots: List[int], depart_at: float) -> list[str]:
+    edge_costs, waited = path_edge_costs(graph, costs, slots, depart_at)
+    penalty = sum(edge_costs) - sum(graph.weights[slot] for slot in slots) - waited
+    explanation = ["Restricciones y bulla evaluadas a la hora estimada de paso por cada calle."]
+    if penalty >= 1:
+        explanation.append(f"Penalizaciones a la hora de paso (restricciones y bulla): +{int(penalty)} s.")
+    if waited >= 1:
+        explanation.append(f"Incluye {max(1, round(waited / 60))} min de espera hasta que se despeje una calle.")
+    return explanation
+
+
+def _cache_key(graph: CompiledStreetGraph, start: int, goal: int, route_datetime: datetime, avoid_bulla: bool, max_walk_km: float, restriction_key: str) -> str:
+    # snapped node ids, not raw coordinates: every request snapping to the same pair shares the entry.
+    # Only content hashes go into the key so that every worker computes the same one.
+    raw = (
+        f"{graph.fingerprint}|{graph.node_ids[start]}|{graph.node_ids[goal]}|{time_bucket(route_datetime).isoformat()}"
+        f"|{avoid_bulla}|{max_walk_km}|{restriction_key}"
     )
-    if not signal:
-        return 0.0, []
+    return "route:" + hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _cached_route(key: str) -> Optional[RoutingResult]:
+    cached = route_cache.get(key)
+    if cached is not None:
+        return cached
+    raw = get_shared_cache().get(key)
+    if raw is None:
+        return None
+    result = RoutingResult.from_json(raw)
+    route_cache.set(key, result)
+    return result
 
-    penalty = (signal.score * signal.confidence * 240.0) if avoid_bulla else 0.0
-    explanation = [f"Penalty bulla aplicado: score={signal.score:.2f}, confidence={signal.confidence:.2f}."] if penalty > 0 else []
-    return penalty, explanation
 
-def _cache_key(origin: List[float], destination: List[float], route_datetime: datetime, avoid_bulla: bool, max_walk_km: float, restriction_signature: str) -> str:
-    bucket = route_datetime.replace(minute=(route_datetime.minute // 10) * 10, second=0, microsecond=0)
-    raw = f"{origin}-{destination}-{bucket.isoformat()}-{avoid_bulla}-{max_walk_km}-{restriction_signature}"
-    return hashlib.sha1(raw.encode()).hexdigest()
+def _store_route(key: str, result: RoutingResult) -> None:
+    route_cache.set(key, result)
+    get_shared_cache().set(key, result.to_json(), settings.ROUTE_CACHE_TTL_SECONDS)
 
 
 def calculate_optimal_route(
@@ -204,12 +177,8 @@ def calculate_optimal_route(
     if destination is None:
         destination = origin
 
-    nodes, graph, restriction_signature = _build_graph(db, route_datetime)
-    key = _cache_key(origin, destination, route_datetime, avoid_bulla, max_walk_km, restriction_signature)
-    if key in _CACHE:
-        payload = _CACHE[key]
-        return RoutingResult(**payload)
-    if not nodes:
+    graph = get_street_graph(db)
+    if not graph.node_count:
         # fallback mínima
         straight_eta = int(max(60, haversine_distance(origin[0], origin[1], destination[0], destination[1]) / WALKING_SPEED_MPS))
         return RoutingResult(
@@ -221,18 +190,111 @@ def calculate_optimal_route(
             alternatives=[],
         )
 
-    start = _find_nearest_node(nodes, origin)
-    goal = _find_nearest_node(nodes, destination)
-    node_path, edge_path, total_cost = _astar(nodes, graph, start, goal)
-    polyline = _polyline_from_edges(db, edge_path, origin, destination)
+    start = _find_nearest_node(graph, origin)
+    goal = _find_nearest_node(graph, destination)
+    timeline = get_restriction_timeline(db, graph)
+    time_dependent = settings.ROUTING_TIME_DEPENDENT
+    if time_dependent:
+        # a time-dependent route depends on the whole timeline ahead, not just the epoch at departure
+        horizon = route_datetime + timedelta(minutes=settings.ROUTING_TIME_DEPENDENT_HORIZON_MINUTES)
+        overlays = [timeline, *procession_blockages_between(db, graph, route_datetime, horizon)]
+        restriction_key = "td:" + ":".join(overlay.fingerprint for overlay in overlays)
+    else:
+        blockages = get_procession_blockages(db, graph, route_datetime)
+        restriction_key = f"{timeline.shared_epoch_key(route_datetime)}|{blockages.shared_epoch_key(route_datetime)}"
+    key = _cache_key(graph, start, goal, route_datetime, avoid_bulla, max_walk_km, restriction_key)
+    cached = _cached_route(key)
+    if cached is not None:
+        return cached
+
+    # crowd penalties go into the search itself, so the path routes around bulla
+    crowd = edge_crowd_penalties(db, graph, route_datetime) if avoid_bulla else {}
+    blocked = {} if time_dependent else blockages.active_at(route_datetime)
+    penalties = merge_penalties(timeline.active_at(route_datetime), crowd, blocked)
+    engine = get_routing_engine()
+    if time_dependent:
+        costs = get_time_dependent_costs(db, graph, overlays, route_datetime, avoid_bulla=avoid_bulla)
+        depart_at = costs.offset(route_datetime)
+        path, alternative_paths = search_routes_timed(graph, start, goal, penalties, costs, depart_at)
+    else:
+        path, alternative_paths = search_routes(graph, start, goal, penalties)
+    slot_path = path.slots
+    start_coords, goal_coords = graph.coords(start), graph.coords(goal)
+
+    alternatives = []
+    for index, alt in enumerate(alternative_paths, start=1):
+        alt_polyline = _polyline_from_slots(graph, alt.slots, start_coords, goal_coords)
+        alt_explanation = [
+            f"Alternativa {index}: +{round((alt.stretch - 1) * 100)}% de tiempo, comparte {round(alt.shared * 100)}% con la ruta principal."
+        ]
+        if alt.stretch > settings.ROUTING_ALTERNATIVE_MAX_STRETCH:
+            alt_explanation.append("Alternativa notablemente más larga: no hay desvíos cercanos a la ruta principal.")
+        alternatives.append(
+            RouteAlternative(
+                polyline=alt_polyline,
+                eta_seconds=int(max(60, alt.cost)),
+                bulla_score=_bulla_score(route_datetime, alt_polyline),
+                explanation=alt_explanation,
+            )
+        )
+
+    if time_dependent:
+        explanation = [
+            f"Ruta calculada con A* dependiente del tiempo sobre grafo real compilado en memoria ({graph.node_count} nodos).",
+            f"Costo peatonal base = length / {WALKING_SPEED_MPS:.2f} m/s.",
+            *_time_dependent_explanation(graph, costs, slot_path, depart_at),
+        ]
+    else:
+        explanation = static_explanation(engine.label, graph, crowd, blocked, slot_path)
+
+    result = route_from_slots(
+        graph,
+        slot_path,
+        path.cost,
+        route_datetime,
+        start=start,
+        goal=goal,
+        avoid_bulla=avoid_bulla,
+        max_walk_km=max_walk_km,
+        explanation=explanation,
+        alternatives=alternatives,
+    )
+    _store_route(key, result)
+    return result
+
+
+def static_explanation(
+    label: str, graph: CompiledStreetGraph, crowd: Mapping[int, float], blocked: Mapping[int, float], slots: List[int]
+) -> List[str]:
+    return [
+        f"Ruta calculada con {label} sobre grafo real compilado en memoria ({graph.node_count} nodos).",
+        f"Costo peatonal base = length / {WALKING_SPEED_MPS:.2f} m/s.",
+        "Se aplicaron penalizaciones por restricciones activas en ventana temporal.",
+        *_crowd_explanation(crowd, slots),
+        *_procession_explanation(blocked, slots),
+    ]
+
+
+def route_from_slots(
+    graph: CompiledStreetGraph,
+    slots: List[int],
+    cost: float,
+    route_datetime: datetime,
+    *,
+    start: int,
+    goal: int,
+    avoid_bulla: bool,
+    max_walk_km: float,
+    explanation: List[str],
+    alternatives: Optional[List[RouteAlternative]] = None,
+) -> RoutingResult:
+    """Result for a path of ``slots`` from ``start`` to ``goal`` costing ``cost`` seconds."""
+    polyline = _polyline_from_slots(graph, slots, graph.coords(start), graph.coords(goal))
 
     total_distance = 0.0
     for i in range(len(polyline) - 1):
         total_distance += haversine_distance(polyline[i][0], polyline[i][1], polyline[i + 1][0], polyline[i + 1][1])
-    eta_seconds = int(max(60, total_cost if total_cost != float("inf") else total_distance / WALKING_SPEED_MPS))
-
-    crowd_penalty_seconds, crowd_explanation = _crowd_penalty(db, route_datetime, polyline, avoid_bulla)
-    eta_seconds += int(crowd_penalty_seconds)
+    eta_seconds = int(max(60, cost if cost != float("inf") else total_distance / WALKING_SPEED_MPS))
 
     warnings: List[str] = []
     if total_distance > max_walk_km * 1000:
@@ -242,48 +304,71 @@ def calculate_optimal_route(
     if avoid_bulla and bulla > 0.75:
         warnings.append("Ruta con bulla alta estimada")
 
-    # simple alternative: direct destination through nearest origin edge (no restrictions)
-    alt_eta = int(max(60, total_distance / WALKING_SPEED_MPS * 1.1))
-    alternatives = [
-        RouteAlternative(
-            polyline=[origin, destination],
-            eta_seconds=alt_eta,
-            explanation=["Alternativa directa (menos puntos, puede ignorar cortes)."],
-        )
-    ]
-
-    explanation = [
-        f"Ruta calculada con A* sobre grafo real cargado en DB ({len(nodes)} nodos).",
-        f"Costo peatonal base = length / {WALKING_SPEED_MPS:.2f} m/s.",
-        "Se aplicaron penalizaciones por restricciones activas en ventana temporal.",
-        *crowd_explanation,
-    ]
-
-    result = RoutingResult(
+    return RoutingResult(
         polyline=polyline,
         eta_seconds=eta_seconds,
         bulla_score=bulla,
         warnings=warnings,
         explanation=explanation,
-        alternatives=alternatives,
+        alternatives=alternatives or [],
     )
-    _CACHE[key] = {
-        "polyline": result.polyline,
-        "eta_seconds": result.eta_seconds,
-        "bulla_score": result.bulla_score,
-        "warnings": result.warnings,
-        "explanation": result.explanation,
-        "alternatives": result.alternatives,
-    }
-    return result
 
 
-def as_route_response(result: RoutingResult) -> RouteResponse:
+@dataclass
+class EtaMatrixResult:
+    eta_seconds: List[List[Optional[int]]]
+    warnings: List[str]
+
+
+def calculate_eta_matrix(
+    db: Session,
+    *,
+    origins: List[List[float]],
+    destinations: Optional[List[List[float]]],
+    route_datetime: datetime,
+) -> EtaMatrixResult:
+    """Walking seconds between every origin and destination in a single engine call."""
+    if destinations is None:
+        destinations = origins
+    graph = get_street_graph(db)
+    if not graph.node_count:
+        return EtaMatrixResult(
+            eta_seconds=[
+                [int(haversine_distance(o[0], o[1], d[0], d[1]) / WALKING_SPEED_MPS) for d in destinations]
+                for o in origins
+            ],
+            warnings=["No street graph loaded. Using straight-line fallback."],
+        )
+
+    sources = [_find_nearest_node(graph, point) for point in origins]
+    targets = [_find_nearest_node(graph, point) for point in destinations]
+    penalties = dict(get_restriction_timeline(db, graph).active_at(route_datetime))
+    for slot, seconds in get_procession_blockages(db, graph, route_datetime).active_at(route_datetime).items():
+        penalties[slot] = penalties.get(slot, 0.0) + seconds
+    table = distance_table(graph, sources, targets, penalties)
+    eta_seconds = [[int(cost) if cost != float("inf") else None for cost in row] for row in table]
+    warnings = []
+    if any(cost is None for row in eta_seconds for cost in row):
+        warnings.append("Algunos puntos no están conectados en el grafo peatonal.")
+    return EtaMatrixResult(eta_seconds=eta_seconds, warnings=warnings)
+
+
+def as_route_response(result: RoutingResult, polyline_format: str = "coordinates") -> RouteResponse:
+    """API view of ``result``; ``polyline_format="encoded"`` ships encoded polylines instead of coordinates."""
+    alternatives = result.alternatives
+    polyline, encoded = result.polyline, None
+    if polyline_format == "encoded":
+        polyline, encoded = [], polyline_codec.encode(result.polyline)
+        alternatives = [
+            alt.model_copy(update={"polyline": [], "encoded_polyline": polyline_codec.encode(alt.polyline)})
+            for alt in result.alternatives
+        ]
     return RouteResponse(
-        polyline=result.polyline,
+        polyline=polyline,
+        encoded_polyline=encoded,
         eta_seconds=result.eta_seconds,
         bulla_score=result.bulla_score,
         warnings=result.warnings,
         explanation=result.explanation,
-        alternatives=result.alternatives,
+        alternatives=alternatives,
     )
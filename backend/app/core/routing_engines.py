@@ -0,0 +1,485 @@
+"""Pluggable shortest-path engines over the compiled street graph.
+
+Every engine answers ``find_path(graph, start, goal, penalties)`` where
+``penalties`` maps CSR slots to extra seconds (restriction overlay) and edge
+costs are ``graph.weights[slot] + penalties.get(slot, 0)``. The engine used by
+the router is chosen with ``ROUTING_ENGINE``:
+
+- ``astar``: unidirectional A* with a projected euclidean heuristic.
+- ``bidirectional``: bidirectional A* with average (consistent) potentials.
+- ``alt``: A* with landmark lower bounds (ALT), precomputed once per graph.
+- ``ch``: customizable contraction hierarchy (see :mod:`app.core.contraction`),
+  read from ``ROUTING_CH_PATH`` when it matches the loaded graph.
+"""
+from __future__ import annotations
+
+import heapq
+import math
+import threading
+from array import array
+from dataclasses import dataclass
+from typing import Callable, Mapping, Optional
+
+from app.core.config import settings
+from app.core.contraction import ContractionHierarchy, MetricCache, load_or_build_hierarchy
+from app.core.street_graph import WALKING_SPEED_MPS, CompiledStreetGraph
+
+INF = float("inf")
+_NO_PENALTIES: Mapping[int, float] = {}
+
+
+@dataclass
+class PathResult:
+    nodes: list[int]
+    slots: list[int]
+    cost: float
+    # nodes taken off the priority queue(s); the usual measure of search effort
+    settled: int
+
+    @property
+    def found(self) -> bool:
+        return self.cost != INF
+
+
+def unreachable(start: int, goal: int, settled: int) -> PathResult:
+    return PathResult(nodes=[start, goal], slots=[], cost=INF, settled=settled)
+
+
+def walk_back(came_from: dict[int, tuple[int, int]], node: int) -> tuple[list[int], list[int]]:
+    nodes = [node]
+    slots: list[int] = []
+    while node in came_from:
+        node, slot = came_from[node]
+        slots.append(slot)
+        nodes.append(node)
+    nodes.reverse()
+    slots.reverse()
+    return nodes, slots
+
+
+def euclidean_heuristic(graph: CompiledStreetGraph, goal: int) -> Callable[[int], float]:
+    xs, ys = graph.xs, graph.ys
+    gx, gy = xs[goal], ys[goal]
+    return lambda node: math.hypot(xs[node] - gx, ys[node] - gy) / WALKING_SPEED_MPS
+
+
+def shortest_path_tree(
+    graph: CompiledStreetGraph,
+    source: int,
+    *,
+    reverse: bool = False,
+    penalties: Mapping[int, float] = _NO_PENALTIES,
+    limit: float = INF,
+    bound: Optional[Callable[[int], float]] = None,
+) -> tuple[array, array]:
+    """Walking seconds from ``source`` (to ``source`` when ``reverse``) and the tree slot of every node.
+
+    ``parents[v]`` is the slot entering ``v`` (leaving ``v`` when ``reverse``), -1 at the root
+    and for nodes beyond ``limit``. With ``bound`` (a lower bound on the remaining cost from
+    ``v``), nodes whose ``dist + bound`` exceeds ``limit`` are not labelled either.
+    """
+    dist = array("d", [INF]) * graph.node_count
+    parents = array("l", [-1]) * graph.node_count
+    dist[source] = 0.0
+    queue = [(0.0, source)]
+    weights = graph.weights
+    if reverse:
+        offsets, slots_of, ends = graph.in_offsets, graph.in_slots, graph.sources
+    else:
+        offsets, slots_of, ends = graph.offsets, None, graph.targets
+    while queue:
+        d, u = heapq.heappop(queue)
+        if d > dist[u]:
+            continue
+        for i in range(offsets[u], offsets[u + 1]):
+            slot = slots_of[i] if slots_of is not None else i
+            nd = d + weights[slot] + penalties.get(slot, 0.0)
+            if nd <= limit:
+                v = ends[slot]
+                if nd < dist[v] and (bound is None or nd + bound(v) <= limit):
+                    dist[v] = nd
+                    parents[v] = slot
+                    heapq.heappush(queue, (nd, v))
+    return dist, parents
+
+
+def labelled_tree(
+    graph: CompiledStreetGraph,
+    source: int,
+    *,
+    reverse: bool = False,
+    penalties: Mapping[int, float] = _NO_PENALTIES,
+    limit: float = INF,
+    bound: Optional[Callable[[int], float]] = None,
+) -> tuple[dict[int, float], dict[int, int]]:
+    """:func:`shortest_path_tree` keyed by the labelled nodes only.
+
+    Bounded searches touch a small part of the metro graph; this keeps their cost (and
+    the cost of walking their result) proportional to the search space, not to
+    ``graph.node_count``. The root has a distance but no parent slot.
+    """
+    dist = {source: 0.0}
+    parents: dict[int, int] = {}
+    queue = [(0.0, source)]
+    weights = graph.weights
+    if reverse:
+        offsets, slots_of, ends = graph.in_offsets, graph.in_slots, graph.sources
+    else:
+        offsets, slots_of, ends = graph.offsets, None, graph.targets
+    while queue:
+        d, u = heapq.heappop(queue)
+        if d > dist[u]:
+            continue
+        for i in range(offsets[u], offsets[u + 1]):
+            slot = slots_of[i] if slots_of is not None else i
+            nd = d + weights[slot] + penalties.get(slot, 0.0)
+            if nd <= limit:
+                v = ends[slot]
+                if nd < dist.get(v, INF) and (bound is None or nd + bound(v) <= limit):
+                    dist[v] = nd
+                    parents[v] = slot
+                    heapq.heappush(queue, (nd, v))
+    return dist, parents
+
+
+def dijkstra_distances(
+    graph: CompiledStreetGraph,
+    source: int,
+    *,
+    reverse: bool = False,
+    penalties: Mapping[int, float] = _NO_PENALTIES,
+    limit: float = INF,
+) -> array:
+    """One-to-all walking seconds from ``source`` (to ``source`` when ``reverse``), bounded by ``limit``."""
+    return shortest_path_tree(graph, source, reverse=reverse, penalties=penalties, limit=limit)[0]
+
+
+def one_to_many(
+    graph: CompiledStreetGraph,
+    source: int,
+    targets: list[int],
+    *,
+    reverse: bool = False,
+    penalties: Mapping[int, float] = _NO_PENALTIES,
+) -> array:
+    """Seconds from ``source`` to each of ``targets`` (from each target when ``reverse``).
+
+    Dijkstra stops as soon as every target is settled.
+    """
+    pending = set(targets)
+    settled: dict[int, float] = {}
+    dist = {source: 0.0}
+    queue = [(0.0, source)]
+    weights = graph.weights
+    if reverse:
+        offsets, slots_of, ends = graph.in_offsets, graph.in_slots, graph.sources
+    else:
+        offsets, slots_of, ends = graph.offsets, None, graph.targets
+    while queue and pending:
+        d, u = heapq.heappop(queue)
+        if d > dist[u]:
+            continue
+        if u in pending:
+            pending.discard(u)
+            settled[u] = d
+        for i in range(offsets[u], offsets[u + 1]):
+            slot = slots_of[i] if slots_of is not None else i
+            nd = d + weights[slot] + penalties.get(slot, 0.0)
+            v = ends[slot]
+            if nd < dist.get(v, INF):
+                dist[v] = nd
+                heapq.heappush(queue, (nd, v))
+    return array("d", [settled.get(target, INF) for target in targets])
+
+
+def astar_search(
+    graph: CompiledStreetGraph,
+    start: int,
+    goal: int,
+    penalties: Mapping[int, float],
+    heuristic: Callable[[int], float],
+) -> PathResult:
+    offsets, targets, weights = graph.offsets, graph.targets, graph.weights
+    g_score = {start: 0.0}
+    h_cache: dict[int, float] = {}
+    came_from: dict[int, tuple[int, int]] = {}
+    queue = [(heuristic(start), 0.0, start)]
+    settled = 0
+
+    while queue:
+        _, g, current = heapq.heappop(queue)
+        if g > g_score[current]:
+            continue
+        settled += 1
+        if current == goal:
+            nodes, slots = walk_back(came_from, current)
+            return PathResult(nodes=nodes, slots=slots, cost=g, settled=settled)
+
+        for slot in range(offsets[current], offsets[current + 1]):
+            neighbor = targets[slot]
+            tentative = g + weights[slot] + penalties.get(slot, 0.0)
+            if tentative < g_score.get(neighbor, INF):
+                came_from[neighbor] = (current, slot)
+                g_score[neighbor] = tentative
+                h = h_cache.get(neighbor)
+                if h is None:
+                    h = h_cache[neighbor] = heuristic(neighbor)
+                heapq.heappush(queue, (tentative + h, tentative, neighbor))
+
+    return unreachable(start, goal, settled)
+
+
+class RoutingEngine:
+    name = "base"
+    label = "A*"
+
+    def prepare(self, graph: CompiledStreetGraph) -> None:
+        """Run per-graph preprocessing ahead of the first query (no-op by default)."""
+
+    def find_path(
+        self, graph: CompiledStreetGraph, start: int, goal: int, penalties: Mapping[int, float] = _NO_PENALTIES
+    ) -> PathResult:
+        raise NotImplementedError
+
+    def distance_table(
+        self,
+        graph: CompiledStreetGraph,
+        sources: list[int],
+        targets: list[int],
+        penalties: Mapping[int, float] = _NO_PENALTIES,
+    ) -> list[array]:
+        """``table[i][j]`` = seconds from ``sources[i]`` to ``targets[j]``.
+
+        Runs one pruned Dijkstra per distinct node on the smaller side (backwards
+        when there are fewer targets than sources).
+        """
+        if len(set(targets)) < len(set(sources)):
+            by_target = {t: one_to_many(graph, t, sources, reverse=True, penalties=penalties) for t in set(targets)}
+            return [array("d", [by_target[t][i] for t in targets]) for i in range(len(sources))]
+        by_source = {s: one_to_many(graph, s, targets, penalties=penalties) for s in set(sources)}
+        return [array("d", by_source[s]) for s in sources]
+
+
+class AStarEngine(RoutingEngine):
+    name = "astar"
+    label = "A*"
+
+    def find_path(self, graph, start, goal, penalties=_NO_PENALTIES):
+        return astar_search(graph, start, goal, penalties, euclidean_heuristic(graph, goal))
+
+
+class BidirectionalAStarEngine(RoutingEngine):
+    """Bidirectional A* with average potentials ``p(v) = (h_goal(v) - h_start(v)) / 2``.
+
+    Both searches then run Dijkstra on the same non-negative reduced costs, so
+    the search can stop as soon as ``top_forward + top_backward >= best``.
+    """
+
+    name = "bidirectional"
+    label = "A* bidireccional"
+
+    def find_path(self, graph, start, goal, penalties=_NO_PENALTIES):
+        if start == goal:
+            return PathResult(nodes=[start], slots=[], cost=0.0, settled=1)
+        xs, ys = graph.xs, graph.ys
+        sx, sy, tx, ty = xs[start], ys[start], xs[goal], ys[goal]
+        potential_cache: dict[int, float] = {}
+
+        def potential(node: int) -> float:
+            p = potential_cache.get(node)
+            if p is None:
+                to_goal = math.hypot(xs[node] - tx, ys[node] - ty)
+                from_start = math.hypot(xs[node] - sx, ys[node] - sy)
+                p = potential_cache[node] = (to_goal - from_start) / (2 * WALKING_SPEED_MPS)
+            return p
+
+        offsets, targets, sources, weights = graph.offsets, graph.targets, graph.sources, graph.weights
+        in_offsets, in_slots = graph.in_offsets, graph.in_slots
+        g_fwd = {start: 0.0}
+        g_bwd = {goal: 0.0}
+        prev_fwd: dict[int, tuple[int, int]] = {}
+        next_bwd: dict[int, tuple[int, int]] = {}
+        queue_fwd = [(potential(start), 0.0, start)]
+        queue_bwd = [(-potential(goal), 0.0, goal)]
+        best = INF
+        meeting: Optional[int] = None
+        settled = 0
+
+        while queue_fwd and queue_bwd:
+            if queue_fwd[0][0] + queue_bwd[0][0] >= best:
+                break
+            if queue_fwd[0][0] <= queue_bwd[0][0]:
+                _, g, u = heapq.heappop(queue_fwd)
+                if g > g_fwd[u]:
+                    continue
+                settled += 1
+                for slot in range(offsets[u], offsets[u + 1]):
+                    v = targets[slot]
+                    tentative = g + weights[slot] + penalties.get(slot, 0.0)
+                    if tentative < g_fwd.get(v, INF):
+                        g_fwd[v] = tentative
+                        prev_fwd[v] = (u, slot)
+                        heapq.heappush(queue_fwd, (tentative + potential(v), tentative, v))
+                        if v in g_bwd and tentative + g_bwd[v] < best:
+                            best = tentative + g_bwd[v]
+                            meeting = v
+            else:
+                _, g, u = heapq.heappop(queue_bwd)
+                if g > g_bwd[u]:
+                    continue
+                settled += 1
+                for i in range(in_offsets[u], in_offsets[u + 1]):
+                    slot = in_slots[i]
+                    v = sources[slot]
+                    tentative = g + weights[slot] + penalties.get(slot, 0.0)
+                    if tentative < g_bwd.get(v, INF):
+                        g_bwd[v] = tentative
+                        next_bwd[v] = (u, slot)
+                        heapq.heappush(queue_bwd, (tentative - potential(v), tentative, v))
+                        if v in g_fwd and tentative + g_fwd[v] < best:
+                            best = tentative + g_fwd[v]
+                            meeting = v
+
+        if meeting is None:
+            return unreachable(start, goal, settled)
+        nodes, slots = walk_back(prev_fwd, meeting)
+        node = meeting
+        while node in next_bwd:
+            node, slot = next_bwd[node]
+            slots.append(slot)
+            nodes.append(node)
+        return PathResult(nodes=nodes, slots=slots, cost=best, settled=settled)
+
+
+@dataclass
+class LandmarkTables:
+    landmarks: list[int]
+    # from_landmark[i][v] = d(L_i, v); to_landmark[i][v] = d(v, L_i), base costs without penalties
+    from_landmark: list[array]
+    to_landmark: list[array]
+
+
+def select_landmarks(graph: CompiledStreetGraph, count: int) -> LandmarkTables:
+    """Farthest-landmark selection: each new landmark maximises its distance to the chosen ones."""
+    tables = LandmarkTables(landmarks=[], from_landmark=[], to_landmark=[])
+    if not graph.node_count:
+        return tables
+    cx = sum(graph.xs) / graph.node_count
+    cy = sum(graph.ys) / graph.node_count
+    candidate = max(range(graph.node_count), key=lambda v: math.hypot(graph.xs[v] - cx, graph.ys[v] - cy))
+    closest = array("d", [INF]) * graph.node_count
+    for _ in range(min(count, graph.node_count)):
+        tables.landmarks.append(candidate)
+        forward = dijkstra_distances(graph, candidate)
+        backward = dijkstra_distances(graph, candidate, reverse=True)
+        tables.from_landmark.append(forward)
+        tables.to_landmark.append(backward)
+        for v in range(graph.node_count):
+            d = min(forward[v], backward[v])
+            if d < closest[v]:
+                closest[v] = d
+        candidate = max(range(graph.node_count), key=lambda v: closest[v] if closest[v] != INF else -1.0)
+        if closest[candidate] in (0.0, INF) or candidate in tables.landmarks:
+            break
+    return tables
+
+
+class ALTEngine(RoutingEngine):
+    name = "alt"
+    label = "A* con landmarks (ALT)"
+
+    def __init__(self, landmark_count: Optional[int] = None):
+        self.landmark_count = landmark_count or settings.ROUTING_ALT_LANDMARKS
+        self._prepared: Optional[tuple[str, LandmarkTables]] = None
+        self._lock = threading.Lock()
+
+    def prepare(self, graph: CompiledStreetGraph) -> LandmarkTables:
+        prepared = self._prepared
+        if prepared is not None and prepared[0] == graph.fingerprint:
+            return prepared[1]
+        with self._lock:
+            if self._prepared is None or self._prepared[0] != graph.fingerprint:
+                self._prepared = (graph.fingerprint, select_landmarks(graph, self.landmark_count))
+            return self._prepared[1]
+
+    def heuristic(self, graph: CompiledStreetGraph, goal: int) -> Callable[[int], float]:
+        tables = self.prepare(graph)
+        euclid = euclidean_heuristic(graph, goal)
+        # lower bounds from the triangle inequality, per landmark, pre-bound to the goal
+        bounds = [
+            (frm, to, frm[goal], to[goal])
+            for frm, to in zip(tables.from_landmark, tables.to_landmark)
+        ]
+
+        def h(node: int) -> float:
+            best = euclid(node)
+            for frm, to, frm_goal, to_goal in bounds:
+                to_node = to[node]
+                if to_node != INF and to_goal != INF and to_node - to_goal > best:
+                    best = to_node - to_goal
+                frm_node = frm[node]
+                if frm_goal != INF and frm_node != INF and frm_goal - frm_node > best:
+                    best = frm_goal - frm_node
+            return best
+
+        return h
+
+    def find_path(self, graph, start, goal, penalties=_NO_PENALTIES):
+        return astar_search(graph, start, goal, penalties, self.heuristic(graph, goal))
+
+
+class ContractionHierarchyEngine(RoutingEngine):
+    """Bidirectional upward search over a CCH; penalties are applied by re-customization."""
+
+    name = "ch"
+    label = "contraction hierarchies (CCH)"
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path if path is not None else settings.ROUTING_CH_PATH
+        self._hierarchy: Optional[ContractionHierarchy] = None
+        self._metrics = MetricCache()
+        self._lock = threading.Lock()
+
+    def prepare(self, graph: CompiledStreetGraph) -> ContractionHierarchy:
+        hierarchy = self._hierarchy
+        if hierarchy is not None and hierarchy.fingerprint == graph.fingerprint:
+            return hierarchy
+        with self._lock:
+            if self._hierarchy is None or self._hierarchy.fingerprint != graph.fingerprint:
+                # a weights-only change (patched import) re-customizes instead of re-contracting
+                self._hierarchy = load_or_build_hierarchy(graph, self.path, self._hierarchy)
+                self._metrics.clear()
+            return self._hierarchy
+
+    def find_path(self, graph, start, goal, penalties=_NO_PENALTIES):
+        hierarchy = self.prepare(graph)
+        metric = self._metrics.get(hierarchy, graph, penalties)
+        cost, slots, settled = hierarchy.query(metric, start, goal)
+        if cost == INF:
+            return unreachable(start, goal, settled)
+        nodes = [start] + [graph.targets[slot] for slot in slots]
+        return PathResult(nodes=nodes, slots=slots, cost=cost, settled=settled)
+
+    def distance_table(self, graph, sources, targets, penalties=_NO_PENALTIES):
+        hierarchy = self.prepare(graph)
+        return hierarchy.many_to_many(self._metrics.get(hierarchy, graph, penalties), sources, targets)
+
+
+ENGINES: dict[str, type[RoutingEngine]] = {
+    AStarEngine.name: AStarEngine,
+    BidirectionalAStarEngine.name: BidirectionalAStarEngine,
+    ALTEngine.name: ALTEngine,
+    ContractionHierarchyEngine.name: ContractionHierarchyEngine,
+}
+
+_engine: Optional[RoutingEngine] = None
+
+
+def get_routing_engine() -> RoutingEngine:
+    global _engine
+    if _engine is None or _engine.name != settings.ROUTING_ENGINE:
+        try:
+            _engine = ENGINES[settings.ROUTING_ENGINE]()
+        except KeyError:
+            raise ValueError(f"Unknown ROUTING_ENGINE '{settings.ROUTING_ENGINE}', expected one of {sorted(ENGINES)}")
+    return _engine
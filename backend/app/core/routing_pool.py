@@ -0,0 +1,107 @@
+"""Bounded worker pool for CPU-bound routing work.
+
+Route computation (graph search plus a synchronous SQLAlchemy session) runs on
+a dedicated thread pool so the event loop keeps serving other requests and
+WebSocket clients. At most ``ROUTING_POOL_WORKERS`` jobs run at once and
+``ROUTING_POOL_QUEUE_DEPTH`` more may wait; beyond that :meth:`RoutingPool.run`
+raises :class:`RoutingPoolSaturated` immediately instead of queueing without
+bound, and the API answers 503.
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+from app.core.config import settings
+
+T = TypeVar("T")
+
+
+class RoutingPoolSaturated(Exception):
+    pass
+
+
+class RoutingPool:
+    def __init__(self, workers: int, queue_depth: int):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="routing")
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.queue_depth
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        with self._lock:
+            if self.in_flight >= self.capacity:
+                self.rejected += 1
+                raise RoutingPoolSaturated(f"routing pool saturated ({self.in_flight} jobs in flight)")
+            self.in_flight += 1
+        try:
+            future = self._executor.submit(functools.partial(func, *args, **kwargs))
+        except BaseException:
+            self._release(None)
+            raise
+        # a cancelled caller stops waiting but the thread keeps working: the slot is freed when the job is done
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    async def run_to_completion(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Like :meth:`run`, but a cancelled caller still waits for the job before it is cancelled.
+
+        For jobs that borrow a request-scoped ``Session``: the request closes it once the
+        caller returns, and a Session must not be closed under a thread still using it.
+        """
+        job = asyncio.ensure_future(self.run(func, *args, **kwargs))
+        try:
+            return await asyncio.shield(job)
+        except asyncio.CancelledError:
+            await asyncio.gather(job, return_exceptions=True)
+            raise
+
+    def _release(self, future: Optional[Future]) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            if future is not None and not future.cancelled():
+                self.completed += 1
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_depth": self.queue_depth,
+                "in_flight": self.in_flight,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pool: Optional[RoutingPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_routing_pool() -> RoutingPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = RoutingPool(settings.ROUTING_POOL_WORKERS, settings.ROUTING_POOL_QUEUE_DEPTH)
+    return _pool
+
+
+def shutdown_routing_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
@@ -0,0 +1,361 @@
+"""Route searches, optionally answered by a pool of worker processes.
+
+Pure-Python search is bound by the GIL, so threads alone cannot spread routing
+over several cores. With ``ROUTING_PROCESSES > 0`` the compiled graph is packed
+once into a ``SharedMemory`` block (see :mod:`app.core.packed_graph`) and that
+many spawned processes attach to it zero-copy, each with its own prepared
+engine. Request threads keep snapping, DB access and polylines, and only ship
+node ids plus the penalty overlay to a worker, which returns the main path and
+its alternatives. Time-dependent profiles are pickled once per cache key and
+each worker keeps the last few by key, so a query only carries the key unless
+the worker has not seen those profiles yet.
+
+When the graph is reloaded (new fingerprint) the block is republished and the
+workers restarted on the next query.
+"""
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import multiprocessing.util
+import pickle
+import threading
+from collections import OrderedDict
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable, Mapping, Optional
+
+from app.core.config import settings
+from app.core.packed_graph import PackedStreetGraph, pack_graph, packed_size
+from app.core.route_alternatives import AlternativePath, find_alternatives
+from app.core.routing_engines import PathResult, RoutingEngine, get_routing_engine
+from app.core.street_graph import CompiledStreetGraph
+from app.core.time_dependent import TimeDependentCosts, path_edge_costs, time_dependent_search
+
+logger = logging.getLogger(__name__)
+
+RouteSearch = tuple[PathResult, list[AlternativePath]]
+
+# time-dependent profiles kept per worker (and pickled ones in the API process)
+_COSTS_KEPT = 16
+
+
+def _search(graph, engine: RoutingEngine, start: int, goal: int, penalties: Mapping[int, float]) -> RouteSearch:
+    path = engine.find_path(graph, start, goal, penalties)
+    alternatives = find_alternatives(
+        graph,
+        path,
+        penalties,
+        max_count=settings.ROUTING_ALTERNATIVES,
+        max_stretch=settings.ROUTING_ALTERNATIVE_MAX_STRETCH,
+        max_share=settings.ROUTING_ALTERNATIVE_MAX_SHARE,
+        engine=engine,
+    )
+    return path, alternatives
+
+
+def _search_timed(
+    graph,
+    engine: RoutingEngine,
+    start: int,
+    goal: int,
+    penalties: Mapping[int, float],
+    costs: TimeDependentCosts,
+    depart_at: float,
+) -> RouteSearch:
+    """Time-dependent main path; alternatives come from the static search and are re-timed."""
+    path = time_dependent_search(graph, start, goal, costs, depart_at)
+    if not path.found:
+        return path, []
+    static, static_alternatives = _search(graph, engine, start, goal, penalties)
+    main_costs, _ = path_edge_costs(graph, costs, path.slots, depart_at)
+    alternatives: list[AlternativePath] = []
+    seen = {tuple(path.slots)}
+    for candidate in [static, *static_alternatives] if static.found else []:
+        if tuple(candidate.slots) in seen:
+            continue
+        seen.add(tuple(candidate.slots))
+        edge_costs, _ = path_edge_costs(graph, costs, candidate.slots, depart_at)
+        cost = sum(edge_costs)
+        candidate_slots = set(candidate.slots)
+        shared = sum(c for slot, c in zip(path.slots, main_costs) if slot in candidate_slots)
+        alternatives.append(
+            AlternativePath(
+                nodes=candidate.nodes,
+                slots=candidate.slots,
+                cost=cost,
+                stretch=cost / path.cost if path.cost else 1.0,
+                shared=shared / path.cost if path.cost else 1.0,
+            )
+        )
+    alternatives.sort(key=lambda alt: alt.cost)
+    return path, alternatives[: settings.ROUTING_ALTERNATIVES]
+
+
+# --- worker process side -------------------------------------------------------------------------
+
+_worker_shm: Optional[SharedMemory] = None
+_worker_graph: Optional[PackedStreetGraph] = None
+_worker_costs: OrderedDict[tuple, TimeDependentCosts] = OrderedDict()
+
+
+class CostsNotLoaded(Exception):
+    """The worker has no profiles for the key it was sent; the caller resends them."""
+
+
+def _init_worker(shm_name: str) -> None:
+    global _worker_shm, _worker_graph
+    _worker_shm = SharedMemory(name=shm_name)
+    _worker_graph = PackedStreetGraph.from_buffer(_worker_shm.buf)
+    # the views must go before the mapping, or closing it at exit raises BufferError
+    multiprocessing.util.Finalize(None, _close_worker, exitpriority=10)
+    get_routing_engine().prepare(_worker_graph)
+
+
+def _close_worker() -> None:
+    global _worker_shm, _worker_graph
+    if _worker_graph is not None:
+        _worker_graph.release()
+    if _worker_shm is not None:
+        _worker_shm.close()
+    _worker_shm, _worker_graph = None, None
+
+
+def _worker_graph_for(fingerprint: str) -> PackedStreetGraph:
+    graph = _worker_graph
+    if graph is None or graph.fingerprint != fingerprint:
+        raise RuntimeError(f"routing worker holds a different street graph than {fingerprint}")
+    return graph
+
+
+def _worker_ping() -> str:
+    return _worker_graph.fingerprint if _worker_graph is not None else ""
+
+
+def _worker_search(fingerprint: str, start: int, goal: int, penalties: dict[int, float]) -> RouteSearch:
+    return _search(_worker_graph_for(fingerprint), get_routing_engine(), start, goal, penalties)
+
+
+def _worker_costs_for(key: tuple, blob: Optional[bytes]) -> TimeDependentCosts:
+    if blob is None:
+        costs = _worker_costs.get(key)
+        if costs is None:
+            raise CostsNotLoaded(key)
+        _worker_costs.move_to_end(key)
+        return costs
+    costs = pickle.loads(blob)
+    if key:
+        _worker_costs[key] = costs
+        while len(_worker_costs) > _COSTS_KEPT:
+            _worker_costs.popitem(last=False)
+    return costs
+
+
+def _worker_search_timed(
+    fingerprint: str,
+    start: int,
+    goal: int,
+    penalties: dict[int, float],
+    costs_key: tuple,
+    costs_blob: Optional[bytes],
+    depart_at: float,
+) -> RouteSearch:
+    costs = _worker_costs_for(costs_key, costs_blob)
+    return _search_timed(
+        _worker_graph_for(fingerprint), get_routing_engine(), start, goal, penalties, costs, depart_at
+    )
+
+
+def _worker_distance_table(
+    fingerprint: str, sources: list[int], targets: list[int], penalties: dict[int, float]
+) -> list[array]:
+    return get_routing_engine().distance_table(_worker_graph_for(fingerprint), sources, targets, penalties)
+
+
+# --- API process side ----------------------------------------------------------------------------
+
+
+class RoutingProcessPool:
+    """Worker processes searching one shared-memory copy of the street graph."""
+
+    def __init__(self, processes: int):
+        self.processes = processes
+        self._lock = threading.Lock()
+        self._shm: Optional[SharedMemory] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._fingerprint: Optional[str] = None
+        self._costs_blobs: OrderedDict[tuple, bytes] = OrderedDict()
+
+    def publish(self, graph: CompiledStreetGraph) -> ProcessPoolExecutor:
+        """Pack ``graph`` into shared memory and (re)start the workers on it."""
+        with self._lock:
+            if self._executor is not None and self._fingerprint == graph.fingerprint:
+                return self._executor
+            shm = SharedMemory(create=True, size=packed_size(graph))
+            pack_graph(graph, shm.buf)
+            executor = ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(shm.name,),
+            )
+            self._retire()
+            self._shm, self._executor, self._fingerprint = shm, executor, graph.fingerprint
+            logger.info(
+                "Street graph published to %s routing processes (%.1f MB shared)", self.processes, shm.size / 1e6
+            )
+            return executor
+
+    def warm(self) -> None:
+        """Spawn the workers now instead of on the first queries."""
+        if self._executor is not None:
+            for future in [self._executor.submit(_worker_ping) for _ in range(self.processes)]:
+                future.result()
+
+    def _current(self, graph: CompiledStreetGraph) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is not None and self._fingerprint == graph.fingerprint:
+                return self._executor
+        return self.publish(graph)
+
+    def _call(self, graph: CompiledStreetGraph, func: Callable[..., Any], *args: Any) -> Any:
+        executor = self._current(graph)
+        try:
+            return executor.submit(func, graph.fingerprint, *args).result()
+        except RuntimeError as exc:
+            # BrokenProcessPool: a worker died (OOM, signal). Other RuntimeErrors are retried only
+            # when another thread retired this executor meanwhile (submit after shutdown).
+            with self._lock:
+                current = self._executor is executor
+                if current and not isinstance(exc, BrokenProcessPool):
+                    raise
+                if current:
+                    self._fingerprint = None
+            logger.warning("Routing worker pool unavailable, retrying on a fresh one", exc_info=True)
+            return self._current(graph).submit(func, graph.fingerprint, *args).result()
+
+    def search(
+        self, graph: CompiledStreetGraph, start: int, goal: int, penalties: Mapping[int, float]
+    ) -> RouteSearch:
+        return self._call(graph, _worker_search, start, goal, dict(penalties))
+
+    def search_timed(
+        self,
+        graph: CompiledStreetGraph,
+        start: int,
+        goal: int,
+        penalties: Mapping[int, float],
+        costs: TimeDependentCosts,
+        depart_at: float,
+    ) -> RouteSearch:
+        penalties = dict(penalties)
+        if not costs.key:
+            return self._call(graph, _worker_search_timed, start, goal, penalties, (), pickle.dumps(costs), depart_at)
+        try:
+            return self._call(graph, _worker_search_timed, start, goal, penalties, costs.key, None, depart_at)
+        except CostsNotLoaded:
+            blob = self._costs_blob(costs)
+            return self._call(graph, _worker_search_timed, start, goal, penalties, costs.key, blob, depart_at)
+
+    def _costs_blob(self, costs: TimeDependentCosts) -> bytes:
+        with self._lock:
+            blob = self._costs_blobs.get(costs.key)
+            if blob is not None:
+                self._costs_blobs.move_to_end(costs.key)
+                return blob
+        blob = pickle.dumps(costs, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._costs_blobs[costs.key] = blob
+            while len(self._costs_blobs) > _COSTS_KEPT:
+                self._costs_blobs.popitem(last=False)
+        return blob
+
+    def distance_table(
+        self, graph: CompiledStreetGraph, sources: list[int], targets: list[int], penalties: Mapping[int, float]
+    ) -> list[array]:
+        return self._call(graph, _worker_distance_table, sources, targets, dict(penalties))
+
+    def _retire(self) -> None:
+        # queued jobs still finish: workers keep their mapping after the name is unlinked
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+        self._shm, self._executor, self._fingerprint = None, None, None
+        self._costs_blobs.clear()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._retire()
+
+
+_pool: Optional[RoutingProcessPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_routing_processes() -> Optional[RoutingProcessPool]:
+    """The process pool, or None when ``ROUTING_PROCESSES`` is 0 (search in-process)."""
+    global _pool
+    if settings.ROUTING_PROCESSES <= 0:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = RoutingProcessPool(settings.ROUTING_PROCESSES)
+    return _pool
+
+
+def start_routing_processes(graph: CompiledStreetGraph) -> None:
+    pool = get_routing_processes()
+    if pool is None or not graph.node_count:
+        return
+    pool.publish(graph)
+    pool.warm()
+
+
+def shutdown_routing_processes() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def search_routes(
+    graph: CompiledStreetGraph, start: int, goal: int, penalties: Mapping[int, float]
+) -> RouteSearch:
+    """Main path and alternatives from ``start`` to ``goal``."""
+    pool = get_routing_processes()
+    if pool is not None:
+        return pool.search(graph, start, goal, penalties)
+    return _search(graph, get_routing_engine(), start, goal, penalties)
+
+
+def search_routes_timed(
+    graph: CompiledStreetGraph,
+    start: int,
+    goal: int,
+    penalties: Mapping[int, float],
+    costs: TimeDependentCosts,
+    depart_at: float,
+) -> RouteSearch:
+    """Like :func:`search_routes`, with the main path searched on arrival time (see :mod:`app.core.time_dependent`).
+
+    ``penalties`` is the static overlay at departure, used for the alternatives.
+    """
+    pool = get_routing_processes()
+    if pool is not None:
+        return pool.search_timed(graph, start, goal, penalties, costs, depart_at)
+    return _search_timed(graph, get_routing_engine(), start, goal, penalties, costs, depart_at)
+
+
+def distance_table(
+    graph: CompiledStreetGraph, sources: list[int], targets: list[int], penalties: Mapping[int, float]
+) -> list[array]:
+    pool = get_routing_processes()
+    if pool is not None:
+        return pool.distance_table(graph, sources, targets, penalties)
+    return get_routing_engine().distance_table(graph, sources, targets, penalties)
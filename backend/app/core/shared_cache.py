@@ -0,0 +1,162 @@
+"""Key/value cache shared by every API worker.
+
+``CACHE_BACKEND=redis`` stores entries in the Redis instance configured by
+``REDIS_HOST``/``REDIS_PORT``; ``memory`` (the default, also used by tests)
+keeps them in-process with the same interface. Values are JSON strings and
+every entry carries a TTL. Redis errors never fail a request: the Redis
+backend degrades to its in-process fallback until Redis answers again. After a
+failure it does not try Redis for ``REDIS_RETRY_SECONDS``, so an outage costs one
+socket timeout per window instead of one per call.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SharedCache:
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ttl_seconds: int) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+
+class InMemorySharedCache(SharedCache):
+    """Process-local stand-in with Redis ``GET``/``SET EX``/``DEL`` semantics."""
+
+    def __init__(self, *, clock: Callable[[], float] = time.monotonic, max_entries: int = 50000):
+        self._clock = clock
+        self._max_entries = max_entries
+        self._entries: dict[str, tuple[float, str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= self._clock():
+                del self._entries[key]
+                return None
+            return entry[1]
+
+    def set(self, key: str, value: str, ttl_seconds: int) -> None:
+        with self._lock:
+            now = self._clock()
+            if len(self._entries) >= self._max_entries:
+                self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+                if len(self._entries) >= self._max_entries:
+                    self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (now + ttl_seconds, value)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class RedisSharedCache(SharedCache):
+    def __init__(
+        self,
+        client,
+        *,
+        fallback: Optional[SharedCache] = None,
+        errors: tuple = (),
+        retry_seconds: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._client = client
+        self._fallback = fallback or InMemorySharedCache()
+        self._errors = errors or (Exception,)
+        self._retry_seconds = settings.REDIS_RETRY_SECONDS if retry_seconds is None else retry_seconds
+        self._clock = clock
+        # Redis is skipped until then after a failure
+        self._down_until = 0.0
+
+    @classmethod
+    def from_settings(cls) -> "RedisSharedCache":
+        import redis
+
+        client = redis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=settings.REDIS_DB,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT_SECONDS,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT_SECONDS,
+            decode_responses=True,
+        )
+        return cls(client, errors=(redis.RedisError,))
+
+    @property
+    def available(self) -> bool:
+        return self._clock() >= self._down_until
+
+    def _failed(self, operation: str) -> None:
+        if self.available:
+            logger.warning(
+                "Redis %s failed, using in-process cache for %.0f s", operation, self._retry_seconds, exc_info=True
+            )
+        self._down_until = self._clock() + self._retry_seconds
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.available:
+            return self._fallback.get(key)
+        try:
+            value = self._client.get(key)
+        except self._errors:
+            self._failed("GET")
+            return self._fallback.get(key)
+        if isinstance(value, bytes):
+            value = value.decode("utf-8")
+        return value
+
+    def set(self, key: str, value: str, ttl_seconds: int) -> None:
+        if not self.available:
+            self._fallback.set(key, value, ttl_seconds)
+            return
+        try:
+            self._client.set(key, value, ex=ttl_seconds)
+        except self._errors:
+            self._failed("SET")
+            self._fallback.set(key, value, ttl_seconds)
+
+    def delete(self, key: str) -> None:
+        self._fallback.delete(key)
+        if not self.available:
+            return
+        try:
+            self._client.delete(key)
+        except self._errors:
+            self._failed("DEL")
+
+
+_shared_cache: Optional[SharedCache] = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_shared_cache() -> SharedCache:
+    global _shared_cache
+    if _shared_cache is None:
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                if settings.CACHE_BACKEND == "redis":
+                    _shared_cache = RedisSharedCache.from_settings()
+                else:
+                    _shared_cache = InMemorySharedCache()
+    return _shared_cache
+
+
+def set_shared_cache(cache: Optional[SharedCache]) -> None:
+    """Swap the process-wide backend (``None`` re-reads the settings on next use)."""
+    global _shared_cache
+    with _shared_cache_lock:
+        _shared_cache = cache
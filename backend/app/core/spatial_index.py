@@ -0,0 +1,190 @@
+"""Grid-bucket spatial index for snapping points onto the street graph nodes.
+
+Coordinates are projected once to a local equirectangular plane (metres), which
+is accurate to well under a metre at city scale, and bucketed in square cells.
+Queries visit rings of cells around the query point and stop as soon as no
+unvisited cell can hold a closer candidate.
+"""
+from __future__ import annotations
+
+import heapq
+import math
+from array import array
+from typing import Iterable, Optional, Sequence
+
+EARTH_RADIUS_M = 6371000.0
+DEFAULT_CELL_SIZE_M = 100.0
+
+
+class LocalProjection:
+    def __init__(self, lat0: float, lng0: float):
+        self.lat0 = lat0
+        self.lng0 = lng0
+        self._ky = math.pi / 180.0 * EARTH_RADIUS_M
+        self._kx = self._ky * math.cos(math.radians(lat0))
+
+    @classmethod
+    def around(cls, lats: Sequence[float], lngs: Sequence[float]) -> "LocalProjection":
+        if not lats:
+            return cls(0.0, 0.0)
+        return cls(sum(lats) / len(lats), sum(lngs) / len(lngs))
+
+    def project(self, lat: float, lng: float) -> tuple[float, float]:
+        return (lng - self.lng0) * self._kx, (lat - self.lat0) * self._ky
+
+    def unproject(self, x: float, y: float) -> tuple[float, float]:
+        return self.lat0 + y / self._ky, self.lng0 + x / self._kx
+
+
+class _Grid:
+    def __init__(self, cell_size_m: float):
+        self.cell_size = cell_size_m
+        # buckets are lists while building, slices of a packed item array once loaded (see PointIndex.from_packed)
+        self.cells: dict[tuple[int, int], Sequence[int]] = {}
+        self.min_cx = self.min_cy = 0
+        self.max_cx = self.max_cy = -1
+
+    def cell_of(self, x: float, y: float) -> tuple[int, int]:
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def add(self, cell: tuple[int, int], item: int) -> None:
+        bucket = self.cells.get(cell)
+        if bucket is None:
+            self.set_bucket(cell, [item])
+        else:
+            bucket.append(item)
+
+    def set_bucket(self, cell: tuple[int, int], bucket: Sequence[int]) -> None:
+        if self.cells:
+            self.min_cx = min(self.min_cx, cell[0])
+            self.max_cx = max(self.max_cx, cell[0])
+            self.min_cy = min(self.min_cy, cell[1])
+            self.max_cy = max(self.max_cy, cell[1])
+        else:
+            self.min_cx = self.max_cx = cell[0]
+            self.min_cy = self.max_cy = cell[1]
+        self.cells[cell] = bucket
+
+    def max_ring(self, cell: tuple[int, int]) -> int:
+        cx, cy = cell
+        return max(
+            abs(cx - self.min_cx), abs(cx - self.max_cx), abs(cy - self.min_cy), abs(cy - self.max_cy)
+        )
+
+    def ring(self, cell: tuple[int, int], r: int) -> Iterable[Sequence[int]]:
+        cx, cy = cell
+        cells = self.cells
+        if r == 0:
+            bucket = cells.get(cell)
+            if bucket:
+                yield bucket
+            return
+        for dx in range(-r, r + 1):
+            for dy in (-r, r):
+                bucket = cells.get((cx + dx, cy + dy))
+                if bucket:
+                    yield bucket
+        for dy in range(-r + 1, r):
+            for dx in (-r, r):
+                bucket = cells.get((cx + dx, cy + dy))
+                if bucket:
+                    yield bucket
+
+
+class PointIndex:
+    """k-nearest and radius queries over the street graph nodes."""
+
+    def __init__(
+        self,
+        lats: Sequence[float],
+        lngs: Sequence[float],
+        *,
+        projection: Optional[LocalProjection] = None,
+        cell_size_m: float = DEFAULT_CELL_SIZE_M,
+    ):
+        self.projection = projection or LocalProjection.around(lats, lngs)
+        self._grid = _Grid(cell_size_m)
+        self._xs: Sequence[float] = array("d")
+        self._ys: Sequence[float] = array("d")
+        for i, (lat, lng) in enumerate(zip(lats, lngs)):
+            x, y = self.projection.project(lat, lng)
+            self._xs.append(x)
+            self._ys.append(y)
+            self._grid.add(self._grid.cell_of(x, y), i)
+
+    @classmethod
+    def from_packed(
+        cls,
+        projection: LocalProjection,
+        cell_size_m: float,
+        xs: Sequence[float],
+        ys: Sequence[float],
+        cells: Sequence[int],
+        offsets: Sequence[int],
+        items: Sequence[int],
+    ) -> "PointIndex":
+        """Index over the arrays of :meth:`packed` (e.g. mmap'ed), without re-bucketing the points."""
+        index = cls.__new__(cls)
+        index.projection = projection
+        index._grid = _Grid(cell_size_m)
+        index._xs, index._ys = xs, ys
+        for i in range(len(offsets) - 1):
+            index._grid.set_bucket((cells[2 * i], cells[2 * i + 1]), items[offsets[i]:offsets[i + 1]])
+        return index
+
+    def packed(self) -> dict[str, array]:
+        """Projected points and buckets as flat arrays: ``cells`` holds ``cx, cy`` pairs, ``items[offsets[i]:offsets[i + 1]]`` the points of cell ``i``."""
+        cells, offsets, items = array("l"), array("l", [0]), array("l")
+        for (cx, cy), bucket in sorted(self._grid.cells.items()):
+            cells.extend((cx, cy))
+            items.extend(bucket)
+            offsets.append(len(items))
+        return {"xs": array("d", self._xs), "ys": array("d", self._ys), "cells": cells, "offsets": offsets, "items": items}
+
+    @property
+    def cell_size(self) -> float:
+        return self._grid.cell_size
+
+    def __len__(self) -> int:
+        return len(self._xs)
+
+    def k_nearest(self, lat: float, lng: float, k: int = 1) -> list[tuple[float, int]]:
+        """Return up to ``k`` ``(distance_m, node)`` pairs ordered by distance."""
+        if not self._xs or k <= 0:
+            return []
+        qx, qy = self.projection.project(lat, lng)
+        cell = self._grid.cell_of(qx, qy)
+        xs, ys = self._xs, self._ys
+        best: list[tuple[float, int]] = []  # max-heap of the k best as (-dist, node)
+        for r in range(self._grid.max_ring(cell) + 1):
+            for bucket in self._grid.ring(cell, r):
+                for i in bucket:
+                    d = math.hypot(xs[i] - qx, ys[i] - qy)
+                    if len(best) < k:
+                        heapq.heappush(best, (-d, i))
+                    elif d < -best[0][0]:
+                        heapq.heapreplace(best, (-d, i))
+            if len(best) == k and -best[0][0] <= r * self._grid.cell_size:
+                break
+        return sorted((-d, i) for d, i in best)
+
+    def nearest(self, lat: float, lng: float) -> Optional[int]:
+        found = self.k_nearest(lat, lng, 1)
+        return found[0][1] if found else None
+
+    def within_radius(self, lat: float, lng: float, radius_m: float) -> list[tuple[float, int]]:
+        if not self._xs:
+            return []
+        qx, qy = self.projection.project(lat, lng)
+        cell = self._grid.cell_of(qx, qy)
+        xs, ys = self._xs, self._ys
+        rings = min(self._grid.max_ring(cell), math.ceil(radius_m / self._grid.cell_size))
+        found = []
+        for r in range(rings + 1):
+            for bucket in self._grid.ring(cell, r):
+                for i in bucket:
+                    d = math.hypot(xs[i] - qx, ys[i] - qy)
+                    if d <= radius_m:
+                        found.append((d, i))
+        found.sort()
+        return found
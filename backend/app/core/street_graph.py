@@ -0,0 +1,624 @@
+"""Process-wide compiled street graph used by the router.
+
+The walkable graph is read from ``street_nodes``/``street_edges`` once, compiled
+into integer-indexed CSR arrays and shared by every request of the worker. It is
+rebuilt after :func:`invalidate_street_graph`, and when the tables were
+re-imported by another process: like the restriction timeline, they are
+re-probed at most every ``ROUTING_GRAPH_REFRESH_SECONDS``. Importers publish
+every import as a ``street_graph_revisions`` row (see
+:func:`publish_street_graph_changes`); a worker that finds only cost patches
+since its graph was loaded patches it in place instead of recompiling.
+
+The importer also writes the compiled arrays to ``ROUTING_GRAPH_PATH`` (see
+:mod:`app.core.packed_graph`). Workers mmap that file instead of compiling from
+SQL, so they boot fast and share the arrays, id tables and snapping grid through
+the page cache. The file is used only while its stamp matches the tables (see
+:func:`street_graph_stamp`).
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from array import array
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Iterable, Iterator, Mapping, Optional, Sequence, Tuple, Union
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.packed_graph import GRAPH_ARRAYS, GRID_ARRAYS, PackedStreetGraph, map_graph_file, write_graph_file
+from app.core.spatial_index import LocalProjection, PointIndex
+from app.models.models import StreetEdge, StreetGraphRevision, StreetNode
+
+logger = logging.getLogger(__name__)
+
+WALKING_SPEED_MPS = 1.28
+
+# (id, lat, lng)
+NodeRow = Tuple[str, float, float]
+# (id, source_node, target_node, length_m)
+EdgeRow = Tuple[str, str, str, float]
+# edge id -> [[lat, lng], ...] from source to target
+EdgeGeometries = Mapping[str, Sequence[Sequence[float]]]
+# (lat, lng, node_id): an extra snapping point that resolves to node_id
+SnapPoint = Tuple[float, float, str]
+# edge id -> width_estimate in metres (None = unknown)
+EdgeWidths = Mapping[str, Optional[float]]
+
+# polylines are rebuilt from float32 deltas; 7 decimals (~1 cm) is what the WKT carries
+_COORD_DECIMALS = 7
+
+
+def crowd_capacity(width_m: Optional[float]) -> float:
+    """Crowd penalty multiplier for a street ``width_m`` wide: narrow callejones saturate first.
+
+    ``CROWD_REFERENCE_WIDTH_M / width_m`` clamped to ``[CROWD_CAPACITY_MIN, CROWD_CAPACITY_MAX]``;
+    1.0 when the width is unknown.
+    """
+    if not width_m or width_m <= 0:
+        return 1.0
+    ratio = settings.CROWD_REFERENCE_WIDTH_M / width_m
+    return min(settings.CROWD_CAPACITY_MAX, max(settings.CROWD_CAPACITY_MIN, ratio))
+
+
+def crowd_capacity_params() -> list[float]:
+    """Settings baked into ``crowd_capacity`` arrays, stored with the graph file to detect stale ones."""
+    return [settings.CROWD_REFERENCE_WIDTH_M, settings.CROWD_CAPACITY_MIN, settings.CROWD_CAPACITY_MAX]
+
+
+def parse_point_wkt(wkt: str) -> Tuple[float, float]:
+    raw = wkt.strip().replace("POINT(", "").replace(")", "")
+    lng, lat = raw.split()
+    return float(lat), float(lng)
+
+
+def parse_line_wkt(wkt: str) -> list[list[float]]:
+    inner = wkt.strip().replace("LINESTRING(", "").replace(")", "")
+    coords = []
+    for pair in inner.split(","):
+        lng, lat = pair.strip().split()
+        coords.append([float(lat), float(lng)])
+    return coords
+
+
+@dataclass
+class CompiledStreetGraph:
+    """Directed walkable graph in CSR form.
+
+    Nodes are addressed by their position in ``node_ids`` and edges by their
+    *slot* in the CSR arrays: the out-edges of node ``u`` are the slots
+    ``offsets[u]:offsets[u + 1]``.
+    """
+
+    version: int
+    # content hash, identical in every worker that loaded the same graph
+    fingerprint: str
+    # lists and dicts when compiled; packed ids and a lazily built index when mapped from a graph file
+    node_ids: Sequence[str]
+    node_index: Mapping[str, int]
+    lats: array
+    lngs: array
+    # node coordinates projected to metres (see spatial_index.LocalProjection)
+    xs: array
+    ys: array
+    offsets: array
+    sources: array
+    targets: array
+    # reverse CSR: in-edges of node ``v`` are ``in_slots[in_offsets[v]:in_offsets[v + 1]]``
+    in_offsets: array
+    in_slots: array
+    weights: array
+    lengths: array
+    edge_ids: Sequence[str]
+    edge_index: Mapping[str, int]
+    # edge shapes: points of slot ``s`` are geom_dlats/geom_dlngs[geom_offsets[s]:geom_offsets[s + 1]],
+    # stored as float32 deltas from the source node (edges without geometry get their two endpoints)
+    geom_offsets: array
+    geom_dlats: array
+    geom_dlngs: array
+    # shape nodes removed by chain collapsing (see import_street_graph.collapse_chains), kept for snapping:
+    # node_grid item ``node_count + i`` is the point snap_lats/snap_lngs[i] and snaps to node snap_nodes[i]
+    snap_lats: array
+    snap_lngs: array
+    snap_nodes: array
+    # per-slot crowd penalty multiplier from the street width (see crowd_capacity)
+    crowd_capacity: array
+    node_grid: PointIndex
+
+    @property
+    def node_count(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.edge_ids)
+
+    def snap(self, lat: float, lng: float) -> Optional[int]:
+        """Graph node for a point: the nearest node, or the chain end a nearby collapsed node maps to."""
+        item = self.node_grid.nearest(lat, lng)
+        if item is None or item < self.node_count:
+            return item
+        return self.snap_nodes[item - self.node_count]
+
+    def out_slots(self, node: int) -> range:
+        return range(self.offsets[node], self.offsets[node + 1])
+
+    def in_edge_slots(self, node: int) -> array:
+        return self.in_slots[self.in_offsets[node]:self.in_offsets[node + 1]]
+
+    def coords(self, node: int) -> list[float]:
+        return [self.lats[node], self.lngs[node]]
+
+    def edge_polyline(self, slot: int) -> list[list[float]]:
+        source = self.sources[slot]
+        lat0, lng0 = self.lats[source], self.lngs[source]
+        lo, hi = self.geom_offsets[slot], self.geom_offsets[slot + 1]
+        return [
+            [round(lat0 + dlat, _COORD_DECIMALS), round(lng0 + dlng, _COORD_DECIMALS)]
+            for dlat, dlng in zip(self.geom_dlats[lo:hi], self.geom_dlngs[lo:hi])
+        ]
+
+    def path_polyline(self, slots: Sequence[int]) -> list[list[float]]:
+        """Concatenated shapes of consecutive edges, without repeating the shared joints."""
+        poly: list[list[float]] = []
+        for slot in slots:
+            coords = self.edge_polyline(slot)
+            poly.extend(coords[1:] if poly else coords)
+        return poly
+
+
+def compile_street_graph(
+    nodes: Iterable[NodeRow],
+    edges: Iterable[EdgeRow],
+    *,
+    geometries: Optional[EdgeGeometries] = None,
+    widths: Optional[EdgeWidths] = None,
+    snap_points: Iterable[SnapPoint] = (),
+    version: int = 0,
+) -> CompiledStreetGraph:
+    node_ids: list[str] = []
+    node_index: dict[str, int] = {}
+    lats = array("d")
+    lngs = array("d")
+    for node_id, lat, lng in nodes:
+        node_index[node_id] = len(node_ids)
+        node_ids.append(node_id)
+        lats.append(lat)
+        lngs.append(lng)
+
+    kept = [
+        (node_index[source], node_index[target], edge_id, length_m)
+        for edge_id, source, target, length_m in edges
+        if source in node_index and target in node_index
+    ]
+    # counting sort by source node keeps the CSR build linear
+    offsets = array("l", [0] * (len(node_ids) + 1))
+    for source, _, _, _ in kept:
+        offsets[source + 1] += 1
+    for i in range(len(node_ids)):
+        offsets[i + 1] += offsets[i]
+
+    cursor = array("l", offsets[:-1])
+    sources = array("l", [0] * len(kept))
+    targets = array("l", [0] * len(kept))
+    weights = array("d", [0.0] * len(kept))
+    lengths = array("d", [0.0] * len(kept))
+    edge_ids: list[str] = [""] * len(kept)
+    for source, target, edge_id, length_m in kept:
+        slot = cursor[source]
+        cursor[source] += 1
+        sources[slot] = source
+        targets[slot] = target
+        lengths[slot] = length_m
+        weights[slot] = length_m / WALKING_SPEED_MPS
+        edge_ids[slot] = edge_id
+
+    in_offsets = array("l", [0] * (len(node_ids) + 1))
+    for slot in range(len(kept)):
+        in_offsets[targets[slot] + 1] += 1
+    for i in range(len(node_ids)):
+        in_offsets[i + 1] += in_offsets[i]
+    in_cursor = array("l", in_offsets[:-1])
+    in_slots = array("l", [0] * len(kept))
+    for slot in range(len(kept)):
+        target = targets[slot]
+        in_slots[in_cursor[target]] = slot
+        in_cursor[target] += 1
+
+    geometries = geometries or {}
+    geom_offsets = array("l", [0]) * (len(kept) + 1)
+    geom_dlats = array("f")
+    geom_dlngs = array("f")
+    for slot in range(len(kept)):
+        source, target = sources[slot], targets[slot]
+        lat0, lng0 = lats[source], lngs[source]
+        shape = geometries.get(edge_ids[slot]) or ((lat0, lng0), (lats[target], lngs[target]))
+        first, last = shape[0], shape[-1]
+        if abs(first[0] - lat0) + abs(first[1] - lng0) > abs(last[0] - lat0) + abs(last[1] - lng0):
+            # digitised target -> source
+            shape = shape[::-1]
+        for lat, lng in shape:
+            geom_dlats.append(lat - lat0)
+            geom_dlngs.append(lng - lng0)
+        geom_offsets[slot + 1] = len(geom_dlats)
+
+    widths = widths or {}
+    capacity = array("d", (crowd_capacity(widths.get(edge_id)) for edge_id in edge_ids))
+
+    digest = hashlib.sha1()
+    digest.update(f"capacity:{crowd_capacity_params()!r};".encode())
+    for node_id, lat, lng in sorted(zip(node_ids, lats, lngs)):
+        digest.update(f"{node_id}:{lat!r}:{lng!r};".encode())
+    for source, target, edge_id, length_m in sorted(kept, key=lambda row: row[2]):
+        digest.update(f"{edge_id}:{node_ids[source]}:{node_ids[target]}:{length_m!r};".encode())
+        if edge_id in geometries:
+            digest.update(repr([tuple(point) for point in geometries[edge_id]]).encode())
+        if widths.get(edge_id) is not None:
+            digest.update(f"w{widths[edge_id]!r};".encode())
+
+    snap_lats = array("d")
+    snap_lngs = array("d")
+    snap_nodes = array("l")
+    for lat, lng, node_id in snap_points:
+        if node_id in node_index:
+            snap_lats.append(lat)
+            snap_lngs.append(lng)
+            snap_nodes.append(node_index[node_id])
+            digest.update(f"snap:{lat!r}:{lng!r}:{node_id};".encode())
+
+    projection = LocalProjection.around(lats, lngs)
+    xs = array("d")
+    ys = array("d")
+    for lat, lng in zip(lats, lngs):
+        x, y = projection.project(lat, lng)
+        xs.append(x)
+        ys.append(y)
+    return CompiledStreetGraph(
+        version=version,
+        fingerprint=digest.hexdigest(),
+        node_ids=node_ids,
+        node_index=node_index,
+        lats=lats,
+        lngs=lngs,
+        xs=xs,
+        ys=ys,
+        offsets=offsets,
+        sources=sources,
+        targets=targets,
+        in_offsets=in_offsets,
+        in_slots=in_slots,
+        weights=weights,
+        lengths=lengths,
+        edge_ids=edge_ids,
+        edge_index={edge_id: slot for slot, edge_id in enumerate(edge_ids)},
+        geom_offsets=geom_offsets,
+        geom_dlats=geom_dlats,
+        geom_dlngs=geom_dlngs,
+        snap_lats=snap_lats,
+        snap_lngs=snap_lngs,
+        snap_nodes=snap_nodes,
+        crowd_capacity=capacity,
+        node_grid=_node_grid(lats, lngs, snap_lats, snap_lngs, projection),
+    )
+
+
+def _node_grid(lats, lngs, snap_lats, snap_lngs, projection: LocalProjection) -> PointIndex:
+    if len(snap_lats):
+        lats, lngs = array("d", lats) + array("d", snap_lats), array("d", lngs) + array("d", snap_lngs)
+    return PointIndex(lats, lngs, projection=projection)
+
+
+class _LazyIdIndex(Mapping[str, int]):
+    """id -> position in ``ids``, built on the first lookup (many workers never resolve an id)."""
+
+    def __init__(self, ids: Sequence[str]):
+        self._ids = ids
+        self._index: Optional[dict[str, int]] = None
+
+    def _built(self) -> dict[str, int]:
+        if self._index is None:
+            self._index = {item: position for position, item in enumerate(self._ids)}
+        return self._index
+
+    def __getitem__(self, key: str) -> int:
+        return self._built()[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._built())
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+def graph_from_packed(packed: PackedStreetGraph, *, version: int = 0) -> CompiledStreetGraph:
+    """Compiled graph whose arrays, ids and snapping grid are the (mmap'ed) views of ``packed``."""
+    node_ids = packed.ids("node_ids")
+    edge_ids = packed.ids("edge_ids")
+    arrays = {name: getattr(packed, name) for name in GRAPH_ARRAYS}
+    grid = [packed.arrays[f"grid_{name}"] for name in GRID_ARRAYS]
+    return CompiledStreetGraph(
+        version=version,
+        fingerprint=packed.fingerprint,
+        node_ids=node_ids,
+        node_index=_LazyIdIndex(node_ids),
+        edge_ids=edge_ids,
+        edge_index=_LazyIdIndex(edge_ids),
+        **arrays,
+        node_grid=PointIndex.from_packed(LocalProjection(*packed.grid["origin"]), packed.grid["cell_size_m"], *grid),
+    )
+
+
+def street_graph_stamp(db: Session) -> list:
+    """Version of the street tables: last published revision, and counts and newest ``created_at``.
+
+    A re-import deletes and re-inserts rows, so counts and ``created_at`` change;
+    importers publish any other change, same-size edits included, as a revision
+    (see :func:`publish_street_graph_changes`). Stored in the graph file to detect a stale file.
+    """
+    revision = db.query(func.max(StreetGraphRevision.id)).scalar()
+    nodes, nodes_at = db.query(func.count(StreetNode.id), func.max(StreetNode.created_at)).one()
+    edges, edges_at = db.query(func.count(StreetEdge.id), func.max(StreetEdge.created_at)).one()
+    return [revision, nodes, str(nodes_at), edges, str(edges_at)]
+
+
+def export_street_graph(db: Session, path: Union[str, Path]) -> CompiledStreetGraph:
+    """Compile the graph from the tables and write the binary graph file at ``path``."""
+    # stamped before reading: a change committed meanwhile makes the file look stale, never fresh
+    stamp = street_graph_stamp(db)
+    graph = compile_street_graph_from_db(db)
+    write_graph_file(graph, path, meta={"stamp": stamp, "crowd_capacity": crowd_capacity_params()})
+    return graph
+
+
+def _open_graph_file(db: Session, path: Path, version: int) -> Optional[CompiledStreetGraph]:
+    try:
+        packed = map_graph_file(path)
+    except (OSError, ValueError):
+        logger.warning("Street graph file %s could not be opened; compiling from the database", path, exc_info=True)
+        return None
+    if packed.meta.get("stamp") != street_graph_stamp(db) or packed.meta.get("crowd_capacity") != crowd_capacity_params():
+        logger.warning("Street graph file %s does not match the database; compiling from the database", path)
+        packed.release()
+        return None
+    return graph_from_packed(packed, version=version)
+
+
+def load_street_graph(db: Session, *, version: int = 0) -> CompiledStreetGraph:
+    """Map ``ROUTING_GRAPH_PATH`` when it matches the tables, otherwise compile from SQL."""
+    path = Path(settings.ROUTING_GRAPH_PATH) if settings.ROUTING_GRAPH_PATH else None
+    if path is not None and path.exists():
+        graph = _open_graph_file(db, path, version)
+        if graph is not None:
+            return graph
+    return compile_street_graph_from_db(db, version=version)
+
+
+def compile_street_graph_from_db(db: Session, *, version: int = 0) -> CompiledStreetGraph:
+    nodes = []
+    for node_id, geom in db.query(StreetNode.id, StreetNode.geom).all():
+        lat, lng = parse_point_wkt(str(geom))
+        nodes.append((node_id, lat, lng))
+    edges = []
+    geometries = {}
+    widths = {}
+    snap_points: dict[str, SnapPoint] = {}
+    rows = (
+        db.query(
+            StreetEdge.id,
+            StreetEdge.source_node,
+            StreetEdge.target_node,
+            StreetEdge.length_m,
+            StreetEdge.geom,
+            StreetEdge.width_estimate,
+            StreetEdge.tags,
+        )
+        .filter(StreetEdge.is_walkable.is_(True))
+        .all()
+    )
+    for edge_id, source, target, length_m, geom, width_m, tags in rows:
+        edges.append((edge_id, source, target, length_m))
+        widths[edge_id] = width_m
+        if geom is not None:
+            geometries[edge_id] = parse_line_wkt(str(geom))
+        if tags and "collapsed_nodes" in tags:
+            # collapsed shape nodes snap to the closer end of their chain
+            for node_id, lat, lng, offset_m in json.loads(tags)["collapsed_nodes"]:
+                snap_points.setdefault(node_id, (lat, lng, source if offset_m * 2 <= length_m else target))
+    return compile_street_graph(
+        nodes, edges, geometries=geometries, widths=widths, snap_points=snap_points.values(), version=version
+    )
+
+
+@dataclass
+class GraphChangeSet:
+    """Rows an incremental import inserted, updated or deleted, by id."""
+
+    nodes_added: list[str] = field(default_factory=list)
+    nodes_updated: list[str] = field(default_factory=list)
+    nodes_removed: list[str] = field(default_factory=list)
+    edges_added: list[str] = field(default_factory=list)
+    edges_updated: list[str] = field(default_factory=list)
+    edges_removed: list[str] = field(default_factory=list)
+    # updated edges whose endpoints, shape, walkability or collapsed snap points changed
+    edges_reshaped: list[str] = field(default_factory=list)
+    # updated edges whose only routing changes are length and/or width: edge id -> new value
+    edge_lengths: dict[str, float] = field(default_factory=dict)
+    edge_widths: dict[str, Optional[float]] = field(default_factory=dict)
+
+    @property
+    def empty(self) -> bool:
+        return not (
+            self.nodes_added or self.nodes_updated or self.nodes_removed
+            or self.edges_added or self.edges_updated or self.edges_removed
+        )
+
+    @property
+    def structural(self) -> bool:
+        """True when the CSR topology or geometry must be recompiled."""
+        return bool(
+            self.nodes_added or self.nodes_updated or self.nodes_removed
+            or self.edges_added or self.edges_removed or self.edges_reshaped
+        )
+
+    def summary(self) -> dict[str, int]:
+        return {
+            "nodes_added": len(self.nodes_added),
+            "nodes_updated": len(self.nodes_updated),
+            "nodes_removed": len(self.nodes_removed),
+            "edges_added": len(self.edges_added),
+            "edges_updated": len(self.edges_updated),
+            "edges_removed": len(self.edges_removed),
+            "edges_reshaped": len(self.edges_reshaped),
+            "edge_lengths": len(self.edge_lengths),
+            "edge_widths": len(self.edge_widths),
+        }
+
+
+def patch_edge_costs(
+    graph: CompiledStreetGraph,
+    *,
+    lengths: Optional[Mapping[str, float]] = None,
+    widths: Optional[EdgeWidths] = None,
+) -> CompiledStreetGraph:
+    """Copy of ``graph`` with new edge lengths/weights and crowd capacities; topology, geometry and indexes are shared.
+
+    The fingerprint is derived from the base fingerprint and the patch, so every
+    worker applying the same change set to the same graph agrees on it.
+    """
+    weights = array("d", graph.weights)
+    new_lengths = array("d", graph.lengths)
+    capacity = array("d", graph.crowd_capacity)
+    digest = hashlib.sha1(graph.fingerprint.encode())
+    patched = False
+    for edge_id, length_m in sorted((lengths or {}).items()):
+        slot = graph.edge_index.get(edge_id)
+        if slot is None:
+            # not walkable, so not in the routing graph
+            continue
+        new_lengths[slot] = length_m
+        weights[slot] = length_m / WALKING_SPEED_MPS
+        digest.update(f"{edge_id}:{length_m!r};".encode())
+        patched = True
+    for edge_id, width_m in sorted((widths or {}).items()):
+        slot = graph.edge_index.get(edge_id)
+        if slot is None:
+            continue
+        capacity[slot] = crowd_capacity(width_m)
+        digest.update(f"{edge_id}:w{width_m!r};".encode())
+        patched = True
+    if not patched:
+        return graph
+    return replace(
+        graph, fingerprint=digest.hexdigest(), weights=weights, lengths=new_lengths, crowd_capacity=capacity
+    )
+
+
+def _patched_graph(
+    db: Session, graph: CompiledStreetGraph, loaded: list, probe: list
+) -> Optional[CompiledStreetGraph]:
+    """``graph`` with the cost patches published since ``loaded``, or None if a reload is needed."""
+    if loaded[1:] != probe[1:] or probe[0] is None:
+        return None
+    revisions = (
+        db.query(StreetGraphRevision.kind, StreetGraphRevision.changes)
+        .filter(StreetGraphRevision.id > (loaded[0] or 0))
+        .order_by(StreetGraphRevision.id)
+        .all()
+    )
+    if any(kind != "patch" for kind, _ in revisions):
+        return None
+    for _, changes in revisions:
+        patch = json.loads(changes)
+        # new values are absolute, so a patch already in the tables the graph was read from is harmless
+        graph = patch_edge_costs(graph, lengths=patch["edge_lengths"], widths=patch["edge_widths"])
+    return graph
+
+
+_graph: Optional[CompiledStreetGraph] = None
+_graph_probe: Optional[list] = None
+_graph_checked_at = 0.0
+_graph_version = 0
+_graph_lock = threading.Lock()
+
+
+def get_street_graph(db: Session) -> CompiledStreetGraph:
+    """Return the shared compiled graph, loading it on first use.
+
+    The street tables are re-checked at most every ``ROUTING_GRAPH_REFRESH_SECONDS``.
+    When only cost patches were published since the graph was loaded they are
+    applied to it (same slots and version, so the restriction timeline survives;
+    fingerprint-keyed caches miss); any other change reloads it with a new version.
+    """
+    global _graph, _graph_probe, _graph_checked_at, _graph_version
+    graph = _graph
+    now = time.monotonic()
+    if graph is not None and now - _graph_checked_at < settings.ROUTING_GRAPH_REFRESH_SECONDS:
+        return graph
+    with _graph_lock:
+        probe = street_graph_stamp(db)
+        if _graph is not None and probe != _graph_probe:
+            patched = _patched_graph(db, _graph, _graph_probe, probe)
+            if patched is not None:
+                logger.info("Street graph patched with the edge costs of revision %s", probe[0])
+                _graph, _graph_probe = patched, probe
+            else:
+                logger.info("Street tables changed since the graph was loaded; reloading it")
+                _graph = None
+                _graph_version += 1
+        if _graph is None:
+            _graph = load_street_graph(db, version=_graph_version)
+            _graph_probe = probe
+        _graph_checked_at = now
+        return _graph
+
+
+def invalidate_street_graph() -> None:
+    """Drop the compiled graph so the next request reloads it from the DB."""
+    global _graph, _graph_probe, _graph_version
+    with _graph_lock:
+        _graph = None
+        _graph_probe = None
+        _graph_version += 1
+
+
+def warm_street_graph(session_factory) -> Optional[CompiledStreetGraph]:
+    db = session_factory()
+    try:
+        graph = get_street_graph(db)
+        logger.info("Street graph loaded: %s nodes, %s edges", graph.node_count, graph.edge_count)
+        return graph
+    except Exception:
+        logger.warning("Street graph could not be preloaded; it will load on first route request", exc_info=True)
+        return None
+    finally:
+        db.close()
+
+
+def publish_street_graph_changes(db: Session, changes: Optional[GraphChangeSet]) -> str:
+    """Record an import for every worker, in the importer's transaction; returns what they will do.
+
+    ``changes`` is None for a full re-import. ``"unchanged"`` publishes nothing and
+    keeps every graph and cache, ``"patched"`` has workers swap in the new edge
+    weights or crowd capacities and ``"invalidated"`` has them reload the graph.
+    The importer's own process re-probes at once.
+    """
+    global _graph_checked_at
+    if changes is not None and not changes.structural and not changes.edge_lengths and not changes.edge_widths:
+        # nothing, or only columns the compiled graph does not hold (highway type, tags other than
+        # collapsed_nodes, whose changes the importer reports as reshaped edges)
+        return "unchanged"
+    if changes is None or changes.structural:
+        db.add(StreetGraphRevision(kind="reload"))
+        outcome = "invalidated"
+    else:
+        patch = {"edge_lengths": changes.edge_lengths, "edge_widths": changes.edge_widths}
+        db.add(StreetGraphRevision(kind="patch", changes=json.dumps(patch, sort_keys=True)))
+        outcome = "patched"
+    with _graph_lock:
+        _graph_checked_at = float("-inf")
+    return outcome
@@ -0,0 +1,248 @@
+"""Time-dependent route search: penalties looked up when the walker reaches each edge.
+
+The static search takes every restriction and crowd penalty at
+``route_datetime``, although a 40-minute walk crosses several 10-minute crowd
+buckets and procession passes. :func:`get_time_dependent_costs` precomputes,
+for every penalised slot, a piecewise-constant penalty profile over
+``ROUTING_TIME_DEPENDENT_HORIZON_MINUTES`` from the start of the departure
+bucket: the breakpoints of every timed overlay (restriction timeline,
+procession blockage tables) plus one crowd overlay per bucket (the same
+per-bucket arrays the static router uses). Beyond the horizon the last piece
+holds.
+
+A raw profile is not FIFO: entering just before a procession clears would cost
+more than entering just after. The walker may therefore wait at the edge for a
+cheaper piece, so entering at ``t`` costs
+``weight + min(p(t), min(start_i + p_i for later pieces i) - t)``, a FIFO
+piecewise-linear function evaluated with one bisect and a suffix minimum.
+:func:`time_dependent_search` is label-setting A* on arrival time; the
+euclidean heuristic stays a lower bound because penalties and waits are
+never negative.
+"""
+from __future__ import annotations
+
+import heapq
+import threading
+from bisect import bisect_right
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, Optional, Protocol, Sequence
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.crowd_overlay import edge_crowd_penalties
+from app.core.restrictions import to_timestamp
+from app.core.route_cache import TIME_BUCKET_MINUTES, RouteCache, time_bucket
+from app.core.routing_engines import INF, PathResult, euclidean_heuristic, unreachable, walk_back
+from app.core.street_graph import CompiledStreetGraph
+
+_MICROS = 1_000_000
+
+
+class TimedOverlay(Protocol):
+    """Piecewise-constant penalties over time (``RestrictionTimeline``, ``ProcessionBlockages``)."""
+
+    fingerprint: str
+
+    def slots(self) -> Iterable[int]: ...
+
+    def pieces(self, slot: int, start_ts: int, end_ts: int) -> list[tuple[int, float]]: ...
+
+
+@dataclass
+class PenaltyProfile:
+    """Penalty of one slot over time, in seconds after the start of the departure bucket."""
+
+    # starts[0] == 0; piece i covers [starts[i], starts[i + 1])
+    starts: list[float]
+    values: list[float]
+    # suffix[i] = min(starts[j] + values[j] for j >= i): best "wait for piece j" arrival offset
+    suffix: list[float]
+
+    @classmethod
+    def from_pieces(cls, starts: list[float], values: list[float]) -> "PenaltyProfile":
+        suffix = [0.0] * len(starts)
+        best = INF
+        for i in range(len(starts) - 1, -1, -1):
+            best = min(best, starts[i] + values[i])
+            suffix[i] = best
+        return cls(starts=starts, values=values, suffix=suffix)
+
+    def penalty(self, t: float) -> float:
+        """Extra seconds (penalty plus any wait) for entering the edge at ``t``."""
+        i = bisect_right(self.starts, t) - 1
+        best = self.values[i]
+        if i + 1 < len(self.starts) and self.suffix[i + 1] - t < best:
+            best = self.suffix[i + 1] - t
+        return best
+
+    def wait(self, t: float) -> float:
+        """Seconds spent waiting at the edge when entering at ``t`` (0 if walking straight in is best)."""
+        i = bisect_right(self.starts, t) - 1
+        best, wait = self.values[i], 0.0
+        for j in range(i + 1, len(self.starts)):
+            if self.starts[j] - t + self.values[j] < best:
+                best, wait = self.starts[j] - t + self.values[j], self.starts[j] - t
+        return wait
+
+
+@dataclass
+class TimeDependentCosts:
+    """Penalty profiles of every penalised slot, relative to ``origin`` (the departure bucket start)."""
+
+    origin: datetime
+    horizon_seconds: float
+    profiles: dict[int, PenaltyProfile]
+    # cache key of these profiles (see get_time_dependent_costs); routing workers keep them by it
+    key: tuple = ()
+
+    def offset(self, at: datetime) -> float:
+        """Seconds from ``origin`` to ``at``."""
+        return (at - self.origin).total_seconds()
+
+    def edge_cost(self, graph: CompiledStreetGraph, slot: int, t: float) -> float:
+        profile = self.profiles.get(slot)
+        return graph.weights[slot] + (profile.penalty(t) if profile is not None else 0.0)
+
+
+def build_time_dependent_costs(
+    db: Session,
+    graph: CompiledStreetGraph,
+    overlays: Sequence[TimedOverlay],
+    departure: datetime,
+    *,
+    avoid_bulla: bool,
+) -> TimeDependentCosts:
+    origin = time_bucket(departure)
+    step = TIME_BUCKET_MINUTES * 60
+    buckets = max(1, -(-settings.ROUTING_TIME_DEPENDENT_HORIZON_MINUTES * 60 // step))
+    horizon = buckets * step
+    crowd = [
+        edge_crowd_penalties(db, graph, origin + timedelta(seconds=k * step)) if avoid_bulla else {}
+        for k in range(buckets)
+    ]
+    start_ts = to_timestamp(origin)
+    end_ts = start_ts + horizon * _MICROS
+    # slot -> one list of (offset, penalty) pieces per overlay that penalises it within the horizon
+    timed: dict[int, list[list[tuple[float, float]]]] = {}
+    for overlay in overlays:
+        for slot in overlay.slots():
+            pieces = [((ts - start_ts) / _MICROS, value) for ts, value in overlay.pieces(slot, start_ts, end_ts)]
+            if len(pieces) > 1 or pieces[0][1]:
+                timed.setdefault(slot, []).append(pieces)
+
+    slots = set(timed)
+    for overlay in crowd:
+        slots.update(overlay)
+    profiles: dict[int, PenaltyProfile] = {}
+    for slot in slots:
+        slot_pieces = timed.get(slot, [])
+        breakpoints = sorted({k * step for k in range(buckets)} | {o for pieces in slot_pieces for o, _ in pieces})
+        cursors = [0] * len(slot_pieces)
+        starts: list[float] = []
+        values: list[float] = []
+        for offset in breakpoints:
+            value = crowd[min(int(offset // step), buckets - 1)].get(slot, 0.0)
+            for n, pieces in enumerate(slot_pieces):
+                while cursors[n] + 1 < len(pieces) and pieces[cursors[n] + 1][0] <= offset:
+                    cursors[n] += 1
+                value += pieces[cursors[n]][1]
+            if not values or value != values[-1]:
+                starts.append(float(offset))
+                values.append(value)
+        if len(values) > 1 or values[0] > 0:
+            profiles[slot] = PenaltyProfile.from_pieces(starts, values)
+    return TimeDependentCosts(origin=origin, horizon_seconds=float(horizon), profiles=profiles)
+
+
+_costs_cache = RouteCache(max_entries=64, ttl_seconds=settings.CROWD_CACHE_TTL_SECONDS)
+_costs_lock = threading.Lock()
+
+
+def get_time_dependent_costs(
+    db: Session,
+    graph: CompiledStreetGraph,
+    overlays: Sequence[TimedOverlay],
+    departure: datetime,
+    *,
+    avoid_bulla: bool,
+) -> TimeDependentCosts:
+    """Profiles for the departure bucket, built once per graph, overlay contents and bucket."""
+    key = (graph.fingerprint, tuple(overlay.fingerprint for overlay in overlays), time_bucket(departure), avoid_bulla)
+    costs = _costs_cache.get(key)
+    if costs is None:
+        with _costs_lock:
+            costs = _costs_cache.get(key)
+            if costs is None:
+                costs = replace(
+                    build_time_dependent_costs(db, graph, overlays, departure, avoid_bulla=avoid_bulla), key=key
+                )
+                _costs_cache.set(key, costs)
+    return costs
+
+
+def clear_time_dependent_costs() -> None:
+    _costs_cache.clear()
+
+
+def time_dependent_search(
+    graph: CompiledStreetGraph,
+    start: int,
+    goal: int,
+    costs: TimeDependentCosts,
+    depart_at: float,
+    heuristic: Optional[Callable[[int], float]] = None,
+) -> PathResult:
+    """A* on arrival time from ``start`` leaving ``depart_at`` seconds after ``costs.origin``.
+
+    ``cost`` of the result is the travel time, waits included.
+    """
+    heuristic = heuristic or euclidean_heuristic(graph, goal)
+    offsets, targets, weights = graph.offsets, graph.targets, graph.weights
+    profiles = costs.profiles
+    arrival = {start: depart_at}
+    h_cache: dict[int, float] = {}
+    came_from: dict[int, tuple[int, int]] = {}
+    queue = [(depart_at + heuristic(start), depart_at, start)]
+    settled = 0
+
+    while queue:
+        _, t, current = heapq.heappop(queue)
+        if t > arrival[current]:
+            continue
+        settled += 1
+        if current == goal:
+            nodes, slots = walk_back(came_from, current)
+            return PathResult(nodes=nodes, slots=slots, cost=t - depart_at, settled=settled)
+
+        for slot in range(offsets[current], offsets[current + 1]):
+            neighbor = targets[slot]
+            profile = profiles.get(slot)
+            reach = t + weights[slot] + (profile.penalty(t) if profile is not None else 0.0)
+            if reach < arrival.get(neighbor, INF):
+                came_from[neighbor] = (current, slot)
+                arrival[neighbor] = reach
+                h = h_cache.get(neighbor)
+                if h is None:
+                    h = h_cache[neighbor] = heuristic(neighbor)
+                heapq.heappush(queue, (reach + h, reach, neighbor))
+
+    return unreachable(start, goal, settled)
+
+
+def path_edge_costs(
+    graph: CompiledStreetGraph, costs: TimeDependentCosts, slots: list[int], depart_at: float
+) -> tuple[list[float], float]:
+    """Cost of every edge of ``slots`` walked in order from ``depart_at``, and the total time spent waiting."""
+    t = depart_at
+    edge_costs: list[float] = []
+    waited = 0.0
+    for slot in slots:
+        cost = costs.edge_cost(graph, slot, t)
+        profile = costs.profiles.get(slot)
+        if profile is not None:
+            waited += profile.wait(t)
+        edge_costs.append(cost)
+        t += cost
+    return edge_costs, waited
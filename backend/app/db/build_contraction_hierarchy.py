@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+from app.core.config import settings
+from app.core.contraction import build_contraction_hierarchy
+from app.core.street_graph import load_street_graph
+from app.db.session import SessionLocal
+
+
+def build(output: Path) -> dict:
+    db = SessionLocal()
+    try:
+        graph = load_street_graph(db)
+    finally:
+        db.close()
+    started = time.perf_counter()
+    hierarchy = build_contraction_hierarchy(graph)
+    hierarchy.save(output)
+    return {
+        "nodes": graph.node_count,
+        "edges": graph.edge_count,
+        "arcs": hierarchy.arc_count,
+        "seconds": round(time.perf_counter() - started, 2),
+        "output": str(output),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the contraction hierarchy for the imported street graph")
+    parser.add_argument("--output", type=Path, default=Path(settings.ROUTING_CH_PATH))
+    args = parser.parse_args()
+    print(json.dumps(build(args.output), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+"""Streaming import of the walkable graph from an OpenStreetMap extract.
+
+Usage (from ``backend/``)::
+
+    python -m app.db.import_osm_graph sevilla.osm.pbf        # needs pyosmium
+    python -m app.db.import_osm_graph sevilla.osm.bz2        # .osm / .osm.gz / .osm.bz2, stdlib only
+
+The file is streamed three times so memory stays bounded by the walkable part
+of the extract, never by the whole file:
+
+1. ways: keep the pedestrian-accessible ones and count how many times each of
+   their nodes is referenced (intersections are referenced more than once);
+2. nodes: keep the coordinates of the nodes those ways use;
+3. ways again: split each way at intersections and emit one edge per segment
+   and direction, with ``length_m``, ``width_estimate`` and its geometry.
+
+Rows are written with bulk INSERTs every ``--batch-size`` edges.
+"""
+from __future__ import annotations
+
+import argparse
+import bz2
+import gzip
+import json
+import math
+import re
+import time
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import IO, Iterator, Optional, Union
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.street_graph import export_street_graph, publish_street_graph_changes
+from app.db.import_street_graph import bulk_insert, collapse_stored_chains, line_wkt, point_wkt
+from app.db.session import SessionLocal
+from app.models.models import StreetEdge, StreetNode
+
+EARTH_RADIUS_M = 6371000.0
+
+# highway values a pedestrian may use unless tagged otherwise
+WALKABLE_HIGHWAYS = {
+    "footway", "pedestrian", "path", "steps", "living_street", "residential", "service",
+    "unclassified", "tertiary", "tertiary_link", "secondary", "secondary_link", "primary",
+    "primary_link", "track", "corridor", "bridleway", "cycleway", "road",
+}
+_NO_ACCESS = {"no", "private"}
+_FOOT_ALLOWED = {"yes", "designated", "permissive", "destination"}
+
+# metres, when the way carries neither width nor lanes
+DEFAULT_WIDTH_M = {
+    "footway": 2.0, "path": 1.5, "steps": 2.0, "corridor": 2.0, "bridleway": 2.0, "cycleway": 2.5,
+    "track": 3.0, "pedestrian": 6.0, "living_street": 5.0, "service": 4.0, "residential": 7.0,
+    "unclassified": 6.0, "road": 6.0, "tertiary": 8.0, "secondary": 10.0, "primary": 12.0,
+}
+_LANE_WIDTH_M = 3.0
+_SIDEWALK_WIDTH_M = 1.5
+_NUMBER = re.compile(r"^\s*(\d+(?:[.,]\d+)?)\s*(m|meters?|metres?)?\s*$")
+
+OsmWay = tuple[int, list[int], dict[str, str]]
+
+
+def is_walkable(tags: dict[str, str]) -> bool:
+    highway = tags.get("highway")
+    if highway not in WALKABLE_HIGHWAYS or (tags.get("area") == "yes" and highway != "pedestrian"):
+        return False
+    foot = tags.get("foot")
+    if foot in _FOOT_ALLOWED:
+        return True
+    if foot in _NO_ACCESS or tags.get("access") in _NO_ACCESS:
+        return False
+    return highway != "cycleway" or tags.get("segregated") is not None
+
+
+def _parse_metres(raw: Optional[str]) -> Optional[float]:
+    match = _NUMBER.match(raw) if raw else None
+    return float(match.group(1).replace(",", ".")) if match else None
+
+
+def estimate_width(tags: dict[str, str]) -> float:
+    """Walkable width in metres: explicit width, else lanes plus sidewalks, else a per-type default."""
+    width = _parse_metres(tags.get("width")) or _parse_metres(tags.get("est_width"))
+    if width:
+        return width
+    lanes = _parse_metres(tags.get("lanes"))
+    if lanes:
+        sidewalks = {"both": 2, "left": 1, "right": 1}.get(tags.get("sidewalk", ""), 0)
+        return lanes * _LANE_WIDTH_M + sidewalks * _SIDEWALK_WIDTH_M
+    return DEFAULT_WIDTH_M.get(tags.get("highway", ""), 3.0)
+
+
+def _foot_oneway(tags: dict[str, str]) -> int:
+    """1 = forward only, -1 = backward only, 0 = both (car ``oneway`` does not bind pedestrians)."""
+    value = tags.get("oneway:foot")
+    if value in ("yes", "1", "true"):
+        return 1
+    if value == "-1":
+        return -1
+    return 0
+
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+# --- readers -------------------------------------------------------------------------------------
+
+
+def _open_xml(path: Path) -> IO[bytes]:
+    if path.suffix == ".bz2":
+        return bz2.open(path, "rb")
+    if path.suffix == ".gz":
+        return gzip.open(path, "rb")
+    return path.open("rb")
+
+
+def _iter_xml(path: Path, *, nodes: bool, ways: bool) -> Iterator[Union[tuple[int, float, float], OsmWay]]:
+    with _open_xml(path) as fh:
+        context = ET.iterparse(fh, events=("start", "end"))
+        _, root = next(context)
+        for event, elem in context:
+            if event != "end":
+                continue
+            if elem.tag == "node":
+                if nodes:
+                    yield int(elem.get("id")), float(elem.get("lat")), float(elem.get("lon"))
+            elif elem.tag == "way":
+                if ways:
+                    refs = [int(nd.get("ref")) for nd in elem.iter("nd")]
+                    tags = {tag.get("k"): tag.get("v") for tag in elem.iter("tag")}
+                    yield int(elem.get("id")), refs, tags
+            elif elem.tag != "relation":
+                continue
+            # drop what was parsed so far: the tree never grows past one element
+            root.clear()
+
+
+def _iter_pbf(path: Path, *, nodes: bool, ways: bool) -> Iterator[Union[tuple[int, float, float], OsmWay]]:
+    try:
+        import osmium
+    except ImportError as exc:  # pragma: no cover - optional dependency
+        raise RuntimeError("Reading .pbf extracts needs pyosmium (pip install osmium); use .osm/.osm.bz2 otherwise") from exc
+
+    entities = (osmium.osm.NODE if nodes else 0) | (osmium.osm.WAY if ways else 0)
+    for obj in osmium.FileProcessor(str(path), entities):
+        if obj.is_node():
+            yield obj.id, obj.location.lat, obj.location.lon
+        elif obj.is_way():
+            yield obj.id, [node.ref for node in obj.nodes], {tag.k: tag.v for tag in obj.tags}
+
+
+def iter_osm(path: Path, *, nodes: bool = False, ways: bool = False):
+    """Stream ``(id, lat, lng)`` nodes and/or ``(id, refs, tags)`` ways from an extract."""
+    reader = _iter_pbf if path.name.endswith(".pbf") else _iter_xml
+    return reader(path, nodes=nodes, ways=ways)
+
+
+# --- import --------------------------------------------------------------------------------------
+
+
+class _BatchWriter:
+    def __init__(self, db: Session, batch_size: int):
+        self.db = db
+        self.batch_size = batch_size
+        self.nodes: list[dict] = []
+        self.edges: list[dict] = []
+        self.node_count = 0
+        self.edge_count = 0
+
+    def add_node(self, row: dict) -> None:
+        self.nodes.append(row)
+
+    def add_edge(self, row: dict) -> None:
+        self.edges.append(row)
+        if len(self.edges) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        # nodes first: the edges of this batch reference them
+        bulk_insert(self.db, StreetNode, self.nodes)
+        bulk_insert(self.db, StreetEdge, self.edges)
+        self.node_count += len(self.nodes)
+        self.edge_count += len(self.edges)
+        self.nodes, self.edges = [], []
+
+
+def _node_id(osm_id: int) -> str:
+    return f"n{osm_id}"
+
+
+def import_osm_graph(
+    db: Session,
+    path: Path,
+    *,
+    batch_size: int = 5000,
+    graph_file: Optional[Path] = None,
+    collapse: bool = True,
+) -> dict:
+    """Replace the street tables with the walkable graph of the OSM extract at ``path``.
+
+    With ``collapse`` (default) degree-2 chains left where consecutive ways join
+    end to end are merged afterwards (see ``import_street_graph.collapse_chains``).
+    """
+    started = time.perf_counter()
+
+    # 1. reference counts of the nodes of walkable ways
+    uses: dict[int, int] = {}
+    way_count = 0
+    for _, refs, tags in iter_osm(path, ways=True):
+        if len(refs) < 2 or not is_walkable(tags):
+            continue
+        way_count += 1
+        for ref in refs:
+            uses[ref] = uses.get(ref, 0) + 1
+        # way ends are graph nodes even when nothing else touches them
+        uses[refs[0]] += 1
+        uses[refs[-1]] += 1
+
+    # 2. coordinates of those nodes only
+    coords: dict[int, tuple[float, float]] = {}
+    for node_id, lat, lng in iter_osm(path, nodes=True):
+        if node_id in uses:
+            coords[node_id] = (lat, lng)
+
+    db.query(StreetEdge).delete()
+    db.query(StreetNode).delete()
+    writer = _BatchWriter(db, batch_size)
+    written: set[int] = set()
+    missing = 0
+
+    # 3. split at intersections and emit segments
+    for way_id, refs, tags in iter_osm(path, ways=True):
+        if len(refs) < 2 or not is_walkable(tags):
+            continue
+        if any(ref not in coords for ref in refs):
+            # clipped at the extract boundary
+            missing += 1
+            refs = [ref for ref in refs if ref in coords]
+            if len(refs) < 2:
+                continue
+        width = estimate_width(tags)
+        oneway = _foot_oneway(tags)
+        extra = json.dumps({"osm_way": way_id, **({"name": tags["name"]} if "name" in tags else {})})
+        segment = [refs[0]]
+        part = 0
+        for ref in refs[1:]:
+            segment.append(ref)
+            if uses[ref] < 2 and ref != refs[-1]:
+                continue
+            # a loop back to its own start cannot take anyone anywhere
+            if segment[0] != segment[-1]:
+                _emit_segment(writer, written, coords, way_id, part, segment, tags, width, oneway, extra)
+                part += 1
+            segment = [ref]
+    writer.flush()
+    collapsed = collapse_stored_chains(db) if collapse else None
+    publish_street_graph_changes(db, None)
+    db.commit()
+
+    if graph_file is not None:
+        export_street_graph(db, graph_file)
+    summary = {
+        "ways": way_count,
+        "nodes": writer.node_count,
+        "edges": writer.edge_count,
+        "clipped_ways": missing,
+        "seconds": round(time.perf_counter() - started, 1),
+    }
+    if collapsed is not None:
+        summary["collapsed"] = collapsed
+        summary["nodes"] -= collapsed["nodes_removed"]
+        summary["edges"] += collapsed["edges_merged"] - collapsed["edges_removed"]
+    return summary
+
+
+def _emit_segment(
+    writer: _BatchWriter,
+    written: set[int],
+    coords: dict[int, tuple[float, float]],
+    way_id: int,
+    part: int,
+    segment: list[int],
+    tags: dict[str, str],
+    width: float,
+    oneway: int,
+    extra: str,
+) -> None:
+    for end in (segment[0], segment[-1]):
+        if end not in written:
+            written.add(end)
+            writer.add_node({"id": _node_id(end), "geom": point_wkt(*coords[end])})
+    points = [list(coords[ref]) for ref in segment]
+    length = sum(haversine_m(*points[i], *points[i + 1]) for i in range(len(points) - 1))
+    directions = []
+    if oneway >= 0:
+        directions.append((f"w{way_id}.{part}", segment[0], segment[-1], points))
+    if oneway <= 0:
+        directions.append((f"w{way_id}.{part}r", segment[-1], segment[0], points[::-1]))
+    for edge_id, source, target, shape in directions:
+        writer.add_edge(
+            {
+                "id": edge_id,
+                "source_node": _node_id(source),
+                "target_node": _node_id(target),
+                "geom": line_wkt(shape),
+                "length_m": round(length, 2),
+                "width_estimate": width,
+                "highway_type": tags.get("highway"),
+                "is_walkable": True,
+                "tags": extra,
+            }
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import the walkable street graph from an OSM extract")
+    parser.add_argument("extract", type=Path, help=".osm.pbf (needs pyosmium), .osm, .osm.gz or .osm.bz2")
+    parser.add_argument("--batch-size", type=int, default=5000, help="edges per bulk INSERT batch")
+    parser.add_argument("--keep-chains", action="store_true", help="do not merge degree-2 chains")
+    parser.add_argument(
+        "--graph-file",
+        default=settings.ROUTING_GRAPH_PATH,
+        help="binary graph mmap'ed by the API at startup (empty to skip)",
+    )
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        summary = import_osm_graph(
+            db,
+            args.extract,
+            batch_size=args.batch_size,
+            graph_file=Path(args.graph_file) if args.graph_file else None,
+            collapse=not args.keep_chains,
+        )
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
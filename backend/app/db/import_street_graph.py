@@ -2,69 +2,339 @@ from __future__ import annotations
 
 import argparse
 import json
-import uuid
 from pathlib import Path
+from typing import Optional
 
+from sqlalchemy import delete, insert, update
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
+from app.core.street_graph import (
+    GraphChangeSet,
+    export_street_graph,
+    parse_line_wkt,
+    parse_point_wkt,
+    publish_street_graph_changes,
+)
 from app.db.session import SessionLocal
 from app.models.models import StreetEdge, StreetNode
 
 SAMPLE_GRAPH_PATH = Path(__file__).resolve().parent / "datasets" / "street_graph_sevilla.sample.json"
 
 
-def _point_wkt(lat: float, lng: float) -> str:
+def point_wkt(lat: float, lng: float) -> str:
     return f"POINT({lng} {lat})"
 
 
-def _line_wkt(points: list[list[float]]) -> str:
+def line_wkt(points: list[list[float]]) -> str:
     pairs = ", ".join(f"{lng} {lat}" for lat, lng in points)
     return f"LINESTRING({pairs})"
 
 
-def import_graph(db: Session, dataset_path: Path = SAMPLE_GRAPH_PATH) -> dict[str, int]:
-    payload = json.loads(dataset_path.read_text(encoding="utf-8"))
-    nodes = payload.get("nodes", [])
-    edges = payload.get("edges", [])
-
-    db.query(StreetEdge).delete()
-    db.query(StreetNode).delete()
-
-    for node in nodes:
-        db.add(
-            StreetNode(
-                id=node["id"],
-                geom=_point_wkt(node["lat"], node["lng"]),
-            )
-        )
+# bulk statements are chunked to stay under the bound-parameter limits of the drivers
+_CHUNK = 500
+
+# edge columns that change the routing graph (besides length_m, which is patched in place)
+_SHAPE_COLUMNS = ("source_node", "target_node", "geom", "is_walkable")
+
+
+def _collapsed_nodes(tags: Optional[str]) -> list:
+    # the snap points of a collapsed chain (see collapse_chains) are part of the compiled graph
+    return json.loads(tags or "{}").get("collapsed_nodes", [])
+
+
+def _node_row(node: dict) -> dict:
+    return {"id": node["id"], "geom": point_wkt(node["lat"], node["lng"])}
+
+
+def _edge_id(edge: dict) -> str:
+    # stable fallback id so that re-imports of the same dataset can be diffed
+    return edge.get("id") or f"{edge['source_node']}->{edge['target_node']}"
+
+
+def _edge_row(edge: dict) -> dict:
+    return {
+        "id": _edge_id(edge),
+        "source_node": edge["source_node"],
+        "target_node": edge["target_node"],
+        "geom": line_wkt(edge["geometry"]),
+        "length_m": float(edge["length_m"]),
+        "width_estimate": edge.get("width_estimate"),
+        "highway_type": edge.get("highway_type"),
+        "is_walkable": edge.get("is_walkable", True),
+        "tags": json.dumps(edge.get("tags", {})),
+    }
 
+
+def _collapsible(node_id: str, out_edges: dict, in_edges: dict) -> bool:
+    """True for a shape node between exactly two neighbours that every path just passes through."""
+    outs, ins = out_edges.get(node_id, []), in_edges.get(node_id, [])
+    incident = outs + ins
+    if not incident or any(not edge.get("is_walkable", True) for edge in incident):
+        return False
+    if len({edge.get("highway_type") for edge in incident}) != 1:
+        return False
+    targets = {edge["target_node"] for edge in outs}
+    sources = {edge["source_node"] for edge in ins}
+    if len(targets) != len(outs) or len(sources) != len(ins) or node_id in targets | sources:
+        return False
+    neighbours = targets | sources
+    if len(neighbours) != 2:
+        return False
+    # two-way street, or a one-way one that enters from one side and leaves by the other
+    return (targets == sources == neighbours) or (len(outs) == len(ins) == 1 and targets != sources)
+
+
+def collapse_chains(nodes: list[dict], edges: list[dict]) -> tuple[list[dict], list[dict]]:
+    """Merge chains of degree-2 shape nodes into single edges (dataset format in, dataset format out).
+
+    A merged edge keeps the id and tags of the first edge of its chain, the full
+    geometry, the summed length and the narrowest width. The removed nodes are
+    listed in ``tags["collapsed_nodes"]`` as ``[id, lat, lng, offset_m]`` so the
+    router can still snap points near them (see ``CompiledStreetGraph.snap``).
+    """
+    coords = {node["id"]: (node["lat"], node["lng"]) for node in nodes}
+    out_edges: dict[str, list[dict]] = {}
+    in_edges: dict[str, list[dict]] = {}
+    for edge in edges:
+        out_edges.setdefault(edge["source_node"], []).append(edge)
+        in_edges.setdefault(edge["target_node"], []).append(edge)
+    collapsible = {node_id for node_id in coords if _collapsible(node_id, out_edges, in_edges)}
+    if not collapsible:
+        return nodes, edges
+
+    merged: list[dict] = []
+    absorbed_edges: set[int] = set()
+    absorbed_nodes: set[str] = set()
     for edge in edges:
-        db.add(
-            StreetEdge(
-                id=edge.get("id", str(uuid.uuid4())),
-                source_node=edge["source_node"],
-                target_node=edge["target_node"],
-                geom=_line_wkt(edge["geometry"]),
-                length_m=edge["length_m"],
-                width_estimate=edge.get("width_estimate"),
-                highway_type=edge.get("highway_type"),
-                is_walkable=edge.get("is_walkable", True),
-                tags=json.dumps(edge.get("tags", {})),
-            )
+        if edge["source_node"] in collapsible or edge["target_node"] not in collapsible:
+            continue
+        chain = [edge]
+        node = edge["target_node"]
+        while node in collapsible:
+            previous = chain[-1]["source_node"]
+            chain.append(next(e for e in out_edges[node] if e["target_node"] != previous))
+            node = chain[-1]["target_node"]
+        if node == edge["source_node"]:
+            # a loop back to its start: nothing to merge it into
+            continue
+        geometry = list(chain[0]["geometry"])
+        collapsed = []
+        offset = 0.0
+        for position, link in enumerate(chain):
+            if position:
+                lat, lng = coords[link["source_node"]]
+                collapsed.append([link["source_node"], lat, lng, round(offset, 2)])
+                geometry.extend(link["geometry"][1:])
+            # nodes collapsed by an earlier run keep their place along the new edge
+            for node_id, lat, lng, inner in link.get("tags", {}).get("collapsed_nodes", []):
+                collapsed.append([node_id, lat, lng, round(offset + inner, 2)])
+            offset += float(link["length_m"])
+        widths = [link["width_estimate"] for link in chain if link.get("width_estimate") is not None]
+        merged.append(
+            {
+                **chain[0],
+                "id": _edge_id(chain[0]),
+                "target_node": node,
+                "geometry": geometry,
+                "length_m": round(sum(float(link["length_m"]) for link in chain), 2),
+                "width_estimate": min(widths) if widths else None,
+                "tags": {**chain[0].get("tags", {}), "collapsed_nodes": collapsed},
+            }
         )
+        absorbed_edges.update(id(link) for link in chain)
+        absorbed_nodes.update(link["source_node"] for link in chain[1:])
+
+    kept_nodes = [node for node in nodes if node["id"] not in absorbed_nodes]
+    kept_edges = [edge for edge in edges if id(edge) not in absorbed_edges]
+    return kept_nodes, kept_edges + merged
+
+
+def _chunks(rows: list, size: int = _CHUNK):
+    for i in range(0, len(rows), size):
+        yield rows[i : i + size]
+
+
+def bulk_insert(db: Session, model, rows: list[dict]) -> None:
+    for chunk in _chunks(rows):
+        db.execute(insert(model), chunk)
 
+
+def _bulk_update(db: Session, model, rows: list[dict]) -> None:
+    # ORM bulk UPDATE by primary key
+    for chunk in _chunks(rows):
+        db.execute(update(model), chunk)
+
+
+def _bulk_delete(db: Session, model, ids: list[str]) -> None:
+    for chunk in _chunks(ids):
+        db.execute(delete(model).where(model.id.in_(chunk)))
+
+
+def _diff(incoming: dict[str, dict], stored: dict[str, dict]) -> tuple[list[dict], list[dict], list[str]]:
+    added = [row for row_id, row in incoming.items() if row_id not in stored]
+    updated = [row for row_id, row in incoming.items() if row_id in stored and stored[row_id] != row]
+    removed = [row_id for row_id in stored if row_id not in incoming]
+    return added, updated, removed
+
+
+def _apply_incremental(db: Session, nodes: dict[str, dict], edges: dict[str, dict]) -> GraphChangeSet:
+    stored_nodes = {row.id: {"id": row.id, "geom": row.geom} for row in db.query(StreetNode.id, StreetNode.geom)}
+    stored_edges = {
+        row.id: dict(row._mapping)
+        for row in db.query(
+            StreetEdge.id,
+            StreetEdge.source_node,
+            StreetEdge.target_node,
+            StreetEdge.geom,
+            StreetEdge.length_m,
+            StreetEdge.width_estimate,
+            StreetEdge.highway_type,
+            StreetEdge.is_walkable,
+            StreetEdge.tags,
+        )
+    }
+    nodes_added, nodes_updated, nodes_removed = _diff(nodes, stored_nodes)
+    edges_added, edges_updated, edges_removed = _diff(edges, stored_edges)
+
+    # removed edges go first and removed nodes last, so foreign keys hold at every step
+    _bulk_delete(db, StreetEdge, edges_removed)
+    bulk_insert(db, StreetNode, nodes_added)
+    _bulk_update(db, StreetNode, nodes_updated)
+    bulk_insert(db, StreetEdge, edges_added)
+    _bulk_update(db, StreetEdge, edges_updated)
+    _bulk_delete(db, StreetNode, nodes_removed)
+
+    changes = GraphChangeSet(
+        nodes_added=[row["id"] for row in nodes_added],
+        nodes_updated=[row["id"] for row in nodes_updated],
+        nodes_removed=nodes_removed,
+        edges_added=[row["id"] for row in edges_added],
+        edges_updated=[row["id"] for row in edges_updated],
+        edges_removed=edges_removed,
+    )
+    for row in edges_updated:
+        before = stored_edges[row["id"]]
+        if any(before[column] != row[column] for column in _SHAPE_COLUMNS) or (
+            before["tags"] != row["tags"] and _collapsed_nodes(before["tags"]) != _collapsed_nodes(row["tags"])
+        ):
+            changes.edges_reshaped.append(row["id"])
+            continue
+        if before["length_m"] != row["length_m"]:
+            changes.edge_lengths[row["id"]] = row["length_m"]
+        if before["width_estimate"] != row["width_estimate"]:
+            changes.edge_widths[row["id"]] = row["width_estimate"]
+    return changes
+
+
+def collapse_stored_chains(db: Session) -> dict[str, int]:
+    """Run :func:`collapse_chains` over the street tables (holds the graph, not the source file, in memory)."""
+    nodes = []
+    for node_id, geom in db.query(StreetNode.id, StreetNode.geom):
+        lat, lng = parse_point_wkt(geom)
+        nodes.append({"id": node_id, "lat": lat, "lng": lng})
+    edges = [
+        {**row._mapping, "geometry": parse_line_wkt(row.geom), "tags": json.loads(row.tags or "{}")}
+        for row in db.query(
+            StreetEdge.id,
+            StreetEdge.source_node,
+            StreetEdge.target_node,
+            StreetEdge.geom,
+            StreetEdge.length_m,
+            StreetEdge.width_estimate,
+            StreetEdge.highway_type,
+            StreetEdge.is_walkable,
+            StreetEdge.tags,
+        )
+    ]
+    kept_nodes, kept_edges = collapse_chains(nodes, edges)
+    original = {id(edge) for edge in edges}
+    merged = [edge for edge in kept_edges if id(edge) not in original]
+    kept_ids = {id(edge) for edge in kept_edges}
+    absorbed = [edge["id"] for edge in edges if id(edge) not in kept_ids]
+    kept_node_ids = {node["id"] for node in kept_nodes}
+    removed_nodes = [node["id"] for node in nodes if node["id"] not in kept_node_ids]
+
+    _bulk_delete(db, StreetEdge, absorbed)
+    bulk_insert(db, StreetEdge, [_edge_row(edge) for edge in merged])
+    _bulk_delete(db, StreetNode, removed_nodes)
+    return {"nodes_removed": len(removed_nodes), "edges_removed": len(absorbed), "edges_merged": len(merged)}
+
+
+def import_graph(
+    db: Session,
+    dataset_path: Path = SAMPLE_GRAPH_PATH,
+    *,
+    graph_file: Optional[Path] = None,
+    incremental: bool = False,
+    collapse: bool = False,
+) -> dict:
+    """Load ``dataset_path`` into the street tables; also write the binary graph to ``graph_file`` if given.
+
+    By default the tables are replaced. With ``incremental`` the dataset is
+    diffed against the stored rows and only inserted, updated and deleted rows
+    are written; the resulting :class:`GraphChangeSet` is published so the API
+    workers patch their graph (length/width-only changes) or keep it as is instead
+    of rebuilding it.
+    ``collapse`` merges degree-2 chains first (see :func:`collapse_chains`).
+    """
+    payload = json.loads(dataset_path.read_text(encoding="utf-8"))
+    raw_nodes, raw_edges = payload.get("nodes", []), payload.get("edges", [])
+    if collapse:
+        raw_nodes, raw_edges = collapse_chains(raw_nodes, raw_edges)
+    nodes = {row["id"]: row for row in map(_node_row, raw_nodes)}
+    edges = {row["id"]: row for row in map(_edge_row, raw_edges)}
+
+    if incremental:
+        changes = _apply_incremental(db, nodes, edges)
+    else:
+        db.query(StreetEdge).delete()
+        db.query(StreetNode).delete()
+        bulk_insert(db, StreetNode, list(nodes.values()))
+        bulk_insert(db, StreetEdge, list(edges.values()))
+        changes = None
+    # API workers pick the revision up on their next probe, together with the rows
+    outcome = publish_street_graph_changes(db, changes)
     db.commit()
-    return {"nodes": len(nodes), "edges": len(edges)}
+
+    if graph_file is not None and (changes is None or not changes.empty):
+        export_street_graph(db, graph_file)
+    summary: dict = {"nodes": len(nodes), "edges": len(edges)}
+    if changes is not None:
+        summary["changes"] = changes.summary()
+        summary["graph"] = outcome
+    return summary
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Import walkable Sevilla street graph")
     parser.add_argument("--dataset", type=Path, default=SAMPLE_GRAPH_PATH)
+    parser.add_argument(
+        "--graph-file",
+        default=settings.ROUTING_GRAPH_PATH,
+        help="binary graph mmap'ed by the API at startup (empty to skip)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="diff against the stored graph and write only the changed rows",
+    )
+    parser.add_argument(
+        "--collapse-chains",
+        action="store_true",
+        help="merge chains of degree-2 shape nodes into single edges",
+    )
     args = parser.parse_args()
 
     db = SessionLocal()
     try:
-        summary = import_graph(db, dataset_path=args.dataset)
+        summary = import_graph(
+            db,
+            dataset_path=args.dataset,
+            graph_file=Path(args.graph_file) if args.graph_file else None,
+            incremental=args.incremental,
+            collapse=args.collapse_chains,
+        )
         print(json.dumps(summary, ensure_ascii=False, indent=2))
     finally:
         db.close()
@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+import argparse
+import json
+import time
+
+from app.core.itinerary_matching import match_procession_itineraries
+from app.core.street_graph import load_street_graph
+from app.db.session import SessionLocal
+
+
+def match(force: bool = False) -> dict:
+    db = SessionLocal()
+    try:
+        graph = load_street_graph(db)
+        started = time.perf_counter()
+        summary = match_procession_itineraries(db, graph, force=force)
+    finally:
+        db.close()
+    return {**summary, "seconds": round(time.perf_counter() - started, 2)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Match procession itinerary texts to street edge paths")
+    parser.add_argument("--force", action="store_true", help="re-match processions whose text and graph did not change")
+    args = parser.parse_args()
+    print(json.dumps(match(args.force), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
 import uuid
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
@@ -6,9 +8,32 @@ from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from app.api.api import api_router
 from app.core.config import settings
+from app.core.crowd_overlay import edge_cells
+from app.core.routing_engines import get_routing_engine
+from app.core.routing_pool import shutdown_routing_pool
+from app.core.routing_workers import get_routing_processes, shutdown_routing_processes, start_routing_processes
+from app.core.street_graph import warm_street_graph
+from app.db.session import SessionLocal
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    graph = warm_street_graph(SessionLocal)
+    if graph is not None:
+        # crowd cells are mapped in this process, which builds the penalties it ships to the search
+        edge_cells(graph)
+        if get_routing_processes() is not None:
+            start_routing_processes(graph)
+        else:
+            get_routing_engine().prepare(graph)
+    yield
+    shutdown_routing_pool()
+    shutdown_routing_processes()
+
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
+    lifespan=lifespan,
     version="1.0.0",
     description="Cofrade 360 API - Holy Week planning and navigation",
 )
@@ -35,6 +60,7 @@ async def http_exception_handler(request: Request, exc: StarletteHTTPException):
             "code": f"HTTP_{exc.status_code}",
             "trace_id": trace_id,
         },
+        headers=getattr(exc, "headers", None),
     )
 
 
@@ -208,6 +208,8 @@ class ProcessionSchedulePoint(Base):
     point_type = Column(String, nullable=False)
     label = Column(String, nullable=True)
     scheduled_datetime = Column(DateTime, nullable=False)
+    # set on insert and edit, so the blockage probe sees a schedule re-inserted with new ids
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
 
 class ProcessionItineraryText(Base):
@@ -220,6 +222,24 @@ class ProcessionItineraryText(Base):
     accessed_at = Column(DateTime, nullable=True)
 
 
+class ProcessionEdgePath(Base):
+    """Itinerary text map-matched to the street graph (see app.core.itinerary_matching)."""
+
+    __tablename__ = "procession_edge_paths"
+
+    id = Column(String, primary_key=True, index=True)
+    procession_id = Column(String, ForeignKey("processions.id"), nullable=False, unique=True, index=True)
+    # JSON list of street edge ids in walking order
+    edge_ids = Column(Text, nullable=False, default="[]")
+    # JSON lists of the itinerary entries resolved to a street name and of those left out
+    matched_streets = Column(Text, nullable=False, default="[]")
+    unmatched = Column(Text, nullable=False, default="[]")
+    # sha1 of the itinerary text and fingerprint of the graph it was matched on, to skip unchanged ones
+    text_hash = Column(String, nullable=False)
+    graph_fingerprint = Column(String, nullable=False)
+    matched_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
 class DataProvenance(Base):
     __tablename__ = "data_provenance"
 
@@ -269,6 +289,18 @@ class StreetEdge(Base):
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
 
+class StreetGraphRevision(Base):
+    """One import of the street tables, read by every API worker to patch or reload its graph."""
+
+    __tablename__ = "street_graph_revisions"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String, nullable=False)  # reload | patch
+    # patch only: JSON {"edge_lengths": {edge_id: m}, "edge_widths": {edge_id: m or null}}
+    changes = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
 class RouteRestriction(Base):
     __tablename__ = "route_restrictions"
 
@@ -279,6 +311,8 @@ class RouteRestriction(Base):
     reason = Column(String, nullable=False)
     severity = Column(Float, nullable=False, default=100.0)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # bumped on every edit, so the routing timeline probe sees changed windows or severities
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
 
 
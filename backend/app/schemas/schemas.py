@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from datetime import datetime
 from enum import Enum
-from typing import Generic, List, Optional, TypeVar
+from typing import Generic, List, Literal, Optional, TypeVar
 
 from pydantic import BaseModel, ConfigDict, EmailStr, Field, model_validator
 
@@ -406,6 +406,8 @@ class RouteRequest(BaseModel):
     datetime: datetime
     target: Optional[RoutingTarget] = None
     constraints: RoutingConstraints = RoutingConstraints()
+    # "encoded": polylines come as Google encoded strings in `encoded_polyline` (polyline = [])
+    polyline_format: Literal["coordinates", "encoded"] = "coordinates"
 
     @model_validator(mode="after")
     def validate_destination_or_target(self):
@@ -418,15 +420,84 @@ class RouteAlternative(BaseModel):
     polyline: List[List[float]]
     eta_seconds: int
     explanation: List[str]
+    bulla_score: float = 0.0
+    encoded_polyline: Optional[str] = None
 
 
 class RouteResponse(BaseModel):
     polyline: List[List[float]]
+    encoded_polyline: Optional[str] = None
     eta_seconds: int
     bulla_score: float
     warnings: List[str]
     explanation: List[str]
     alternatives: List[RouteAlternative] = []
+
+
+class EtaMatrixRequest(BaseModel):
+    origins: List[List[float]] = Field(..., min_length=1)  # [[lat, lng], ...]
+    destinations: Optional[List[List[float]]] = Field(default=None, min_length=1)  # defaults to origins
+    datetime: datetime
+
+    @model_validator(mode="after")
+    def validate_points(self):
+        for point in self.origins + (self.destinations or []):
+            if len(point) != 2:
+                raise ValueError("Every point must be [lat, lng]")
+        return self
+
+
+class EtaMatrixResponse(BaseModel):
+    # eta_seconds[i][j]: origin i -> destination j, null when unreachable
+    eta_seconds: List[List[Optional[int]]]
+    warnings: List[str] = []
+
+
+class IsochroneRequest(BaseModel):
+    origin: List[float] = Field(..., min_length=2, max_length=2)  # [lat, lng]
+    datetime: datetime
+    minutes: int = Field(..., gt=0)
+    avoid_bulla: bool = True
+
+
+class IsochroneEdge(BaseModel):
+    edge_id: str
+    seconds: int
+    reachable_fraction: float
+
+
+class IsochroneResponse(BaseModel):
+    minutes: int
+    polygon: List[List[float]]  # closed ring of [lat, lng]
+    edges: List[IsochroneEdge]
+    warnings: List[str] = []
+
+
+class RouteCacheStatsResponse(BaseModel):
+    size: int
+    max_entries: int
+    ttl_seconds: float
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    hit_rate: float
+
+
+class ModeCalleWsStatsResponse(BaseModel):
+    connections: int
+    pending: int
+    computing: int
+    received: int
+    computed: int
+    coalesced: int
+    throttled: int
+    # shared routing pool the computations run on
+    pool_in_flight: int
+    pool_capacity: int
+    pool_rejected: int
+
+
 class ModeCalleWsLocation(BaseModel):
     lat: float
     lng: float
@@ -444,6 +515,7 @@ class ModeCalleWsLocationUpdate(BaseModel):
     datetime: datetime
     target: RoutingTarget
     constraints: RoutingConstraints = RoutingConstraints()
+    polyline_format: Literal["coordinates", "encoded"] = "coordinates"
 
 
 class ModeCalleWsHeartbeat(BaseModel):
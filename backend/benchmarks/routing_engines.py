@@ -0,0 +1,103 @@
+"""Compare routing engines on a synthetic city-scale street grid.
+
+Usage (from ``backend/``)::
+
+    python -m benchmarks.routing_engines --rows 120 --cols 120 --queries 200
+
+Reports settled nodes and p50/p99 latency per engine; all engines must agree on
+the route cost, otherwise the run aborts.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import random
+import statistics
+import time
+
+from app.core.routing_engines import ENGINES, RoutingEngine
+from app.core.street_graph import CompiledStreetGraph, compile_street_graph
+
+# ~ metres per degree around Sevilla
+_M_PER_DEG_LAT = 111_195.0
+_M_PER_DEG_LNG = 88_300.0
+
+
+def synthetic_city_graph(rows: int, cols: int, *, spacing_m: float = 80.0, seed: int = 42) -> CompiledStreetGraph:
+    """Jittered grid with two-way streets, a few one-way ones and ~8% missing blocks."""
+    rng = random.Random(seed)
+    lat0, lng0 = 37.37, -6.01
+    nodes = []
+    for r in range(rows):
+        for c in range(cols):
+            lat = lat0 + (r * spacing_m + rng.uniform(-15, 15)) / _M_PER_DEG_LAT
+            lng = lng0 + (c * spacing_m + rng.uniform(-15, 15)) / _M_PER_DEG_LNG
+            nodes.append((f"n{r}_{c}", lat, lng))
+    coords = {node_id: (lat, lng) for node_id, lat, lng in nodes}
+
+    edges = []
+    for r in range(rows):
+        for c in range(cols):
+            for dr, dc in ((0, 1), (1, 0)):
+                rr, cc = r + dr, c + dc
+                if rr >= rows or cc >= cols or rng.random() < 0.08:
+                    continue
+                a, b = f"n{r}_{c}", f"n{rr}_{cc}"
+                (lat_a, lng_a), (lat_b, lng_b) = coords[a], coords[b]
+                straight = math.hypot((lat_a - lat_b) * _M_PER_DEG_LAT, (lng_a - lng_b) * _M_PER_DEG_LNG)
+                length = straight * rng.uniform(1.0, 1.3)
+                edges.append((f"{a}>{b}", a, b, length))
+                if rng.random() > 0.1:
+                    edges.append((f"{b}>{a}", b, a, length))
+    return compile_street_graph(nodes, edges)
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run(graph: CompiledStreetGraph, engines: list[RoutingEngine], queries: int, seed: int = 7) -> dict:
+    rng = random.Random(seed)
+    pairs = [(rng.randrange(graph.node_count), rng.randrange(graph.node_count)) for _ in range(queries)]
+    report: dict[str, dict] = {}
+    reference: dict[tuple[int, int], float] = {}
+    for engine in engines:
+        started = time.perf_counter()
+        engine.prepare(graph)
+        prepare_ms = (time.perf_counter() - started) * 1000
+        latencies, settled = [], []
+        for start, goal in pairs:
+            t0 = time.perf_counter()
+            result = engine.find_path(graph, start, goal)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            settled.append(result.settled)
+            expected = reference.setdefault((start, goal), result.cost)
+            if not math.isclose(expected, result.cost, rel_tol=1e-9, abs_tol=1e-6):
+                raise AssertionError(f"{engine.name} disagrees on {start}->{goal}: {result.cost} != {expected}")
+        report[engine.name] = {
+            "prepare_ms": round(prepare_ms, 1),
+            "settled_mean": round(statistics.mean(settled), 1),
+            "latency_p50_ms": round(_percentile(latencies, 50), 3),
+            "latency_p99_ms": round(_percentile(latencies, 99), 3),
+        }
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark routing engines on a synthetic grid")
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--cols", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--engines", nargs="*", default=list(ENGINES))
+    args = parser.parse_args()
+
+    graph = synthetic_city_graph(args.rows, args.cols)
+    engines = [ENGINES[name]() for name in args.engines]
+    report = run(graph, engines, args.queries)
+    print(json.dumps({"nodes": graph.node_count, "edges": graph.edge_count, "engines": report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
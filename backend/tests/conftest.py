@@ -10,8 +10,16 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 from app.main import app
+from app.core.config import settings
 from app.core.deps import get_db
 from app.core.security import get_password_hash, create_access_token
+from app.core.procession_blockages import invalidate_procession_blockages
+from app.core.restrictions import invalidate_restriction_timeline
+from app.core.crowd_overlay import clear_crowd_overlay
+from app.core.route_cache import route_cache
+from app.core.shared_cache import InMemorySharedCache, set_shared_cache
+from app.core.street_graph import invalidate_street_graph
+from app.core.time_dependent import clear_time_dependent_costs
 from app.models.models import (
     AnalyticsEvent,
     CrowdReport,
@@ -25,16 +33,21 @@ from app.models.models import (
     NotificationEvent,
     PlanItem,
     Procession,
+    ProcessionEdgePath,
     ProcessionItineraryText,
     ProcessionSchedulePoint,
     RouteRestriction,
     StreetEdge,
+    StreetGraphRevision,
     StreetNode,
     Titular,
     User,
     UserPlan,
 )
 
+# tests compile the graph from their own tables, never from a local data/ graph file
+settings.ROUTING_GRAPH_PATH = ""
+
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
@@ -79,15 +92,24 @@ def setup_tables():
     Procession.__table__.create(bind=engine, checkfirst=True)
     ProcessionSchedulePoint.__table__.create(bind=engine, checkfirst=True)
     ProcessionItineraryText.__table__.create(bind=engine, checkfirst=True)
+    ProcessionEdgePath.__table__.create(bind=engine, checkfirst=True)
     DataProvenance.__table__.create(bind=engine, checkfirst=True)
     StreetNode.__table__.create(bind=engine, checkfirst=True)
     StreetEdge.__table__.create(bind=engine, checkfirst=True)
+    StreetGraphRevision.__table__.create(bind=engine, checkfirst=True)
     RouteRestriction.__table__.create(bind=engine, checkfirst=True)
     CrowdReport.__table__.create(bind=engine, checkfirst=True)
     CrowdSignal.__table__.create(bind=engine, checkfirst=True)
     AnalyticsEvent.__table__.create(bind=engine, checkfirst=True)
     NotificationEvent.__table__.create(bind=engine, checkfirst=True)
     AuditLog.__table__.create(bind=engine, checkfirst=True)
+    invalidate_street_graph()
+    invalidate_restriction_timeline()
+    invalidate_procession_blockages()
+    route_cache.clear()
+    clear_crowd_overlay()
+    clear_time_dependent_costs()
+    set_shared_cache(InMemorySharedCache())
     yield
     AuditLog.__table__.drop(bind=engine, checkfirst=True)
     NotificationEvent.__table__.drop(bind=engine, checkfirst=True)
@@ -95,9 +117,11 @@ def setup_tables():
     CrowdSignal.__table__.drop(bind=engine, checkfirst=True)
     CrowdReport.__table__.drop(bind=engine, checkfirst=True)
     RouteRestriction.__table__.drop(bind=engine, checkfirst=True)
+    StreetGraphRevision.__table__.drop(bind=engine, checkfirst=True)
     StreetEdge.__table__.drop(bind=engine, checkfirst=True)
     StreetNode.__table__.drop(bind=engine, checkfirst=True)
     DataProvenance.__table__.drop(bind=engine, checkfirst=True)
+    ProcessionEdgePath.__table__.drop(bind=engine, checkfirst=True)
     ProcessionItineraryText.__table__.drop(bind=engine, checkfirst=True)
     ProcessionSchedulePoint.__table__.drop(bind=engine, checkfirst=True)
     Procession.__table__.drop(bind=engine, checkfirst=True)
@@ -0,0 +1,90 @@
+import random
+
+import pytest
+
+from app.core import contraction
+from app.core.contraction import ContractionHierarchy, build_contraction_hierarchy, load_or_build_hierarchy
+from app.core.routing_engines import ContractionHierarchyEngine, dijkstra_distances
+from app.core.street_graph import patch_edge_costs
+from benchmarks.routing_engines import synthetic_city_graph
+
+
+@pytest.fixture(scope="module")
+def graph():
+    return synthetic_city_graph(14, 14, seed=9)
+
+
+@pytest.fixture(scope="module")
+def hierarchy(graph):
+    return build_contraction_hierarchy(graph)
+
+
+def _assert_matches_dijkstra(graph, hierarchy, metric, penalties, pairs):
+    for start, goal in pairs:
+        expected = dijkstra_distances(graph, start, penalties=penalties)[goal]
+        cost, slots, _ = hierarchy.query(metric, start, goal)
+        assert cost == pytest.approx(expected)
+        if slots:
+            assert graph.sources[slots[0]] == start and graph.targets[slots[-1]] == goal
+            assert all(graph.targets[a] == graph.sources[b] for a, b in zip(slots, slots[1:]))
+            assert sum(graph.weights[s] + penalties.get(s, 0.0) for s in slots) == pytest.approx(cost)
+
+
+def test_base_metric_matches_dijkstra(graph, hierarchy):
+    rng = random.Random(1)
+    pairs = [(rng.randrange(graph.node_count), rng.randrange(graph.node_count)) for _ in range(40)]
+    _assert_matches_dijkstra(graph, hierarchy, hierarchy.base, {}, pairs)
+
+
+def test_recustomization_applies_penalties_without_recontraction(graph, hierarchy):
+    rng = random.Random(2)
+    penalties = {rng.randrange(graph.edge_count): rng.choice([120.0, 5000.0]) for _ in range(25)}
+
+    metric = hierarchy.recustomize(graph, penalties)
+    full = hierarchy.customize(graph, penalties)
+    assert list(metric.cost_up) == list(full.cost_up)
+    assert list(metric.cost_down) == list(full.cost_down)
+    # the base metric is left untouched
+    assert list(hierarchy.base.cost_up) == list(hierarchy.customize(graph).cost_up)
+
+    pairs = [(graph.sources[slot], graph.targets[slot]) for slot in penalties]
+    pairs += [(rng.randrange(graph.node_count), rng.randrange(graph.node_count)) for _ in range(30)]
+    _assert_matches_dijkstra(graph, hierarchy, metric, penalties, pairs)
+
+
+def test_serialized_hierarchy_round_trips_and_detects_stale_graphs(graph, hierarchy, tmp_path):
+    path = tmp_path / "graph.cch"
+    hierarchy.save(path)
+    loaded = ContractionHierarchy.load(path)
+    assert loaded.fingerprint == graph.fingerprint
+    assert list(loaded.arc_heads) == list(hierarchy.arc_heads)
+    assert loaded.query(loaded.base, 0, graph.node_count - 1) == hierarchy.query(hierarchy.base, 0, graph.node_count - 1)
+
+    other = synthetic_city_graph(6, 6, seed=1)
+    rebuilt = load_or_build_hierarchy(other, path)
+    assert rebuilt.fingerprint == other.fingerprint
+    assert rebuilt.node_count == other.node_count
+
+
+def test_weight_only_change_recustomizes_instead_of_recontracting(graph, hierarchy, tmp_path, monkeypatch):
+    path = tmp_path / "graph.cch"
+    hierarchy.save(path)
+    patched = patch_edge_costs(graph, lengths={graph.edge_ids[slot]: 900.0 for slot in range(0, 40, 3)})
+    assert patched.fingerprint != graph.fingerprint
+
+    def no_contraction(graph):
+        raise AssertionError("the topology did not change")
+
+    monkeypatch.setattr(contraction, "build_contraction_hierarchy", no_contraction)
+    from_file = load_or_build_hierarchy(patched, path)
+    engine = ContractionHierarchyEngine(path="")
+    engine._hierarchy = hierarchy
+    in_memory = engine.prepare(patched)
+    for customized in (from_file, in_memory):
+        assert customized.fingerprint == patched.fingerprint
+        assert list(customized.arc_heads) == list(hierarchy.arc_heads)
+        rng = random.Random(3)
+        pairs = [(rng.randrange(graph.node_count), rng.randrange(graph.node_count)) for _ in range(30)]
+        _assert_matches_dijkstra(patched, customized, customized.base, {}, pairs)
+    # the hierarchy other threads may still be querying keeps its metric
+    assert hierarchy.fingerprint == graph.fingerprint
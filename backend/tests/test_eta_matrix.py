@@ -0,0 +1,96 @@
+import random
+from datetime import datetime
+
+import pytest
+
+from app.core.config import settings
+from app.core.routing_engines import AStarEngine, ContractionHierarchyEngine, dijkstra_distances
+from app.models.models import StreetEdge, StreetNode
+from benchmarks.routing_engines import synthetic_city_graph
+from tests.conftest import auth_header, make_user
+
+NODES = {"h": (37.3900, -5.9900), "n": (37.3905, -5.9900), "f": (37.3900, -5.9930), "x": (37.3950, -5.9800)}
+
+
+def _seed(db):
+    for node_id, (lat, lng) in NODES.items():
+        db.add(StreetNode(id=node_id, geom=f"POINT({lng} {lat})"))
+    # "n" is next door in a straight line but across the river: only reachable the long way
+    for a, b, length in (("h", "f", 300), ("h", "n", 1500), ("f", "n", 1400)):
+        for source, target in ((a, b), (b, a)):
+            (lat_a, lng_a), (lat_b, lng_b) = NODES[source], NODES[target]
+            db.add(
+                StreetEdge(
+                    id=f"{source}{target}",
+                    source_node=source,
+                    target_node=target,
+                    geom=f"LINESTRING({lng_a} {lat_a}, {lng_b} {lat_b})",
+                    length_m=length,
+                )
+            )
+    db.commit()
+
+
+@pytest.mark.parametrize("engine", [AStarEngine(), ContractionHierarchyEngine(path="")], ids=lambda e: e.name)
+def test_distance_table_matches_dijkstra(engine):
+    graph = synthetic_city_graph(15, 15, seed=8)
+    rng = random.Random(3)
+    sources = [rng.randrange(graph.node_count) for _ in range(6)]
+    targets = [rng.randrange(graph.node_count) for _ in range(9)]
+    penalties = {rng.randrange(graph.edge_count): 400.0 for _ in range(10)}
+    for pen in ({}, penalties):
+        table = engine.distance_table(graph, sources, targets, pen)
+        for i, source in enumerate(sources):
+            expected = dijkstra_distances(graph, source, penalties=pen)
+            assert list(table[i]) == pytest.approx([expected[t] for t in targets])
+    # more sources than targets runs the searches backwards
+    table = engine.distance_table(graph, targets, sources[:2])
+    assert [row[0] for row in table] == pytest.approx([dijkstra_distances(graph, t)[sources[0]] for t in targets])
+
+
+def test_matrix_endpoint_returns_network_times(client, db):
+    _seed(db)
+    points = [list(NODES["h"]), list(NODES["n"]), list(NODES["f"]), list(NODES["x"])]
+    res = client.post("/api/v1/routing/matrix", json={"origins": points, "datetime": datetime(2026, 4, 9, 21, 0).isoformat()})
+    assert res.status_code == 200
+    payload = res.json()
+    assert payload["eta_seconds"][0] == [0, int(1500 / 1.28), int(300 / 1.28), None]
+    assert payload["eta_seconds"][2][1] == int(1400 / 1.28)
+    assert payload["warnings"]
+
+
+def test_matrix_endpoint_rejects_oversized_requests(client, monkeypatch):
+    monkeypatch.setattr(settings, "ROUTING_MATRIX_MAX_CELLS", 3)
+    res = client.post(
+        "/api/v1/routing/matrix",
+        json={"origins": [[37.39, -5.99], [37.391, -5.991]], "datetime": datetime(2026, 4, 9, 21, 0).isoformat()},
+    )
+    assert res.status_code == 400
+
+
+def test_optimize_plan_orders_items_by_walking_time(client, db):
+    _seed(db)
+    user = make_user(db)
+    plan_id = client.post(
+        "/api/v1/me/plans",
+        headers=auth_header(user.id),
+        json={"title": "Jueves Santo", "plan_date": "2026-04-09T00:00:00"},
+    ).json()["id"]
+    for hour, node in ((18, "h"), (19, "n"), (20, "f")):
+        lat, lng = NODES[node]
+        client.post(
+            f"/api/v1/me/plans/{plan_id}/items",
+            headers=auth_header(user.id),
+            json={
+                "item_type": "event",
+                "event_id": f"evt-{node}",
+                "desired_time_start": f"2026-04-09T{hour}:00:00",
+                "desired_time_end": f"2026-04-09T{hour}:30:00",
+                "lat": lat,
+                "lng": lng,
+            },
+        )
+
+    res = client.post(f"/api/v1/me/plans/{plan_id}/optimize", headers=auth_header(user.id))
+    assert res.status_code == 200
+    assert [item["event_id"] for item in res.json()["items"]] == ["evt-h", "evt-f", "evt-n"]
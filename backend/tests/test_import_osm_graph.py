@@ -0,0 +1,100 @@
+import bz2
+
+import pytest
+
+from app.core.street_graph import get_street_graph
+from app.db.import_osm_graph import estimate_width, import_osm_graph, is_walkable
+from app.models.models import StreetEdge, StreetNode
+
+OSM_XML = """<?xml version='1.0' encoding='UTF-8'?>
+<osm version="0.6">
+  <bounds minlat="37.38" minlon="-6.0" maxlat="37.40" maxlon="-5.98"/>
+  <node id="1" lat="37.3900" lon="-5.9950"/>
+  <node id="2" lat="37.3905" lon="-5.9950"/>
+  <node id="3" lat="37.3910" lon="-5.9950"/>
+  <node id="4" lat="37.3915" lon="-5.9950"/>
+  <node id="5" lat="37.3910" lon="-5.9960"/>
+  <node id="6" lat="37.3910" lon="-5.9940"/>
+  <node id="7" lat="37.3800" lon="-5.9800"/>
+  <node id="8" lat="37.3810" lon="-5.9800"/>
+  <way id="100">
+    <nd ref="1"/><nd ref="2"/><nd ref="3"/><nd ref="4"/>
+    <tag k="highway" v="residential"/><tag k="name" v="Calle Cuna"/><tag k="oneway" v="yes"/><tag k="width" v="6.5"/>
+  </way>
+  <way id="101">
+    <nd ref="5"/><nd ref="3"/><nd ref="6"/>
+    <tag k="highway" v="footway"/><tag k="oneway:foot" v="yes"/>
+  </way>
+  <way id="102">
+    <nd ref="7"/><nd ref="8"/>
+    <tag k="highway" v="motorway"/>
+  </way>
+  <way id="103">
+    <nd ref="4"/><nd ref="8"/>
+    <tag k="highway" v="service"/><tag k="access" v="private"/>
+  </way>
+  <relation id="900"><member type="way" ref="100" role=""/><tag k="type" v="route"/></relation>
+</osm>
+"""
+
+
+def test_walkability_and_width_rules():
+    assert is_walkable({"highway": "pedestrian"})
+    assert not is_walkable({"highway": "motorway"})
+    assert not is_walkable({"highway": "residential", "foot": "no"})
+    assert is_walkable({"highway": "service", "access": "private", "foot": "yes"})
+    assert estimate_width({"highway": "footway", "width": "3,5 m"}) == 3.5
+    assert estimate_width({"highway": "secondary", "lanes": "2", "sidewalk": "both"}) == 9.0
+    assert estimate_width({"highway": "pedestrian"}) == 6.0
+
+
+@pytest.mark.parametrize("suffix", [".osm", ".osm.bz2"])
+def test_osm_extract_is_split_at_intersections(db, tmp_path, suffix):
+    extract = tmp_path / f"sevilla{suffix}"
+    extract.write_bytes(bz2.compress(OSM_XML.encode()) if suffix.endswith(".bz2") else OSM_XML.encode())
+
+    summary = import_osm_graph(db, extract, batch_size=2)
+
+    # way 100 splits at node 3 (shared with the footway); 102 and 103 are not walkable
+    assert summary["ways"] == 2
+    assert {node.id for node in db.query(StreetNode)} == {"n1", "n3", "n4", "n5", "n6"}
+    edges = {edge.id: edge for edge in db.query(StreetEdge)}
+    # car oneway does not bind pedestrians; oneway:foot does
+    assert set(edges) == {"w100.0", "w100.0r", "w100.1", "w100.1r", "w101.0", "w101.1"}
+    first = edges["w100.0"]
+    assert (first.source_node, first.target_node) == ("n1", "n3")
+    assert first.geom.count(",") == 2  # keeps the intermediate node 2
+    assert first.length_m == pytest.approx(111.2, abs=0.5)
+    assert first.width_estimate == 6.5
+    assert edges["w100.0r"].source_node == "n3"
+    assert edges["w101.0"].width_estimate == 2.0
+    assert summary["edges"] == len(edges)
+
+    graph = get_street_graph(db)
+    assert graph.node_count == 5 and graph.edge_count == 6
+
+
+def test_ways_joined_end_to_end_are_collapsed(db, tmp_path):
+    extract = tmp_path / "joined.osm"
+    extract.write_text(
+        """<?xml version='1.0' encoding='UTF-8'?>
+<osm version="0.6">
+  <node id="1" lat="37.3900" lon="-5.9950"/>
+  <node id="2" lat="37.3905" lon="-5.9950"/>
+  <node id="3" lat="37.3910" lon="-5.9950"/>
+  <way id="200"><nd ref="1"/><nd ref="2"/><tag k="highway" v="pedestrian"/></way>
+  <way id="201"><nd ref="2"/><nd ref="3"/><tag k="highway" v="pedestrian"/></way>
+</osm>
+"""
+    )
+
+    kept = import_osm_graph(db, extract, collapse=False)
+    assert kept["nodes"] == 3 and kept["edges"] == 4
+
+    summary = import_osm_graph(db, extract)
+    assert summary["collapsed"] == {"nodes_removed": 1, "edges_removed": 4, "edges_merged": 2}
+    assert summary["nodes"] == 2 and summary["edges"] == 2
+    edges = {edge.id: edge for edge in db.query(StreetEdge)}
+    assert {(edge.source_node, edge.target_node) for edge in edges.values()} == {("n1", "n3"), ("n3", "n1")}
+    graph = get_street_graph(db)
+    assert graph.node_ids[graph.snap(37.3905, -5.9950)] in {"n1", "n3"}
@@ -0,0 +1,144 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core.crowd_overlay import crowd_cell, edge_crowd_penalties, polyline_cell_shares
+from app.core.isochrone import calculate_isochrone, convex_hull
+from app.core.street_graph import crowd_capacity, get_street_graph
+from app.models.models import CrowdSignal, RouteRestriction, StreetEdge, StreetNode
+
+WHEN = datetime(2026, 4, 9, 21, 0)
+# ab and ad lie inside the single crowd cell 37.39:-5.99
+NODES = {"a": (37.3898, -5.9904), "b": (37.3898, -5.9897), "c": (37.3898, -5.9883), "d": (37.3904, -5.9904)}
+
+
+def _seed(db, widths=None):
+    widths = widths or {}
+    for node_id, (lat, lng) in NODES.items():
+        db.add(StreetNode(id=node_id, geom=f"POINT({lng} {lat})"))
+    # 1.28 m/s: ab = 50 s, bc = 100 s, ad = 40 s
+    for edge_id, source, target, length in (("ab", "a", "b", 64), ("bc", "b", "c", 128), ("ad", "a", "d", 51.2)):
+        (lat_a, lng_a), (lat_b, lng_b) = NODES[source], NODES[target]
+        db.add(
+            StreetEdge(
+                id=edge_id,
+                source_node=source,
+                target_node=target,
+                geom=f"LINESTRING({lng_a} {lat_a}, {lng_b} {lat_b})",
+                length_m=length,
+                width_estimate=widths.get(edge_id),
+            )
+        )
+    db.commit()
+
+
+def _isochrone(db, **kwargs):
+    return calculate_isochrone(db, origin=list(NODES["a"]), route_datetime=WHEN, minutes=1, **kwargs)
+
+
+def _fractions(result):
+    return {edge.edge_id: edge.reachable_fraction for edge in result.edges}
+
+
+def test_bounded_search_returns_full_and_partial_edges(db):
+    _seed(db)
+    result = _isochrone(db)
+    assert _fractions(result) == {"ab": 1.0, "ad": 1.0, "bc": 0.1}
+    assert {edge.edge_id: edge.seconds for edge in result.edges}["bc"] == 50
+    assert result.polygon[0] == result.polygon[-1]
+    assert len(result.polygon) == 4  # a, d and the point 10% along bc
+
+
+def _crowd_on_ab(db):
+    lat_a, lng_a = NODES["a"]
+    lat_b, lng_b = NODES["b"]
+    db.add(
+        CrowdSignal(
+            id="cs1",
+            geohash=crowd_cell((lat_a + lat_b) / 2, (lng_a + lng_b) / 2),
+            bucket_start=WHEN - timedelta(minutes=10),
+            bucket_end=WHEN + timedelta(minutes=10),
+            score=1.0,
+            confidence=1.0,
+            reports_count=8,
+        )
+    )
+
+
+def test_restrictions_and_crowd_shrink_the_isochrone(db):
+    _seed(db)
+    db.add(
+        RouteRestriction(
+            id="r1",
+            edge_id="ad",
+            starts_at=WHEN - timedelta(minutes=5),
+            ends_at=WHEN + timedelta(minutes=30),
+            reason="corte",
+            severity=2000,
+        )
+    )
+    _crowd_on_ab(db)
+    db.commit()
+
+    assert _fractions(_isochrone(db)) == {"ab": 0.6, "ad": 0.029}
+    assert _fractions(_isochrone(db, avoid_bulla=False)) == {"ab": 1.0, "ad": 0.029, "bc": 0.1}
+
+
+def test_edges_are_split_across_the_crowd_cells_they_cross():
+    # 0.1 of the way in 37.39:-5.99, then 0.5 in -5.989 and 0.4 in -5.988
+    shares = polyline_cell_shares([[37.3900, -5.9897], [37.3900, -5.9887], [37.3900, -5.9877]])
+    assert set(shares) == {"37.39:-5.99", "37.39:-5.989", "37.39:-5.988"}
+    assert shares["37.39:-5.99"] == pytest.approx(0.1)
+    assert shares["37.39:-5.989"] == pytest.approx(0.5)
+    assert shares["37.39:-5.988"] == pytest.approx(0.4)
+    assert polyline_cell_shares([[37.3900, -5.9900], [37.3900, -5.9900]]) == {"37.39:-5.99": 1.0}
+
+
+def test_crowd_penalty_scales_with_street_width(db):
+    assert crowd_capacity(None) == 1.0
+    assert crowd_capacity(6.0) == 1.0
+    assert crowd_capacity(2.0) == 3.0
+    assert crowd_capacity(1.0) == 3.0
+    assert crowd_capacity(30.0) == 0.5
+
+    _seed(db, widths={"ab": 2.0, "ad": 12.0})
+    _crowd_on_ab(db)
+    db.commit()
+
+    graph = get_street_graph(db)
+    ab = graph.edge_index["ab"]
+    assert graph.crowd_capacity[ab] == 3.0 and graph.crowd_capacity[graph.edge_index["ad"]] == 0.5
+    assert graph.crowd_capacity[graph.edge_index["bc"]] == 1.0
+    # same full-crowd cell: the 50 s callejón (2 m) pays +150 s, the 40 s avenue (12 m) only +20 s,
+    # and the 100 s bc only for the first seventh of it that lies in the cell
+    penalties = edge_crowd_penalties(db, graph, WHEN)
+    assert penalties == {ab: 150.0, graph.edge_index["ad"]: 20.0, graph.edge_index["bc"]: pytest.approx(100 / 7)}
+    assert _fractions(_isochrone(db)) == {"ab": 0.3, "ad": 1.0}
+
+
+def test_isochrone_is_cached_and_exposed_by_the_api(client, db):
+    _seed(db)
+    first = _isochrone(db)
+    db.query(StreetEdge).filter(StreetEdge.id == "bc").delete()
+    db.commit()
+    # same snapped node, bucket and restriction epoch -> served from cache
+    assert _isochrone(db) == first
+
+    res = client.post(
+        "/api/v1/routing/isochrone",
+        json={"origin": list(NODES["a"]), "datetime": WHEN.isoformat(), "minutes": 1},
+    )
+    assert res.status_code == 200
+    assert {edge["edge_id"] for edge in res.json()["edges"]} == {"ab", "ad", "bc"}
+
+    too_long = client.post(
+        "/api/v1/routing/isochrone",
+        json={"origin": list(NODES["a"]), "datetime": WHEN.isoformat(), "minutes": 600},
+    )
+    assert too_long.status_code == 400
+
+
+def test_convex_hull_drops_interior_points():
+    hull = convex_hull([[0, 0], [1, 0], [1, 1], [0, 1], [0.5, 0.5]])
+    assert len(hull) == 5 and hull[0] == hull[-1]
+    assert [0.5, 0.5] not in hull
@@ -0,0 +1,122 @@
+import json
+from datetime import datetime, timedelta
+
+from app.core.itinerary_matching import (
+    build_street_name_index,
+    match_itinerary,
+    match_procession_itineraries,
+    normalize_street_name,
+    split_itinerary,
+)
+from app.core.procession_blockages import get_procession_blockages, invalidate_procession_blockages
+from app.core.street_graph import get_street_graph
+from app.models.models import (
+    Hermandad,
+    Location,
+    Procession,
+    ProcessionEdgePath,
+    ProcessionItineraryText,
+    ProcessionSchedulePoint,
+    StreetEdge,
+    StreetNode,
+)
+
+SALIDA = datetime(2026, 4, 9, 21, 0)
+# a block around the church c: up Feria, across the Plaza del Duque, down Sierpes and back by Cuna;
+# fk is an unnamed shortcut the procession does not take
+NODES = {
+    "c": (37.3900, -5.9900),
+    "f": (37.3910, -5.9900),
+    "d": (37.3920, -5.9900),
+    "s": (37.3920, -5.9890),
+    "k": (37.3910, -5.9890),
+}
+STREETS = (
+    ("c", "f", "Calle Feria"),
+    ("f", "d", "Calle Feria"),
+    ("d", "s", "Plaza del Duque de la Victoria"),
+    ("s", "k", "Calle Sierpes"),
+    ("k", "c", "Calle Cuna"),
+    ("f", "k", None),
+)
+ITINERARY = "Salida, Feria, Plaza del Duque, Sierpes, Cuna y entrada en su templo."
+
+
+def _seed(db):
+    for node_id, (lat, lng) in NODES.items():
+        db.add(StreetNode(id=node_id, geom=f"POINT({lng} {lat})"))
+    for a, b, name in STREETS:
+        tags = json.dumps({"name": name} if name else {})
+        for source, target in ((a, b), (b, a)):
+            (lat0, lng0), (lat1, lng1) = NODES[source], NODES[target]
+            db.add(
+                StreetEdge(
+                    id=f"{source}{target}",
+                    source_node=source,
+                    target_node=target,
+                    geom=f"LINESTRING({lng0} {lat0}, {lng1} {lat1})",
+                    length_m=110.0,
+                    tags=tags,
+                )
+            )
+    lat, lng = NODES["c"]
+    db.add(Location(id="church", name="Parroquia", lat=lat, lng=lng, kind="church"))
+    db.add(Hermandad(id="h", nombre="Hermandad de prueba", church_id="church"))
+    db.add(Procession(id="proc", brotherhood_id="h", date=SALIDA))
+    db.add(ProcessionItineraryText(id="it", procession_id="proc", raw_text=ITINERARY))
+    db.add(ProcessionSchedulePoint(id="s1", procession_id="proc", point_type="salida", scheduled_datetime=SALIDA))
+    db.add(
+        ProcessionSchedulePoint(
+            id="s2", procession_id="proc", point_type="recogida", scheduled_datetime=SALIDA + timedelta(hours=1)
+        )
+    )
+    db.commit()
+
+
+def test_street_names_are_normalized_for_lookup():
+    assert normalize_street_name("Avda. de la Constitución") == "constitucion"
+    assert normalize_street_name("Plaza del Duque de la Victoria") == "duque victoria"
+    assert split_itinerary(ITINERARY) == ["Salida", "Feria", "Plaza del Duque", "Sierpes", "Cuna", "entrada en su templo"]
+
+
+def test_itinerary_is_matched_to_an_ordered_edge_path(db):
+    _seed(db)
+    graph = get_street_graph(db)
+    index = build_street_name_index(db, graph)
+    assert index.candidates("Plaza del Duque") == ["duque victoria"]
+
+    match = match_itinerary(graph, index, ITINERARY, start=graph.node_index["c"])
+    assert [graph.edge_ids[slot] for slot in match.slots] == ["cf", "fd", "ds", "sk", "kc"]
+    assert [name for _, name in match.matched] == ["feria", "duque victoria", "sierpes", "cuna"]
+    assert match.unmatched == ["Salida", "entrada en su templo"]
+    assert match.gaps == 0
+
+
+def test_batch_stores_paths_and_skips_unchanged_ones(db):
+    _seed(db)
+    graph = get_street_graph(db)
+    first = match_procession_itineraries(db, graph)
+    assert first["matched"] == 1 and first["unmatched_entries"] == 2
+    stored = db.query(ProcessionEdgePath).one()
+    assert json.loads(stored.edge_ids) == ["cf", "fd", "ds", "sk", "kc"]
+    assert stored.graph_fingerprint == graph.fingerprint
+
+    assert match_procession_itineraries(db, graph)["skipped"] == 1
+    db.query(ProcessionItineraryText).one().raw_text = "Feria, Plaza del Duque"
+    db.commit()
+    assert match_procession_itineraries(db, graph)["matched"] == 1
+
+
+def test_blockages_follow_the_matched_path(db):
+    _seed(db)
+    graph = get_street_graph(db)
+    duque = graph.edge_index["ds"]
+    # without a path the salida and recogida are both at the church: the cortejo never leaves it
+    assert not get_procession_blockages(db, graph, SALIDA).blocked(duque, SALIDA + timedelta(minutes=30))
+
+    match_procession_itineraries(db, graph)
+    invalidate_procession_blockages()
+    blockages = get_procession_blockages(db, graph, SALIDA)
+    # head reaches s 36 minutes in (3 of 5 equal edges), the cortejo takes 40 more
+    assert not blockages.blocked(duque, SALIDA + timedelta(minutes=20))
+    assert blockages.blocked(duque, SALIDA + timedelta(minutes=40))
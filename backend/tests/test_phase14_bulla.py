@@ -114,3 +114,55 @@ def test_phase14_rbac_for_moderation(client, db):
     assert denied.status_code == 403
     assert allowed.status_code == 200
     assert allowed.json()["is_hidden"] is True
+
+
+def test_phase14_search_routes_around_bulla(db):
+    from app.core.routing import calculate_optimal_route
+    from app.models.models import CrowdSignal, StreetEdge, StreetNode
+
+    # a -> d straight through b (crowded cell 37.39:-5.99), or a longer detour north through c
+    nodes = {"a": (37.3898, -5.9915), "b": (37.3898, -5.9900), "c": (37.3915, -5.9900), "d": (37.3898, -5.9885)}
+    for node_id, (lat, lng) in nodes.items():
+        db.add(StreetNode(id=node_id, geom=f"POINT({lng} {lat})"))
+    for source, target, length in (("a", "b", 130), ("b", "d", 130), ("a", "c", 230), ("c", "d", 230)):
+        (lat0, lng0), (lat1, lng1) = nodes[source], nodes[target]
+        db.add(
+            StreetEdge(
+                id=f"{source}{target}",
+                source_node=source,
+                target_node=target,
+                geom=f"LINESTRING({lng0} {lat0}, {lng1} {lat1})",
+                length_m=length,
+                width_estimate=2.0,
+            )
+        )
+    db.add(
+        CrowdSignal(
+            id="cs-b",
+            geohash="37.39:-5.99",
+            bucket_start=datetime(2026, 4, 10, 19, 0),
+            bucket_end=datetime(2026, 4, 10, 19, 30),
+            score=1.0,
+            confidence=1.0,
+            reports_count=20,
+        )
+    )
+    db.commit()
+
+    def route(avoid_bulla):
+        return calculate_optimal_route(
+            db,
+            origin=list(nodes["a"]),
+            destination=list(nodes["d"]),
+            route_datetime=datetime(2026, 4, 10, 19, 15),
+            target_type=None,
+            target_id=None,
+            avoid_bulla=avoid_bulla,
+        )
+
+    direct, detour = route(False), route(True)
+    assert [37.3915, -5.99] not in direct.polyline and direct.eta_seconds == int(260 / 1.28)
+    # a third of ab and of bd lie in the crowded cell: +203 s for the 2 m callejón, more than the detour
+    assert [37.3915, -5.99] in detour.polyline
+    assert not any("Penalty bulla" in e for e in detour.explanation)
+    assert detour.eta_seconds == int(460 / 1.28)
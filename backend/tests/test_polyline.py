@@ -0,0 +1,43 @@
+import json
+from datetime import datetime
+
+from app.core.polyline import decode, encode, simplify
+from app.models.models import StreetEdge, StreetNode
+
+
+def test_encode_matches_reference_and_round_trips():
+    points = [[38.5, -120.2], [40.7, -120.95], [43.252, -126.453]]
+    assert encode(points) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+    assert decode(encode(points)) == points
+
+
+def test_simplify_drops_points_along_a_street_but_keeps_corners():
+    # L-shaped walk: 20 points east along a street, then 20 north
+    street = [[37.39, -5.99 + i * 0.0001] for i in range(20)]
+    street += [[37.39 + i * 0.0001, -5.99 + 19 * 0.0001] for i in range(1, 20)]
+    simplified = simplify(street, tolerance_m=3.0)
+    assert simplified == [street[0], street[19], street[-1]]
+
+    wiggle = [[37.39, -5.99], [37.39002, -5.9895], [37.39, -5.989]]  # ~2 m off the chord
+    assert simplify(wiggle, tolerance_m=3.0) == [wiggle[0], wiggle[-1]]
+    assert simplify(wiggle, tolerance_m=1.0) == wiggle
+
+
+def test_encoded_polyline_output_on_route_response(client, db):
+    db.add(StreetNode(id="a", geom="POINT(-5.9968 37.3921)"))
+    db.add(StreetNode(id="b", geom="POINT(-5.9990 37.3927)"))
+    db.add(StreetEdge(id="ab", source_node="a", target_node="b", geom="LINESTRING(-5.9968 37.3921, -5.9980 37.3930, -5.9990 37.3927)", length_m=260))
+    db.commit()
+    body = {
+        "origin": [37.3921, -5.9968],
+        "destination": [37.3927, -5.9990],
+        "datetime": datetime(2026, 4, 9, 21, 0).isoformat(),
+    }
+
+    plain = client.post("/api/v1/routing/optimal", json=body).json()
+    encoded = client.post("/api/v1/routing/optimal", json={**body, "polyline_format": "encoded"}).json()
+
+    assert plain["encoded_polyline"] is None
+    assert encoded["polyline"] == []
+    assert decode(encoded["encoded_polyline"]) == plain["polyline"]
+    assert len(encoded["encoded_polyline"]) < len(json.dumps(plain["polyline"])) / 2
@@ -0,0 +1,196 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.core.config import settings
+from app.core.procession_blockages import CARRERA_OFICIAL_START, get_procession_blockages, night_start
+from app.crud.crud import replace_procession_schedule_points
+from app.core.routing import calculate_optimal_route
+from app.core.street_graph import get_street_graph
+from app.models.models import Hermandad, Location, Procession, ProcessionSchedulePoint, StreetEdge, StreetNode
+from app.schemas.schemas import ProcessionSchedulePointCreate
+from tests.conftest import auth_header, make_admin_user
+
+SALIDA = datetime(2026, 4, 9, 21, 0)
+# the procession walks c -> p -> k (church to La Campana); the walker crosses its path at p,
+# or detours through y. a -> w is a 1000 m approach (781 s).
+NODES = {
+    "c": (37.3900, -5.9944),
+    "p": (37.3918, -5.9945),
+    "k": CARRERA_OFICIAL_START,
+    "a": (37.3918, -6.0060),
+    "w": (37.3918, -5.9955),
+    "e": (37.3918, -5.9935),
+    "y": (37.3905, -5.9960),
+}
+EDGES = (
+    ("cp", "c", "p", 200.0),
+    ("pk", "p", "k", 210.0),
+    ("aw", "a", "w", 1000.0),
+    ("wp", "w", "p", 90.0),
+    ("pe", "p", "e", 90.0),
+    ("wy", "w", "y", 300.0),
+    ("ye", "y", "e", 300.0),
+)
+
+
+@pytest.fixture
+def time_dependent():
+    settings.ROUTING_TIME_DEPENDENT = True
+    yield
+    settings.ROUTING_TIME_DEPENDENT = False
+
+
+def _seed(db):
+    for node_id, (lat, lng) in NODES.items():
+        db.add(StreetNode(id=node_id, geom=f"POINT({lng} {lat})"))
+    for edge_id, source, target, length in EDGES:
+        (lat0, lng0), (lat1, lng1) = NODES[source], NODES[target]
+        db.add(
+            StreetEdge(
+                id=edge_id,
+                source_node=source,
+                target_node=target,
+                geom=f"LINESTRING({lng0} {lat0}, {lng1} {lat1})",
+                length_m=length,
+            )
+        )
+    lat, lng = NODES["c"]
+    db.add(Location(id="church", name="Parroquia", lat=lat, lng=lng, kind="church"))
+    db.add(Hermandad(id="h", nombre="Hermandad de prueba", church_id="church"))
+    db.add(Procession(id="proc", brotherhood_id="h", date=SALIDA))
+    db.add(ProcessionSchedulePoint(id="s1", procession_id="proc", point_type="salida", scheduled_datetime=SALIDA))
+    db.add(
+        ProcessionSchedulePoint(
+            id="s2",
+            procession_id="proc",
+            point_type="carrera_oficial_start",
+            scheduled_datetime=SALIDA + timedelta(minutes=30),
+        )
+    )
+    db.commit()
+
+
+def _route(db, origin: str, when: datetime):
+    return calculate_optimal_route(
+        db,
+        origin=list(NODES[origin]),
+        destination=list(NODES["e"]),
+        route_datetime=when,
+        target_type=None,
+        target_id=None,
+        avoid_bulla=False,
+    )
+
+
+def _via_detour(result) -> bool:
+    return [round(NODES["y"][0], 7), round(NODES["y"][1], 7)] in result.polyline
+
+
+def test_cortejo_blocks_the_edges_it_occupies(db):
+    _seed(db)
+    graph = get_street_graph(db)
+    blockages = get_procession_blockages(db, graph, SALIDA)
+    wp = graph.edge_ids.index("wp")
+    pk = graph.edge_ids.index("pk")
+    assert blockages.night_start == night_start(SALIDA) == datetime(2026, 4, 9, 6, 0)
+    # the cruz de guía reaches p about 15 minutes after the salida, the cortejo takes 40 more
+    assert not blockages.blocked(wp, SALIDA + timedelta(minutes=5))
+    assert blockages.blocked(wp, SALIDA + timedelta(minutes=20))
+    assert blockages.blocked(wp, SALIDA + timedelta(minutes=50))
+    assert not blockages.blocked(wp, SALIDA + timedelta(minutes=65))
+    # La Campana only once the cruz de guía gets there
+    assert not blockages.blocked(pk, SALIDA + timedelta(minutes=20))
+    assert blockages.blocked(pk, SALIDA + timedelta(minutes=35))
+    assert not blockages.blocked(graph.edge_ids.index("ye"), SALIDA + timedelta(minutes=20))
+    assert blockages.active_at(SALIDA + timedelta(minutes=20))[wp] == settings.PROCESSION_BLOCKAGE_SEVERITY
+
+
+def test_route_detours_around_the_cortejo_while_it_passes(db):
+    _seed(db)
+    before = _route(db, "w", SALIDA - timedelta(minutes=30))
+    during = _route(db, "w", SALIDA + timedelta(minutes=20))
+    assert not _via_detour(before)
+    assert _via_detour(during)
+    assert any("cofradías" in line for line in during.explanation)
+
+
+def test_time_dependent_route_sees_the_cortejo_arrive(db, time_dependent):
+    # leaving at 21:05 p is still free, but the walker reaches it after the cruz de guía
+    _seed(db)
+    assert _via_detour(_route(db, "a", SALIDA + timedelta(minutes=5)))
+
+
+def test_static_route_ignores_the_cortejo_not_yet_there(db):
+    _seed(db)
+    assert not _via_detour(_route(db, "a", SALIDA + timedelta(minutes=5)))
+
+
+def test_admin_patch_rebuilds_the_table(client, db):
+    _seed(db)
+    admin = make_admin_user(db)
+    graph = get_street_graph(db)
+    wp = graph.edge_ids.index("wp")
+    assert get_procession_blockages(db, graph, SALIDA).blocked(wp, SALIDA + timedelta(minutes=20))
+
+    later = SALIDA + timedelta(hours=2)
+    response = client.patch(
+        "/api/v1/admin/processions/proc",
+        json={
+            "confidence": 0.9,
+            "itinerary_text": "Parroquia, La Campana",
+            "schedule_points": [
+                {"point_type": "salida", "scheduled_datetime": later.isoformat()},
+                {"point_type": "carrera_oficial_start", "scheduled_datetime": (later + timedelta(minutes=30)).isoformat()},
+            ],
+        },
+        headers=auth_header(admin.id),
+    )
+    assert response.status_code == 200
+    db.expire_all()
+    blockages = get_procession_blockages(db, graph, SALIDA)
+    assert not blockages.blocked(wp, SALIDA + timedelta(minutes=20))
+    assert blockages.blocked(wp, later + timedelta(minutes=20))
+
+
+def test_other_workers_see_a_schedule_replaced_with_the_same_count(db, monkeypatch):
+    _seed(db)
+    # another night's schedule whose ids bracket every uuid4: the table-wide min/max id never move
+    db.add(Procession(id="other", brotherhood_id="h", date=SALIDA + timedelta(days=1)))
+    for point_id in ("0-other", "z-other"):
+        db.add(
+            ProcessionSchedulePoint(
+                id=point_id, procession_id="other", point_type="salida", scheduled_datetime=SALIDA + timedelta(days=1)
+            )
+        )
+    db.commit()
+    graph = get_street_graph(db)
+    wp = graph.edge_ids.index("wp")
+    assert get_procession_blockages(db, graph, SALIDA).blocked(wp, SALIDA + timedelta(minutes=20))
+
+    # another worker replaces the schedule: same number of points, new ids, no local invalidation
+    later = SALIDA + timedelta(hours=2)
+    replace_procession_schedule_points(
+        db,
+        procession_id="proc",
+        points=[
+            ProcessionSchedulePointCreate(point_type="salida", scheduled_datetime=later),
+            ProcessionSchedulePointCreate(point_type="carrera_oficial_start", scheduled_datetime=later + timedelta(minutes=30)),
+        ],
+    )
+    monkeypatch.setattr(settings, "ROUTING_RESTRICTIONS_REFRESH_SECONDS", 0)
+    blockages = get_procession_blockages(db, graph, SALIDA)
+    assert not blockages.blocked(wp, SALIDA + timedelta(minutes=20))
+    assert blockages.blocked(wp, later + timedelta(minutes=20))
+
+
+@pytest.mark.parametrize("mode", [False, True])
+def test_route_with_an_utc_offset(db, mode):
+    _seed(db)
+    settings.ROUTING_TIME_DEPENDENT = mode
+    try:
+        during = _route(db, "w", (SALIDA + timedelta(minutes=20)).replace(tzinfo=timezone(timedelta(hours=2))))
+    finally:
+        settings.ROUTING_TIME_DEPENDENT = False
+    # local wall time, as restrictions read it: the cortejo is at p
+    assert _via_detour(during)
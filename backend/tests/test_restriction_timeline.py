@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+
+from app.core.config import settings
+from app.core.restrictions import RestrictionTimeline, get_restriction_timeline
+from app.core.street_graph import compile_street_graph, get_street_graph
+from app.models.models import RouteRestriction, StreetEdge, StreetNode
+
+T0 = datetime(2026, 4, 9, 20, 0)
+
+
+def _graph():
+    return compile_street_graph(
+        [("a", 37.3921, -5.9968), ("b", 37.3927, -5.9990), ("c", 37.3936, -5.9924)],
+        [("ab", "a", "b", 210.0), ("ac", "a", "c", 390.0), ("cb", "c", "b", 410.0)],
+    )
+
+
+def test_penalty_follows_overlapping_intervals():
+    graph = _graph()
+    ab = graph.edge_index["ab"]
+    timeline = RestrictionTimeline(
+        graph,
+        [
+            ("ab", T0, T0 + timedelta(minutes=30), 500.0),
+            ("ab", T0 + timedelta(minutes=20), T0 + timedelta(minutes=60), 2000.0),
+            ("unknown", T0, T0 + timedelta(minutes=60), 9999.0),
+        ],
+    )
+
+    assert timeline.penalty_at(ab, T0 - timedelta(seconds=1)) == 0.0
+    assert timeline.penalty_at(ab, T0) == 500.0
+    assert timeline.penalty_at(ab, T0 + timedelta(minutes=25)) == 2000.0
+    assert timeline.penalty_at(ab, T0 + timedelta(minutes=60)) == 2000.0  # ends_at is inclusive
+    assert timeline.penalty_at(ab, T0 + timedelta(minutes=60, seconds=1)) == 0.0
+    assert timeline.penalty_at(graph.edge_index["ac"], T0) == 0.0
+    assert len(timeline) == 1
+
+
+def test_epoch_changes_only_when_active_set_changes():
+    graph = _graph()
+    timeline = RestrictionTimeline(
+        graph,
+        [("ab", T0, T0 + timedelta(minutes=30), 500.0), ("cb", T0 + timedelta(hours=2), T0 + timedelta(hours=3), 100.0)],
+        version=3,
+    )
+
+    assert timeline.epoch_key(T0 + timedelta(minutes=1)) == timeline.epoch_key(T0 + timedelta(minutes=29))
+    assert timeline.epoch_key(T0 + timedelta(minutes=1)) != timeline.epoch_key(T0 + timedelta(minutes=45))
+    assert timeline.epoch_key(T0 + timedelta(minutes=45)) == timeline.epoch_key(T0 + timedelta(minutes=90))
+    assert timeline.epoch_key(T0) >> 32 == 3
+    assert timeline.active_at(T0 + timedelta(minutes=5)) == {graph.edge_index["ab"]: 500.0}
+    assert timeline.active_at(T0 + timedelta(hours=2, minutes=5)) == {graph.edge_index["cb"]: 100.0}
+
+
+def test_shared_timeline_reloads_when_restrictions_change(db, monkeypatch):
+    db.add(StreetNode(id="a", geom="POINT(-5.9968 37.3921)"))
+    db.add(StreetNode(id="b", geom="POINT(-5.9990 37.3927)"))
+    db.add(StreetEdge(id="ab", source_node="a", target_node="b", geom="LINESTRING(-5.9968 37.3921, -5.9990 37.3927)", length_m=210))
+    db.commit()
+    graph = get_street_graph(db)
+
+    first = get_restriction_timeline(db, graph)
+    assert get_restriction_timeline(db, graph) is first
+    assert first.active_at(T0) == {}
+
+    db.add(RouteRestriction(id="r1", edge_id="ab", starts_at=T0, ends_at=T0 + timedelta(hours=1), reason="corte", severity=900))
+    db.commit()
+
+    monkeypatch.setattr(settings, "ROUTING_RESTRICTIONS_REFRESH_SECONDS", 0)
+    reloaded = get_restriction_timeline(db, graph)
+    assert reloaded is not first
+    assert reloaded.active_at(T0) == {graph.edge_index["ab"]: 900.0}
+
+
+def test_shared_timeline_reloads_when_a_restriction_is_edited(db, monkeypatch):
+    db.add(StreetNode(id="a", geom="POINT(-5.9968 37.3921)"))
+    db.add(StreetNode(id="b", geom="POINT(-5.9990 37.3927)"))
+    db.add(StreetEdge(id="ab", source_node="a", target_node="b", geom="LINESTRING(-5.9968 37.3921, -5.9990 37.3927)", length_m=210))
+    db.add(RouteRestriction(id="r1", edge_id="ab", starts_at=T0, ends_at=T0 + timedelta(hours=1), reason="corte", severity=900))
+    db.commit()
+    graph = get_street_graph(db)
+    first = get_restriction_timeline(db, graph)
+    assert first.active_at(T0) == {graph.edge_index["ab"]: 900.0}
+
+    restriction = db.get(RouteRestriction, "r1")
+    restriction.starts_at = T0 + timedelta(hours=2)
+    restriction.ends_at = T0 + timedelta(hours=3)
+    db.commit()
+
+    monkeypatch.setattr(settings, "ROUTING_RESTRICTIONS_REFRESH_SECONDS", 0)
+    edited = get_restriction_timeline(db, graph)
+    assert edited.active_at(T0) == {}
+    assert edited.active_at(T0 + timedelta(hours=2)) == {graph.edge_index["ab"]: 900.0}
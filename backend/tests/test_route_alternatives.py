@@ -0,0 +1,98 @@
+import random
+from datetime import datetime
+
+from app.core.route_alternatives import find_alternatives
+from app.core.routing import calculate_optimal_route
+from app.core.routing_engines import INF, AStarEngine, euclidean_heuristic, labelled_tree, shortest_path_tree
+from app.models.models import StreetEdge, StreetNode
+from benchmarks.routing_engines import synthetic_city_graph
+
+
+def test_via_node_alternatives_are_simple_diverse_and_bounded():
+    graph = synthetic_city_graph(20, 20, seed=4)
+    engine = AStarEngine()
+    rng = random.Random(5)
+    found = 0
+    for _ in range(20):
+        start, goal = rng.randrange(graph.node_count), rng.randrange(graph.node_count)
+        main = engine.find_path(graph, start, goal)
+        alternatives = find_alternatives(graph, main, {}, max_count=2, max_stretch=1.4, max_share=0.7)
+        found += len(alternatives)
+        seen = {tuple(main.slots)}
+        for alt in alternatives:
+            assert alt.nodes[0] == start and alt.nodes[-1] == goal
+            assert len(set(alt.nodes)) == len(alt.nodes)
+            assert abs(sum(graph.weights[s] for s in alt.slots) - alt.cost) < 1e-6
+            assert 1.0 <= alt.stretch <= 1.4 + 1e-9
+            assert alt.shared <= 0.7 + 1e-9
+            assert tuple(alt.slots) not in seen
+            seen.add(tuple(alt.slots))
+    assert found > 0
+
+
+def test_alternative_trees_label_only_the_admissible_ellipse():
+    graph = synthetic_city_graph(60, 60, seed=4)
+    start, goal = 60 * 30 + 28, 60 * 30 + 32
+    main = AStarEngine().find_path(graph, start, goal)
+    limit = main.cost * 1.4
+    bound = euclidean_heuristic(graph, goal)
+    dist, parents = labelled_tree(graph, start, limit=limit, bound=bound)
+    dense_dist, dense_parents = shortest_path_tree(graph, start, limit=limit, bound=bound)
+    assert dist == {v: d for v, d in enumerate(dense_dist) if d != INF}
+    assert parents == {v: slot for v, slot in enumerate(dense_parents) if slot >= 0}
+    assert len(dist) < graph.node_count // 20
+    assert find_alternatives(graph, main, {}, max_count=2, max_stretch=1.4, max_share=0.7)
+
+
+def _seed_diamond(db):
+    nodes = {"a": (37.3921, -5.9968), "b": (37.3927, -5.9990), "c": (37.3936, -5.9980), "d": (37.3910, -5.9982)}
+    for node_id, (lat, lng) in nodes.items():
+        db.add(StreetNode(id=node_id, geom=f"POINT({lng} {lat})"))
+    for source, target, length in (("a", "c", 150), ("c", "b", 140), ("a", "d", 160), ("d", "b", 150)):
+        (lat_a, lng_a), (lat_b, lng_b) = nodes[source], nodes[target]
+        db.add(
+            StreetEdge(
+                id=f"{source}{target}",
+                source_node=source,
+                target_node=target,
+                geom=f"LINESTRING({lng_a} {lat_a}, {lng_b} {lat_b})",
+                length_m=length,
+            )
+        )
+    db.commit()
+
+
+def test_route_returns_real_alternative_with_its_own_eta_and_bulla(db):
+    _seed_diamond(db)
+    result = calculate_optimal_route(
+        db,
+        origin=[37.3921, -5.9968],
+        destination=[37.3927, -5.9990],
+        route_datetime=datetime(2026, 4, 9, 21, 0),
+        target_type=None,
+        target_id=None,
+    )
+    assert len(result.alternatives) == 1
+    alt = result.alternatives[0]
+    assert alt.polyline[1] != result.polyline[1]
+    assert alt.polyline[0] == result.polyline[0] and alt.polyline[-1] == result.polyline[-1]
+    assert alt.eta_seconds == int(310 / 1.28)
+    assert 0.0 <= alt.bulla_score <= 1.0
+    assert alt.explanation[0].startswith("Alternativa 1: +")
+
+
+def test_long_detour_is_offered_only_as_flagged_fallback(db):
+    _seed_diamond(db)
+    db.add(StreetEdge(id="ab", source_node="a", target_node="b", geom="LINESTRING(-5.9968 37.3921, -5.9990 37.3927)", length_m=100))
+    db.commit()
+    result = calculate_optimal_route(
+        db,
+        origin=[37.3921, -5.9968],
+        destination=[37.3927, -5.9990],
+        route_datetime=datetime(2026, 4, 9, 21, 0),
+        target_type=None,
+        target_id=None,
+    )
+    assert len(result.polyline) == 2
+    assert len(result.alternatives) == 1
+    assert "notablemente más larga" in result.alternatives[0].explanation[1]
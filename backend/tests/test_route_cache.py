@@ -0,0 +1,77 @@
+from datetime import datetime
+
+from app.core.route_cache import RouteCache, route_cache, time_bucket
+from app.core.routing import calculate_optimal_route
+from app.models.models import StreetEdge, StreetNode
+from tests.conftest import auth_header, make_admin_user, make_user
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_eviction_and_counters():
+    cache = RouteCache(max_entries=2, ttl_seconds=600, clock=FakeClock())
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" becomes most recently used
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    stats = cache.stats()
+    assert stats["size"] == 2
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = RouteCache(max_entries=10, ttl_seconds=600, clock=clock)
+    cache.set("a", 1)
+    clock.now = 599
+    assert cache.get("a") == 1
+    clock.now = 600
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+    assert len(cache) == 0
+
+
+def test_time_bucket_floors_to_ten_minutes():
+    assert time_bucket(datetime(2026, 4, 9, 21, 37, 12, 5)) == datetime(2026, 4, 9, 21, 30)
+
+
+def test_nearby_requests_share_cache_entry(db):
+    db.add(StreetNode(id="a", geom="POINT(-5.9968 37.3921)"))
+    db.add(StreetNode(id="b", geom="POINT(-5.9990 37.3927)"))
+    db.add(StreetEdge(id="ab", source_node="a", target_node="b", geom="LINESTRING(-5.9968 37.3921, -5.9990 37.3927)", length_m=210))
+    db.commit()
+    when = datetime(2026, 4, 9, 21, 31)
+    hits_before = route_cache.hits
+
+    first = calculate_optimal_route(
+        db, origin=[37.3921, -5.9968], destination=[37.3927, -5.9990], route_datetime=when, target_type=None, target_id=None
+    )
+    second = calculate_optimal_route(
+        db, origin=[37.39212, -5.99681], destination=[37.39268, -5.99897], route_datetime=when.replace(minute=38), target_type=None, target_id=None
+    )
+
+    assert second is first
+    assert route_cache.hits == hits_before + 1
+
+
+def test_admin_can_read_route_cache_stats(client, db):
+    user = make_user(db)
+    admin = make_admin_user(db)
+
+    assert client.get("/api/v1/admin/routing/cache", headers=auth_header(user.id)).status_code == 403
+    res = client.get("/api/v1/admin/routing/cache", headers=auth_header(admin.id))
+    assert res.status_code == 200
+    payload = res.json()
+    assert payload["max_entries"] == route_cache.max_entries
+    assert {"hits", "misses", "evictions", "hit_rate"} <= payload.keys()
@@ -0,0 +1,103 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core.route_session import RouteSession, update_route_session
+from app.core.routing import calculate_optimal_route
+from app.models.models import Hermandad, Location, StreetEdge, StreetNode
+
+WHEN = datetime(2026, 4, 9, 21, 0)
+# a - b - c - d eastwards to the church at d; x sits north of the b-c block
+NODES = {
+    "a": (37.3900, -5.9900),
+    "b": (37.3900, -5.9890),
+    "c": (37.3900, -5.9880),
+    "d": (37.3900, -5.9870),
+    "x": (37.3905, -5.9885),
+}
+STREETS = (("a", "b"), ("b", "c"), ("c", "d"), ("b", "x"), ("x", "c"))
+
+
+def _seed(db):
+    for node_id, (lat, lng) in NODES.items():
+        db.add(StreetNode(id=node_id, geom=f"POINT({lng} {lat})"))
+    for u, v in STREETS:
+        for source, target in ((u, v), (v, u)):
+            (lat0, lng0), (lat1, lng1) = NODES[source], NODES[target]
+            db.add(
+                StreetEdge(
+                    id=f"{source}{target}",
+                    source_node=source,
+                    target_node=target,
+                    geom=f"LINESTRING({lng0} {lat0}, {lng1} {lat1})",
+                    length_m=100.0,
+                    tags=json.dumps({}),
+                )
+            )
+    lat, lng = NODES["d"]
+    db.add(Location(id="church", name="Parroquia", lat=lat, lng=lng, kind="church"))
+    db.add(Hermandad(id="h", nombre="Hermandad de prueba", church_id="church"))
+    db.commit()
+
+
+def _update(db, session, origin, when=WHEN, avoid_bulla=False):
+    return update_route_session(
+        db,
+        session,
+        origin=list(origin),
+        route_datetime=when,
+        target_type="brotherhood",
+        target_id="h",
+        avoid_bulla=avoid_bulla,
+        max_walk_km=5,
+    )
+
+
+def test_progress_along_the_route_trims_it_without_searching(db):
+    _seed(db)
+    session = RouteSession()
+    first = _update(db, session, NODES["a"])
+    # halfway from a to b, a couple of metres off the street
+    moved = _update(db, session, (37.39002, -5.9895))
+    assert session.counts == {"progress": 1, "deviation": 0, "replan": 1}
+    # projected onto the street
+    assert moved.polyline[0] == pytest.approx([37.3900, -5.9895])
+    assert moved.polyline[-1] == first.polyline[-1]
+    assert moved.eta_seconds < first.eta_seconds
+    assert moved.alternatives == []
+
+
+def test_deviation_is_rerouted_from_the_backward_tree(db):
+    _seed(db)
+    session = RouteSession()
+    _update(db, session, NODES["a"])
+    detour = _update(db, session, NODES["x"])
+    assert session.counts == {"progress": 0, "deviation": 1, "replan": 1}
+    assert detour.polyline[0] == list(NODES["x"])
+    assert any("árbol de búsqueda de la sesión" in line for line in detour.explanation)
+
+    searched = calculate_optimal_route(
+        db,
+        origin=list(NODES["x"]),
+        destination=None,
+        route_datetime=WHEN,
+        target_type="brotherhood",
+        target_id="h",
+        avoid_bulla=False,
+        max_walk_km=5,
+    )
+    assert detour.eta_seconds == searched.eta_seconds
+    assert detour.polyline == searched.polyline
+
+
+def test_new_crowd_bucket_or_target_replans(db):
+    _seed(db)
+    session = RouteSession()
+    _update(db, session, NODES["a"], avoid_bulla=True)
+    _update(db, session, NODES["a"], when=WHEN + timedelta(minutes=5), avoid_bulla=True)
+    assert session.counts["replan"] == 1
+    _update(db, session, NODES["a"], when=WHEN + timedelta(minutes=10), avoid_bulla=True)
+    assert session.counts["replan"] == 2
+    _update(db, session, NODES["a"], when=WHEN + timedelta(minutes=10), avoid_bulla=False)
+    assert session.counts["replan"] == 3
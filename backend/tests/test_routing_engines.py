@@ -0,0 +1,65 @@
+import random
+
+import pytest
+
+from app.core.config import settings
+from app.core.routing_engines import (
+    ALTEngine,
+    AStarEngine,
+    BidirectionalAStarEngine,
+    ContractionHierarchyEngine,
+    dijkstra_distances,
+    get_routing_engine,
+)
+from app.core.street_graph import compile_street_graph
+from benchmarks.routing_engines import run, synthetic_city_graph
+
+ENGINES = [AStarEngine(), BidirectionalAStarEngine(), ALTEngine(landmark_count=4), ContractionHierarchyEngine(path="")]
+
+
+@pytest.mark.parametrize("engine", ENGINES, ids=lambda e: e.name)
+def test_engines_match_dijkstra(engine):
+    graph = synthetic_city_graph(15, 15, seed=3)
+    rng = random.Random(11)
+    for _ in range(30):
+        start, goal = rng.randrange(graph.node_count), rng.randrange(graph.node_count)
+        expected = dijkstra_distances(graph, start)[goal]
+        result = engine.find_path(graph, start, goal)
+        assert result.cost == pytest.approx(expected)
+        if result.found:
+            assert result.nodes[0] == start and result.nodes[-1] == goal
+            assert sum(graph.weights[s] for s in result.slots) == pytest.approx(expected)
+            for slot, (u, v) in zip(result.slots, zip(result.nodes, result.nodes[1:])):
+                assert graph.sources[slot] == u and graph.targets[slot] == v
+
+
+@pytest.mark.parametrize("engine", ENGINES, ids=lambda e: e.name)
+def test_engines_honor_penalties_and_unreachable_goals(engine):
+    graph = compile_street_graph(
+        [("a", 37.3921, -5.9968), ("b", 37.3927, -5.9990), ("c", 37.3936, -5.9924), ("z", 37.40, -5.98)],
+        [("ab", "a", "b", 210.0), ("ac", "a", "c", 390.0), ("cb", "c", "b", 410.0)],
+    )
+    a, b, z = graph.node_index["a"], graph.node_index["b"], graph.node_index["z"]
+
+    direct = engine.find_path(graph, a, b)
+    detour = engine.find_path(graph, a, b, {graph.edge_index["ab"]: 2000.0})
+    assert [graph.edge_ids[s] for s in direct.slots] == ["ab"]
+    assert [graph.edge_ids[s] for s in detour.slots] == ["ac", "cb"]
+
+    missing = engine.find_path(graph, a, z)
+    assert not missing.found
+    assert missing.slots == []
+
+
+def test_alt_settles_fewer_nodes_than_plain_astar():
+    graph = synthetic_city_graph(30, 30, seed=5)
+    report = run(graph, [AStarEngine(), ALTEngine(landmark_count=8)], queries=40)
+    assert report["alt"]["settled_mean"] < report["astar"]["settled_mean"]
+
+
+def test_engine_is_selected_by_settings(monkeypatch):
+    monkeypatch.setattr(settings, "ROUTING_ENGINE", "bidirectional")
+    assert isinstance(get_routing_engine(), BidirectionalAStarEngine)
+    monkeypatch.setattr(settings, "ROUTING_ENGINE", "nope")
+    with pytest.raises(ValueError):
+        get_routing_engine()
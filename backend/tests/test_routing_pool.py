@@ -0,0 +1,115 @@
+import asyncio
+import threading
+from datetime import datetime
+
+import pytest
+
+from app.core import routing_pool
+from app.core.routing_pool import RoutingPool, RoutingPoolSaturated
+from tests.test_phase12_routing_api import _seed_graph
+
+
+def test_routing_pool_rejects_beyond_capacity():
+    pool = RoutingPool(workers=1, queue_depth=1)
+    release = threading.Event()
+
+    async def scenario():
+        first = asyncio.ensure_future(pool.run(release.wait))
+        second = asyncio.ensure_future(pool.run(release.wait))
+        await asyncio.sleep(0.05)
+        assert pool.stats()["in_flight"] == 2
+        with pytest.raises(RoutingPoolSaturated):
+            await pool.run(lambda: None)
+        release.set()
+        return await asyncio.gather(first, second)
+
+    try:
+        assert asyncio.run(scenario()) == [True, True]
+    finally:
+        pool.shutdown()
+    stats = pool.stats()
+    assert stats["in_flight"] == 0
+    assert stats["completed"] == 2
+    assert stats["rejected"] == 1
+
+
+def test_cancelled_caller_keeps_the_slot_until_the_job_ends():
+    pool = RoutingPool(workers=1, queue_depth=0)
+    release = threading.Event()
+
+    async def scenario():
+        waiting = asyncio.ensure_future(pool.run(release.wait))
+        await asyncio.sleep(0.05)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        # the thread is still blocked on the event: no room for another job
+        with pytest.raises(RoutingPoolSaturated):
+            await pool.run(lambda: None)
+        release.set()
+        await asyncio.sleep(0.05)
+        return await pool.run(lambda: "free")
+
+    try:
+        assert asyncio.run(scenario()) == "free"
+    finally:
+        pool.shutdown()
+    assert pool.stats()["in_flight"] == 0
+
+
+def test_run_to_completion_waits_for_the_job_when_cancelled():
+    pool = RoutingPool(workers=1, queue_depth=0)
+    release, done = threading.Event(), threading.Event()
+
+    def job():
+        release.wait(5)
+        done.set()
+
+    async def scenario():
+        waiting = asyncio.ensure_future(pool.run_to_completion(job))
+        await asyncio.sleep(0.05)
+        waiting.cancel()
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        release.set()
+        await asyncio.gather(waiting, return_exceptions=True)
+        return waiting.cancelled(), done.is_set()
+
+    try:
+        assert asyncio.run(scenario()) == (True, True)
+    finally:
+        pool.shutdown()
+
+
+_WHEN = datetime.utcnow().isoformat()
+
+
+@pytest.mark.parametrize(
+    "path, body",
+    [
+        (
+            "optimal",
+            {
+                "origin": [37.3921, -5.9968],
+                "destination": [37.3927, -5.9990],
+                "datetime": _WHEN,
+                "constraints": {"avoid_bulla": True, "max_walk_km": 5},
+            },
+        ),
+        ("matrix", {"origins": [[37.3921, -5.9968], [37.3927, -5.9990]], "datetime": _WHEN}),
+        ("isochrone", {"origin": [37.3921, -5.9968], "datetime": _WHEN, "minutes": 10}),
+    ],
+)
+def test_searches_return_503_when_pool_saturated(client, db, monkeypatch, path, body):
+    _seed_graph(db)
+    pool = RoutingPool(workers=1, queue_depth=0)
+    monkeypatch.setattr(routing_pool, "_pool", pool)
+    try:
+        assert client.post(f"/api/v1/routing/{path}", json=body).status_code == 200
+        assert pool.stats()["completed"] == 1
+
+        pool.in_flight = pool.capacity
+        res = client.post(f"/api/v1/routing/{path}", json=body)
+        assert res.status_code == 503
+        assert res.headers["retry-after"] == "1"
+    finally:
+        pool.shutdown()
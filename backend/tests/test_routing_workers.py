@@ -0,0 +1,103 @@
+from dataclasses import replace
+from datetime import datetime
+
+import pytest
+
+from app.core.packed_graph import PackedStreetGraph, pack_graph, packed_size
+from app.core.routing_engines import ENGINES, AStarEngine, ContractionHierarchyEngine
+from app.core.routing_workers import RoutingProcessPool, _search, _search_timed
+from app.core.time_dependent import PenaltyProfile, TimeDependentCosts
+from benchmarks.routing_engines import synthetic_city_graph
+
+
+@pytest.fixture(scope="module")
+def city():
+    return synthetic_city_graph(20, 20)
+
+
+def test_packed_graph_is_searchable_without_copying(city):
+    buffer = bytearray(packed_size(city))
+    pack_graph(city, buffer)
+    packed = PackedStreetGraph.from_buffer(buffer)
+    try:
+        assert packed.fingerprint == city.fingerprint
+        assert (packed.node_count, packed.edge_count) == (city.node_count, city.edge_count)
+        assert list(packed.targets) == list(city.targets)
+        for engine_cls in ENGINES.values():
+            engine = engine_cls(path="") if engine_cls is ContractionHierarchyEngine else engine_cls()
+            expected = engine.find_path(city, 0, city.node_count - 1)
+            engine = engine_cls(path="") if engine_cls is ContractionHierarchyEngine else engine_cls()
+            assert engine.find_path(packed, 0, city.node_count - 1).cost == pytest.approx(expected.cost)
+    finally:
+        packed.release()
+
+
+def test_packed_graph_rejects_foreign_buffer():
+    with pytest.raises(ValueError):
+        PackedStreetGraph.from_buffer(bytearray(64))
+
+
+def test_process_pool_matches_in_process_search(city):
+    penalties = {city.edge_index[city.edge_ids[5]]: 500.0}
+    pool = RoutingProcessPool(1)
+    try:
+        pool.publish(city)
+        path, alternatives = pool.search(city, 0, city.node_count - 1, penalties)
+        local_path, local_alternatives = _search(city, AStarEngine(), 0, city.node_count - 1, penalties)
+        assert path.cost == pytest.approx(local_path.cost)
+        assert path.slots == local_path.slots
+        assert [alt.slots for alt in alternatives] == [alt.slots for alt in local_alternatives]
+
+        table = pool.distance_table(city, [0, 7], [city.node_count - 1], penalties)
+        assert table[0][0] == pytest.approx(local_path.cost)
+
+        costs = TimeDependentCosts(
+            origin=datetime(2026, 4, 9, 21, 0),
+            horizon_seconds=3600.0,
+            profiles={slot: PenaltyProfile.from_pieces([0.0, 600.0], [value, 0.0]) for slot, value in penalties.items()},
+        )
+        timed, _ = pool.search_timed(city, 0, city.node_count - 1, penalties, costs, 0.0)
+        local_timed, _ = _search_timed(city, AStarEngine(), 0, city.node_count - 1, penalties, costs, 0.0)
+        assert timed.slots == local_timed.slots and timed.cost == pytest.approx(local_timed.cost)
+    finally:
+        pool.shutdown()
+
+
+def test_workers_keep_time_dependent_costs_by_key(city):
+    goal = city.node_count - 1
+    slots = AStarEngine().find_path(city, 0, goal).slots[:2]
+    costs = TimeDependentCosts(
+        origin=datetime(2026, 4, 9, 21, 0),
+        horizon_seconds=3600.0,
+        profiles={slot: PenaltyProfile.from_pieces([0.0, 600.0], [900.0, 0.0]) for slot in slots},
+        key=("test", 1),
+    )
+    pool = RoutingProcessPool(1)
+    try:
+        first, _ = pool.search_timed(city, 0, goal, {}, costs, 0.0)
+        # same key, different profiles: the worker answers with the ones it already holds
+        again, _ = pool.search_timed(city, 0, goal, {}, replace(costs, profiles={}), 0.0)
+        assert again.slots == first.slots and again.cost == pytest.approx(first.cost)
+        unkeyed, _ = pool.search_timed(city, 0, goal, {}, replace(costs, profiles={}, key=()), 0.0)
+        assert unkeyed.cost < first.cost
+    finally:
+        pool.shutdown()
+
+
+def test_query_on_an_executor_retired_meanwhile_is_retried(city, monkeypatch, caplog):
+    pool = RoutingProcessPool(1)
+    try:
+        pool.publish(city)
+        stale = pool._executor
+        # another thread restarts the pool between our read of the executor and the submit
+        with pool._lock:
+            pool._retire()
+        fresh = pool.publish(city)
+        current = pool._current
+        handed_out = iter([stale])
+        monkeypatch.setattr(pool, "_current", lambda graph: next(handed_out, None) or current(graph))
+        path, _ = pool.search(city, 0, city.node_count - 1, {})
+        assert path.found and pool._executor is fresh
+        assert "retrying on a fresh one" in caplog.text
+    finally:
+        pool.shutdown()
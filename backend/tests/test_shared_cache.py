@@ -0,0 +1,145 @@
+from datetime import datetime
+
+from app.core.route_cache import route_cache
+from app.core.routing import calculate_optimal_route
+from app.core.shared_cache import InMemorySharedCache, RedisSharedCache, get_shared_cache
+from app.models.models import CrowdSignal, StreetEdge, StreetNode
+
+
+class FakeRedis:
+    """Minimal stand-in for the redis-py client surface used by RedisSharedCache."""
+
+    def __init__(self):
+        self.store: dict[str, str] = {}
+        self.ttls: dict[str, int] = {}
+
+    def get(self, key):
+        value = self.store.get(key)
+        return value.encode() if value is not None else None
+
+    def set(self, key, value, ex=None):
+        self.store[key] = value
+        self.ttls[key] = ex
+
+    def delete(self, key):
+        self.store.pop(key, None)
+
+
+class DownRedis:
+    def __init__(self):
+        self.calls = 0
+
+    def get(self, key):
+        self.calls += 1
+        raise ConnectionError("redis down")
+
+    def set(self, key, value, ex=None):
+        raise ConnectionError("redis down")
+
+    def delete(self, key):
+        raise ConnectionError("redis down")
+
+
+class FlakyRedis(FakeRedis):
+    def __init__(self):
+        super().__init__()
+        self.down = True
+        self.calls = 0
+
+    def get(self, key):
+        self.calls += 1
+        if self.down:
+            raise ConnectionError("redis down")
+        return super().get(key)
+
+
+def _seed(db):
+    db.add(StreetNode(id="a", geom="POINT(-5.9968 37.3921)"))
+    db.add(StreetNode(id="b", geom="POINT(-5.9990 37.3927)"))
+    db.add(StreetEdge(id="ab", source_node="a", target_node="b", geom="LINESTRING(-5.9968 37.3921, -5.9990 37.3927)", length_m=210))
+    db.commit()
+
+
+def _route(db):
+    return calculate_optimal_route(
+        db,
+        origin=[37.3921, -5.9968],
+        destination=[37.3927, -5.9990],
+        route_datetime=datetime(2026, 4, 9, 21, 0),
+        target_type=None,
+        target_id=None,
+    )
+
+
+def test_in_memory_backend_expires_entries():
+    now = [0.0]
+    cache = InMemorySharedCache(clock=lambda: now[0])
+    cache.set("k", "v", ttl_seconds=5)
+    assert cache.get("k") == "v"
+    now[0] = 5.0
+    assert cache.get("k") is None
+
+
+def test_redis_backend_round_trips_and_falls_back_when_down():
+    client = FakeRedis()
+    cache = RedisSharedCache(client)
+    cache.set("k", "v", ttl_seconds=30)
+    assert cache.get("k") == "v"
+    assert client.ttls["k"] == 30
+
+    degraded = RedisSharedCache(DownRedis())
+    degraded.set("k", "v", ttl_seconds=30)
+    assert degraded.get("k") == "v"
+
+
+def test_redis_backend_skips_redis_for_a_while_after_a_failure():
+    now = [0.0]
+    client = FlakyRedis()
+    cache = RedisSharedCache(client, retry_seconds=5, clock=lambda: now[0])
+    assert cache.get("k") is None
+    assert client.calls == 1
+    for _ in range(10):
+        cache.get("k")
+    # no socket timeout per call while Redis is down
+    assert client.calls == 1 and not cache.available
+
+    client.down = False
+    client.store["k"] = "shared"
+    now[0] = 5.0
+    assert cache.get("k") == "shared"
+    assert client.calls == 2 and cache.available
+
+
+def test_route_computed_by_one_worker_is_reused_by_another(db):
+    _seed(db)
+    first = _route(db)
+
+    # a second worker has an empty local cache but shares the backend
+    route_cache.clear()
+    hits = route_cache.hits
+    second = _route(db)
+
+    assert second is not first
+    assert second == first
+    assert route_cache.hits == hits
+
+
+def test_crowd_signal_lookup_is_cached(db):
+    _seed(db)
+    db.add(
+        CrowdSignal(
+            id="cs1",
+            geohash="37.393:-5.999",
+            bucket_start=datetime(2026, 4, 9, 20, 50),
+            bucket_end=datetime(2026, 4, 9, 21, 10),
+            score=0.8,
+            confidence=0.5,
+            reports_count=4,
+        )
+    )
+    db.commit()
+
+    _route(db)
+    # one bulk read per 10-minute bucket, shared by every worker
+    cached = get_shared_cache().get("crowd:2026-04-09T21:00:00")
+    assert cached == '{"37.393:-5.999": [0.8, 0.5]}'
@@ -0,0 +1,43 @@
+import random
+
+from app.core.routing import haversine_distance
+from app.core.spatial_index import PointIndex
+from app.core.street_graph import compile_street_graph
+
+
+def _random_points(n: int, seed: int = 7) -> tuple[list[float], list[float]]:
+    rng = random.Random(seed)
+    lats = [37.38 + rng.random() * 0.03 for _ in range(n)]
+    lngs = [-6.00 + rng.random() * 0.03 for _ in range(n)]
+    return lats, lngs
+
+
+def test_k_nearest_matches_brute_force():
+    lats, lngs = _random_points(500)
+    index = PointIndex(lats, lngs)
+    rng = random.Random(3)
+    for _ in range(25):
+        lat, lng = 37.37 + rng.random() * 0.05, -6.01 + rng.random() * 0.05
+        expected = sorted(range(len(lats)), key=lambda i: haversine_distance(lat, lng, lats[i], lngs[i]))[:5]
+        found = index.k_nearest(lat, lng, 5)
+        assert [i for _, i in found] == expected
+        assert abs(found[0][0] - haversine_distance(lat, lng, lats[expected[0]], lngs[expected[0]])) < 1.0
+
+
+def test_within_radius_returns_only_close_points():
+    lats, lngs = _random_points(300)
+    index = PointIndex(lats, lngs)
+    found = index.within_radius(37.395, -5.985, 250)
+    expected = {i for i in range(len(lats)) if haversine_distance(37.395, -5.985, lats[i], lngs[i]) <= 249}
+    assert expected <= {i for _, i in found}
+    assert all(d <= 250 for d, _ in found)
+    assert [d for d, _ in found] == sorted(d for d, _ in found)
+
+
+def test_compiled_graph_exposes_node_index():
+    graph = compile_street_graph(
+        [("a", 37.3921, -5.9968), ("b", 37.3927, -5.9990)],
+        [("ab", "a", "b", 210.0)],
+    )
+    assert graph.node_ids[graph.node_grid.nearest(37.3926, -5.9989)] == "b"
+    assert PointIndex([], []).nearest(37.39, -5.99) is None
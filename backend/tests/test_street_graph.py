@@ -0,0 +1,321 @@
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+
+from app.core.config import settings
+from app.core.packed_graph import PackedIds
+from app.core.routing import calculate_optimal_route
+from app.core.street_graph import compile_street_graph, get_street_graph, invalidate_street_graph
+from app.db.import_street_graph import SAMPLE_GRAPH_PATH, collapse_chains, import_graph
+from app.models.models import StreetEdge, StreetNode
+
+
+def test_compile_builds_csr_adjacency():
+    graph = compile_street_graph(
+        [("a", 37.3921, -5.9968), ("b", 37.3927, -5.9990), ("c", 37.3936, -5.9924)],
+        [("cb", "c", "b", 410.0), ("ab", "a", "b", 210.0), ("ac", "a", "c", 390.0), ("ax", "a", "missing", 5.0)],
+    )
+
+    a = graph.node_index["a"]
+    out = {graph.edge_ids[slot]: graph.node_ids[graph.targets[slot]] for slot in graph.out_slots(a)}
+    assert out == {"ab": "b", "ac": "c"}
+    assert graph.edge_count == 3
+    assert list(graph.offsets) == [0, 2, 2, 3]
+    assert graph.weights[graph.edge_index["ab"]] == 210.0 / 1.28
+
+
+def test_shared_graph_is_reused_until_import(db):
+    db.add(StreetNode(id="a", geom="POINT(-5.9968 37.3921)"))
+    db.commit()
+
+    first = get_street_graph(db)
+    db.add(StreetNode(id="b", geom="POINT(-5.9990 37.3927)"))
+    db.commit()
+    assert get_street_graph(db) is first
+    assert first.node_count == 1
+
+    summary = import_graph(db, SAMPLE_GRAPH_PATH)
+    reloaded = get_street_graph(db)
+    assert reloaded is not first
+    assert reloaded.version > first.version
+    assert reloaded.node_count == summary["nodes"]
+    walkable = [e for e in json.loads(SAMPLE_GRAPH_PATH.read_text())["edges"] if e.get("is_walkable", True)]
+    assert reloaded.edge_count == len(walkable) == db.query(StreetEdge).filter(StreetEdge.is_walkable.is_(True)).count()
+
+
+def test_workers_reload_a_graph_reimported_elsewhere(db, monkeypatch):
+    db.add(StreetNode(id="a", geom="POINT(-5.9968 37.3921)"))
+    db.commit()
+    first = get_street_graph(db)
+
+    # another process replaced the tables: nothing invalidated this worker's graph
+    db.query(StreetNode).delete()
+    db.add(StreetNode(id="b", geom="POINT(-5.9990 37.3927)"))
+    db.commit()
+    assert get_street_graph(db) is first
+    monkeypatch.setattr(settings, "ROUTING_GRAPH_REFRESH_SECONDS", 0)
+    reloaded = get_street_graph(db)
+    assert reloaded.node_ids == ["b"]
+    assert reloaded.version > first.version
+    assert get_street_graph(db) is reloaded
+
+
+def test_edge_geometry_is_packed_in_memory_and_reassembled():
+    graph = compile_street_graph(
+        [("a", 37.3921, -5.9968), ("b", 37.3927, -5.9990), ("c", 37.3936, -5.9924)],
+        [("ab", "a", "b", 210.0), ("bc", "b", "c", 600.0)],
+        geometries={
+            "ab": [[37.3921, -5.9968], [37.3925, -5.9975], [37.3927, -5.9990]],
+            # digitised against the edge direction
+            "bc": [[37.3936, -5.9924], [37.3931, -5.9950], [37.3927, -5.9990]],
+        },
+    )
+    assert graph.geom_dlats.typecode == "f"
+    assert graph.edge_polyline(graph.edge_index["ab"])[1] == [37.3925, -5.9975]
+    assert graph.path_polyline([graph.edge_index["ab"], graph.edge_index["bc"]]) == [
+        [37.3921, -5.9968],
+        [37.3925, -5.9975],
+        [37.3927, -5.999],
+        [37.3931, -5.995],
+        [37.3936, -5.9924],
+    ]
+
+
+def test_route_polyline_comes_from_the_compiled_graph(db):
+    db.add(StreetNode(id="a", geom="POINT(-5.9968 37.3921)"))
+    db.add(StreetNode(id="b", geom="POINT(-5.9990 37.3927)"))
+    db.add(StreetEdge(id="ab", source_node="a", target_node="b", geom="LINESTRING(-5.9968 37.3921, -5.9975 37.3925, -5.9990 37.3927)", length_m=210))
+    db.commit()
+    get_street_graph(db)
+    # geometry now lives in memory: edits to the table are not re-read per route
+    db.query(StreetEdge).update({StreetEdge.geom: "LINESTRING(-5.9968 37.3921, -5.9990 37.3927)"})
+    db.commit()
+
+    result = calculate_optimal_route(
+        db,
+        origin=[37.3921, -5.9968],
+        destination=[37.3927, -5.9990],
+        route_datetime=datetime(2026, 4, 9, 21, 0),
+        target_type=None,
+        target_id=None,
+    )
+    assert result.polyline == [[37.3921, -5.9968], [37.3925, -5.9975], [37.3927, -5.999]]
+
+
+def test_imported_graph_file_is_mmapped_until_tables_change(db, tmp_path, monkeypatch):
+    graph_file = tmp_path / "street_graph.bin"
+    import_graph(db, SAMPLE_GRAPH_PATH, graph_file=graph_file)
+    compiled = get_street_graph(db)
+
+    monkeypatch.setattr(settings, "ROUTING_GRAPH_PATH", str(graph_file))
+    invalidate_street_graph()
+    mapped = get_street_graph(db)
+    assert isinstance(mapped.weights, memoryview) and isinstance(mapped.geom_dlats, memoryview)
+    assert mapped.fingerprint == compiled.fingerprint
+    # ids are read from the file; the id -> slot index is only built once something looks one up
+    assert isinstance(mapped.node_ids, PackedIds) and mapped.edge_index._index is None
+    assert mapped.node_ids == compiled.node_ids and mapped.edge_index == compiled.edge_index
+    assert list(mapped.in_slots) == list(compiled.in_slots)
+    slots = list(range(min(3, compiled.edge_count)))
+    assert mapped.path_polyline(slots) == compiled.path_polyline(slots)
+    assert mapped.node_grid.nearest(37.3921, -5.9968) == compiled.node_grid.nearest(37.3921, -5.9968)
+
+    db.query(StreetEdge).filter(StreetEdge.id == compiled.edge_ids[0]).delete()
+    db.commit()
+    invalidate_street_graph()
+    stale = get_street_graph(db)
+    assert not isinstance(stale.weights, memoryview)
+    assert stale.edge_count == compiled.edge_count - 1
+
+
+def test_graph_file_is_stale_after_a_same_size_import(db, tmp_path, monkeypatch):
+    graph_file = tmp_path / "street_graph.bin"
+    import_graph(db, SAMPLE_GRAPH_PATH, graph_file=graph_file)
+    monkeypatch.setattr(settings, "ROUTING_GRAPH_PATH", str(graph_file))
+
+    # re-point one edge: same node and edge counts, same total length
+    payload = json.loads(SAMPLE_GRAPH_PATH.read_text())
+    edge = next(edge for edge in payload["edges"] if edge.get("is_walkable", True))
+    edge["source_node"], edge["target_node"] = edge["target_node"], edge["source_node"]
+    edge["geometry"] = edge["geometry"][::-1]
+    dataset = tmp_path / "graph.json"
+    dataset.write_text(json.dumps(payload))
+    assert import_graph(db, dataset, incremental=True)["graph"] == "invalidated"
+
+    graph = get_street_graph(db)
+    assert not isinstance(graph.weights, memoryview)
+    slot = graph.edge_index[edge["id"]]
+    assert graph.node_ids[graph.sources[slot]] == edge["source_node"]
+
+
+def test_incremental_import_diffs_and_patches_the_shared_graph(db, tmp_path):
+    import_graph(db, SAMPLE_GRAPH_PATH)
+    graph = get_street_graph(db)
+
+    summary = import_graph(db, SAMPLE_GRAPH_PATH, incremental=True)
+    assert summary["graph"] == "unchanged"
+    assert not any(summary["changes"].values())
+    assert get_street_graph(db) is graph
+
+    payload = json.loads(SAMPLE_GRAPH_PATH.read_text())
+    walkable = next(edge for edge in payload["edges"] if edge.get("is_walkable", True))
+    walkable["length_m"] = walkable["length_m"] * 2
+    dataset = tmp_path / "graph.json"
+    dataset.write_text(json.dumps(payload))
+    summary = import_graph(db, dataset, incremental=True)
+    assert summary["graph"] == "patched"
+    assert summary["changes"]["edge_lengths"] == 1 and summary["changes"]["edges_updated"] == 1
+    patched = get_street_graph(db)
+    slot = patched.edge_index[walkable["id"]]
+    assert patched.lengths[slot] == walkable["length_m"]
+    assert patched.weights[slot] == walkable["length_m"] / 1.28
+    assert patched.version == graph.version and patched.node_ids is graph.node_ids
+    assert patched.fingerprint != graph.fingerprint
+    assert db.query(StreetEdge).filter(StreetEdge.id == walkable["id"]).one().length_m == walkable["length_m"]
+
+    walkable["width_estimate"] = 2.0
+    dataset.write_text(json.dumps(payload))
+    summary = import_graph(db, dataset, incremental=True)
+    assert summary["graph"] == "patched"
+    assert summary["changes"]["edge_widths"] == 1 and summary["changes"]["edge_lengths"] == 0
+    assert get_street_graph(db).crowd_capacity[slot] == 3.0
+
+    removed = payload["edges"].pop()
+    payload["nodes"].append({"id": "n_nuevo", "lat": 37.3950, "lng": -5.9930})
+    dataset.write_text(json.dumps(payload))
+    summary = import_graph(db, dataset, incremental=True)
+    assert summary["graph"] == "invalidated"
+    assert summary["changes"]["edges_removed"] == 1 and summary["changes"]["nodes_added"] == 1
+    assert db.query(StreetEdge).filter(StreetEdge.id == removed["id"]).count() == 0
+    assert db.query(StreetNode).count() == len(payload["nodes"])
+    assert get_street_graph(db).version > graph.version
+
+
+def test_incremental_import_in_another_process_patches_the_workers_graph(db, tmp_path, monkeypatch):
+    import_graph(db, SAMPLE_GRAPH_PATH)
+    graph = get_street_graph(db)
+    payload = json.loads(SAMPLE_GRAPH_PATH.read_text())
+    walkable = next(edge for edge in payload["edges"] if edge.get("is_walkable", True))
+    walkable["length_m"] = walkable["length_m"] * 3
+    dataset = tmp_path / "graph.json"
+    dataset.write_text(json.dumps(payload))
+
+    # the importer CLI, as an operator runs it next to the API
+    backend = Path(__file__).resolve().parents[1]
+    env = {**os.environ, "SQLALCHEMY_DATABASE_URI": str(db.get_bind().url)}
+    subprocess.run(
+        [sys.executable, "-m", "app.db.import_street_graph", "--dataset", str(dataset), "--incremental", "--graph-file", ""],
+        cwd=backend,
+        env=env,
+        check=True,
+        capture_output=True,
+    )
+    assert get_street_graph(db) is graph
+    monkeypatch.setattr(settings, "ROUTING_GRAPH_REFRESH_SECONDS", 0)
+    patched = get_street_graph(db)
+    slot = patched.edge_index[walkable["id"]]
+    assert patched.lengths[slot] == walkable["length_m"]
+    assert patched.version == graph.version and patched.node_ids is graph.node_ids
+    assert get_street_graph(db) is patched
+
+
+def _chain_dataset(oneway: bool) -> tuple[list[dict], list[dict]]:
+    # a - b - c - d along a street, then d branches to e and f
+    nodes = [
+        {"id": "a", "lat": 37.3900, "lng": -5.9950},
+        {"id": "b", "lat": 37.3905, "lng": -5.9950},
+        {"id": "c", "lat": 37.3910, "lng": -5.9950},
+        {"id": "d", "lat": 37.3915, "lng": -5.9950},
+        {"id": "e", "lat": 37.3915, "lng": -5.9940},
+        {"id": "f", "lat": 37.3920, "lng": -5.9950},
+    ]
+    coords = {node["id"]: [node["lat"], node["lng"]] for node in nodes}
+    pairs = [("a", "b", 55.0), ("b", "c", 56.0), ("c", "d", 57.0), ("d", "e", 90.0), ("d", "f", 55.0)]
+    edges = []
+    for source, target, length in pairs:
+        directions = [(source, target)] if oneway else [(source, target), (target, source)]
+        for u, v in directions:
+            edges.append(
+                {
+                    "id": f"{u}{v}",
+                    "source_node": u,
+                    "target_node": v,
+                    "geometry": [coords[u], coords[v]],
+                    "length_m": length,
+                    "width_estimate": 4.0 if "c" in (u, v) else 5.0,
+                    "highway_type": "residential",
+                    "tags": {},
+                }
+            )
+    return nodes, edges
+
+
+def test_collapse_chains_merges_shape_nodes_both_ways():
+    nodes, edges = _chain_dataset(oneway=False)
+    kept_nodes, kept_edges = collapse_chains(nodes, edges)
+
+    assert {node["id"] for node in kept_nodes} == {"a", "d", "e", "f"}
+    merged = {edge["id"]: edge for edge in kept_edges}
+    assert set(merged) == {"ab", "dc", "de", "ed", "df", "fd"}
+    forward, backward = merged["ab"], merged["dc"]
+    assert (forward["source_node"], forward["target_node"]) == ("a", "d")
+    assert (backward["source_node"], backward["target_node"]) == ("d", "a")
+    assert forward["length_m"] == backward["length_m"] == 168.0
+    assert forward["width_estimate"] == 4.0
+    assert len(forward["geometry"]) == 4
+    assert forward["tags"]["collapsed_nodes"] == [["b", 37.3905, -5.995, 55.0], ["c", 37.391, -5.995, 111.0]]
+
+
+def test_collapse_chains_follows_oneway_streets():
+    nodes, edges = _chain_dataset(oneway=True)
+    kept_nodes, kept_edges = collapse_chains(nodes, edges)
+
+    assert {node["id"] for node in kept_nodes} == {"a", "d", "e", "f"}
+    merged = kept_edges[-1]
+    assert (merged["source_node"], merged["target_node"]) == ("a", "d")
+    assert [item[0] for item in merged["tags"]["collapsed_nodes"]] == ["b", "c"]
+    assert len(kept_edges) == 3
+
+
+def test_collapsed_import_keeps_geometry_and_snaps_to_chain_ends(db, tmp_path):
+    nodes, edges = _chain_dataset(oneway=False)
+    dataset = tmp_path / "chain.json"
+    dataset.write_text(json.dumps({"nodes": nodes, "edges": edges}))
+
+    import_graph(db, dataset, collapse=True)
+
+    graph = get_street_graph(db)
+    assert graph.node_count == 4 and graph.edge_count == 6
+    assert len(graph.edge_polyline(graph.edge_index["ab"])) == 4
+    # b is closer to a, c closer to d (by offset along the chain)
+    assert graph.node_ids[graph.snap(37.3905, -5.9950)] == "a"
+    assert graph.node_ids[graph.snap(37.3910, -5.9950)] == "d"
+    assert graph.node_ids[graph.snap(37.3916, -5.9940)] == "e"
+
+
+def test_incremental_import_reloads_when_collapsed_snap_points_change(db, tmp_path):
+    nodes, edges = collapse_chains(*_chain_dataset(oneway=False))
+    dataset = tmp_path / "chain.json"
+    dataset.write_text(json.dumps({"nodes": nodes, "edges": edges}))
+    import_graph(db, dataset)
+    assert get_street_graph(db).node_ids[get_street_graph(db).snap(37.3910, -5.9950)] == "d"
+
+    # only the tags change: c now sits next to a along the chain
+    for edge in edges:
+        for item in edge["tags"].get("collapsed_nodes", []):
+            if item[0] == "c":
+                item[3] = 20.0
+    dataset.write_text(json.dumps({"nodes": nodes, "edges": edges}))
+    summary = import_graph(db, dataset, incremental=True)
+    assert summary["graph"] == "invalidated"
+    assert summary["changes"]["edges_reshaped"] == 2
+    graph = get_street_graph(db)
+    assert graph.node_ids[graph.snap(37.3910, -5.9950)] == "a"
+
+    edges[0]["tags"]["name"] = "Calle Feria"
+    dataset.write_text(json.dumps({"nodes": nodes, "edges": edges}))
+    assert import_graph(db, dataset, incremental=True)["graph"] == "unchanged"
+    assert get_street_graph(db) is graph
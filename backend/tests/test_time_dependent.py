@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core.config import settings
+from app.core.routing import calculate_optimal_route
+from app.core.time_dependent import PenaltyProfile
+from app.models.models import RouteRestriction, StreetEdge, StreetNode
+
+WHEN = datetime(2026, 4, 9, 21, 0)
+# a -> m is a 1000 m approach (781 s); from m, md goes straight to d (100 m) and mxd detours (2 x 300 m)
+NODES = {"a": (37.3800, -5.9900), "m": (37.3890, -5.9900), "d": (37.3899, -5.9900), "x": (37.3895, -5.9930)}
+EDGES = (("am", "a", "m", 1000.0), ("md", "m", "d", 100.0), ("mx", "m", "x", 300.0), ("xd", "x", "d", 300.0))
+
+
+@pytest.fixture
+def time_dependent():
+    settings.ROUTING_TIME_DEPENDENT = True
+    yield
+    settings.ROUTING_TIME_DEPENDENT = False
+
+
+def _seed(db, *restrictions):
+    for node_id, (lat, lng) in NODES.items():
+        db.add(StreetNode(id=node_id, geom=f"POINT({lng} {lat})"))
+    for edge_id, source, target, length in EDGES:
+        (lat0, lng0), (lat1, lng1) = NODES[source], NODES[target]
+        db.add(
+            StreetEdge(
+                id=edge_id,
+                source_node=source,
+                target_node=target,
+                geom=f"LINESTRING({lng0} {lat0}, {lng1} {lat1})",
+                length_m=length,
+            )
+        )
+    for index, (start_minutes, end_minutes) in enumerate(restrictions):
+        db.add(
+            RouteRestriction(
+                id=f"r{index}",
+                edge_id="md",
+                starts_at=WHEN + timedelta(minutes=start_minutes),
+                ends_at=WHEN + timedelta(minutes=end_minutes),
+                reason="paso de cortejo",
+                severity=2000,
+            )
+        )
+    db.commit()
+
+
+def _route(db):
+    return calculate_optimal_route(
+        db,
+        origin=list(NODES["a"]),
+        destination=list(NODES["d"]),
+        route_datetime=WHEN,
+        target_type=None,
+        target_id=None,
+        avoid_bulla=False,
+    )
+
+
+def _via_detour(result) -> bool:
+    return [round(NODES["x"][0], 7), round(NODES["x"][1], 7)] in result.polyline
+
+
+def test_waiting_makes_profiles_fifo():
+    # closed (2000 s) for the first 10 minutes, then free
+    profile = PenaltyProfile.from_pieces([0.0, 600.0], [2000.0, 0.0])
+    assert profile.penalty(0.0) == 600.0 and profile.wait(0.0) == 600.0
+    assert profile.penalty(590.0) == pytest.approx(10.0)
+    assert profile.penalty(700.0) == 0.0 and profile.wait(700.0) == 0.0
+    arrivals = [t + profile.penalty(t) for t in range(0, 1200, 5)]
+    assert arrivals == sorted(arrivals)
+
+
+def test_procession_starting_after_departure_is_avoided_only_when_time_dependent(db, time_dependent):
+    # md closes 10 minutes after departure, before the walker gets there (13 min)
+    _seed(db, (10, 60))
+
+    timed = _route(db)
+    assert _via_detour(timed)
+    assert timed.eta_seconds == int(1600 / 1.28)
+
+    settings.ROUTING_TIME_DEPENDENT = False
+    static = _route(db)
+    assert not _via_detour(static)
+    assert static.eta_seconds == int(1100 / 1.28)
+
+
+def test_restriction_cleared_on_arrival_is_walked_through(db, time_dependent):
+    # md is closed at departure but reopens at 21:05, well before the walker reaches it
+    _seed(db, (-10, 5))
+
+    timed = _route(db)
+    assert not _via_detour(timed)
+    assert timed.eta_seconds == int(1100 / 1.28)
+
+    settings.ROUTING_TIME_DEPENDENT = False
+    assert _via_detour(_route(db))
+
+
+def test_walker_waits_for_a_short_pass(db, time_dependent):
+    # md closes 21:10-21:16: waiting at m (~3 min) beats the 469 s detour
+    _seed(db, (10, 16))
+
+    timed = _route(db)
+    assert not _via_detour(timed)
+    assert timed.eta_seconds == pytest.approx(16 * 60 + 100 / 1.28, abs=1)
+    assert any("espera" in line for line in timed.explanation)
+    assert any("dependiente del tiempo" in line for line in timed.explanation)
@@ -0,0 +1,114 @@
+import asyncio
+import threading
+import time
+from datetime import datetime
+
+from app.api.endpoints import routing as routing_endpoints
+from app.core.config import settings
+from app.core.deps import get_db
+from app.core.location_updates import LatestLocation, WsMetrics, ws_metrics
+from app.core.routing import RoutingResult
+from app.main import app
+from tests.conftest import TestingSessionLocal, auth_header, make_admin_user, make_user
+
+
+def _update(lng: float) -> dict:
+    return {
+        "type": "location_update",
+        "location": {"lat": 37.3862, "lng": lng},
+        "datetime": datetime(2026, 4, 10, 22, 15).isoformat(),
+        "target": {"type": "event", "id": "macarena"},
+        "constraints": {"avoid_bulla": False, "max_walk_km": 2},
+    }
+
+
+def test_slot_keeps_only_the_latest_update():
+    metrics = WsMetrics()
+
+    async def scenario():
+        latest = LatestLocation(metrics)
+        for item in ("a", "b", "c"):
+            latest.put(item)
+        assert metrics.stats()["pending"] == 1
+        await asyncio.wait_for(latest.wait(), 1)
+        return latest.take()
+
+    assert asyncio.run(scenario()) == "c"
+    stats = metrics.stats()
+    assert (stats["received"], stats["coalesced"], stats["pending"]) == (3, 2, 0)
+
+
+def test_burst_while_computing_is_coalesced_into_the_latest(client, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+    origins = []
+
+    def slow_route(db, session, *, origin, **kwargs):
+        origins.append(origin)
+        started.set()
+        release.wait(5)
+        return RoutingResult(
+            polyline=[origin, origin],
+            eta_seconds=600 + 60 * len(origins),
+            bulla_score=0.0,
+            warnings=[],
+            explanation=[],
+            alternatives=[],
+        )
+
+    monkeypatch.setattr(routing_endpoints, "update_route_session", slow_route)
+    monkeypatch.setattr(settings, "WS_MIN_RECOMPUTE_SECONDS", 0.0)
+    before = ws_metrics.stats()
+    with client.websocket_connect("/api/v1/routing/ws/mode-calle?plan_id=plan-burst") as ws:
+        ws.receive_json()  # hello
+        ws.send_json(_update(-5.9900))
+        assert started.wait(5)
+        for lng in (-5.9901, -5.9902, -5.9903, -5.9904):
+            ws.send_json(_update(lng))
+        # the heartbeat reply proves the receiver has stored every update before it
+        ws.send_json({"type": "heartbeat", "sent_at": datetime.utcnow().isoformat()})
+        assert ws.receive_json()["type"] == "heartbeat"
+        release.set()
+        assert ws.receive_json()["type"] == "route_update"
+        assert ws.receive_json()["type"] == "route_update"
+
+    assert [origin[1] for origin in origins] == [-5.9900, -5.9904]
+    after = ws_metrics.stats()
+    assert after["received"] - before["received"] == 5
+    assert after["coalesced"] - before["coalesced"] == 3
+
+
+def test_disconnect_waits_for_the_computation_before_closing_the_session(client, monkeypatch):
+    started = threading.Event()
+    closed = threading.Event()
+    seen = []
+
+    def tracked_get_db():
+        db = TestingSessionLocal()
+        try:
+            yield db
+        finally:
+            closed.set()
+            db.close()
+
+    def slow_route(db, session, *, origin, **kwargs):
+        started.set()
+        time.sleep(0.3)
+        seen.append(closed.is_set())
+        raise RuntimeError("routing failed after the disconnect")
+
+    monkeypatch.setattr(routing_endpoints, "update_route_session", slow_route)
+    monkeypatch.setitem(app.dependency_overrides, get_db, tracked_get_db)
+    with client.websocket_connect("/api/v1/routing/ws/mode-calle?plan_id=plan-gone") as ws:
+        ws.receive_json()  # hello
+        ws.send_json(_update(-5.9900))
+        assert started.wait(5)
+    assert closed.wait(5)
+    assert seen == [False]
+
+
+def test_admin_reports_ws_queue_metrics(client, db):
+    user, admin = make_user(db), make_admin_user(db)
+    assert client.get("/api/v1/admin/routing/ws", headers=auth_header(user.id)).status_code == 403
+    res = client.get("/api/v1/admin/routing/ws", headers=auth_header(admin.id))
+    assert res.status_code == 200
+    assert {"connections", "pending", "computing", "coalesced", "throttled", "pool_in_flight"} <= res.json().keys()